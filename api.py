@@ -0,0 +1,291 @@
+import gzip
+import hashlib
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, url_for
+
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from queries import keyset_page
+from routing import read_only
+from timeline import shows_calendar, calendar_args
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Versioned JSON API.
+#
+# Every resource is read with a column-only select limited to the requested
+# ?fields=. The ETag is derived from the row versions (and genre names,
+# which live in association tables), so a matching If-None-Match answers
+# 304 before anything is serialized.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+COMPRESS_MIN_SIZE = 500
+
+VENUES = {
+    'model': Venue,
+    'fields': {
+        'id': Venue.id,
+        'name': Venue.name,
+        'city': Venue.city,
+        'state': Venue.state,
+        'address': Venue.address,
+        'latitude': Venue.latitude,
+        'longitude': Venue.longitude,
+        'phone': Venue.phone,
+        'genres': None,
+        'image_link': Venue.image_link,
+        'facebook_link': Venue.facebook_link,
+        'website_link': Venue.website_link,
+        'seeking_talent': Venue.seeking_talent,
+        'seeking_description': Venue.seeking_description,
+    },
+    'sort': (Venue.name, Venue.id),
+    'versions': (Venue.version,),
+    'joins': (),
+    'filters': (Venue.deleted_at.is_(None),),
+    'genres': venue_genres.c.venue_id,
+}
+
+ARTISTS = {
+    'model': Artist,
+    'fields': {
+        'id': Artist.id,
+        'name': Artist.name,
+        'city': Artist.city,
+        'state': Artist.state,
+        'phone': Artist.phone,
+        'genres': None,
+        'image_link': Artist.image_link,
+        'facebook_link': Artist.facebook_link,
+        'website': Artist.website,
+        'seeking_venue': Artist.seeking_venue,
+        'seeking_description': Artist.seeking_description,
+    },
+    'sort': (Artist.name, Artist.id),
+    'versions': (Artist.version,),
+    'joins': (),
+    'filters': (Artist.deleted_at.is_(None),),
+    'genres': artist_genres.c.artist_id,
+}
+
+SHOWS = {
+    'model': Show,
+    'fields': {
+        'id': Show.id,
+        'start_time': Show.start_time,
+        'end_time': Show.end_time,
+        'venue_id': Show.venue_id,
+        'venue_name': Venue.name,
+        'artist_id': Show.artist_id,
+        'artist_name': Artist.name,
+        'artist_image_link': Artist.image_link,
+    },
+    'sort': (Show.start_time, Show.id),
+    'versions': (Show.version, Venue.version, Artist.version),
+    'joins': ((Venue, Venue.id == Show.venue_id), (Artist, Artist.id == Show.artist_id)),
+    'filters': (Venue.deleted_at.is_(None), Artist.deleted_at.is_(None)),
+    'genres': None,
+}
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def requested_fields(resource):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(resource['fields'])
+    fields = list(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in resource['fields']]
+    if unknown:
+        abort(400, 'Unknown fields: %s' % ', '.join(unknown))
+    return fields
+
+
+def resource_query(resource, fields):
+    # The sort keys are always selected so the page cursor can be built.
+    selected = list(fields)
+    for key in resource['sort']:
+        if key.key not in selected:
+            selected.append(key.key)
+    columns = [resource['fields'][name].label(name) for name in selected if name != 'genres']
+    columns += [version.label('row_version_%d' % index) for index, version in enumerate(resource['versions'])]
+    query = db.session.query(*columns).select_from(resource['model'])
+    for target, onclause in resource['joins']:
+        query = query.join(target, onclause)
+    return query.filter(*resource['filters'])
+
+
+def genres_for(resource, ids):
+    owner = resource['genres']
+    rows = db.session.query(owner, Genre.name).select_from(owner.table).join(
+        Genre, Genre.id == owner.table.c.genre_id
+    ).filter(owner.in_(ids)).order_by(owner, Genre.name)
+    genres = {}
+    for owner_id, name in rows:
+        genres.setdefault(owner_id, []).append(name)
+    return genres
+
+
+def fetch(resource, fields, rows):
+    # Returns the ETag and a builder for the payload rows.
+    genres = {}
+    if 'genres' in fields and rows:
+        genres = genres_for(resource, [row.id for row in rows])
+    versions = [
+        (row.id,) + tuple(row._mapping['row_version_%d' % index] for index in range(len(resource['versions'])))
+        + tuple(genres.get(row.id, ()))
+        for row in rows
+    ]
+    etag = hashlib.sha1(repr((request.path, request.query_string, versions)).encode('utf-8')).hexdigest()
+
+    def build():
+        data = []
+        for row in rows:
+            item = {}
+            for field in fields:
+                item[field] = genres.get(row.id, []) if field == 'genres' else row._mapping[field]
+            data.append(item)
+        return data
+    return etag, build
+
+
+def conditional(etag, build):
+    # If-None-Match compares weakly: a proxy may hand the tag back as W/"...".
+    if any(request.if_none_match.contains_weak(tag) for tag in (etag, etag + '-gzip', etag + '-br')):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    response = Response(dumps(build()), mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+def listing(resource):
+    fields = requested_fields(resource)
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    try:
+        rows, after = keyset_page(
+            resource_query(resource, fields), resource['sort'], request.args.get('after'), limit
+        )
+    except ValueError:
+        abort(400, 'Invalid cursor')
+    etag, build = fetch(resource, fields, rows)
+    next_url = None
+    if after:
+        next_url = url_for(request.endpoint, after=after, limit=limit, fields=request.args.get('fields'))
+    return conditional(etag, lambda: {'data': build(), 'next': next_url})
+
+
+def detail(resource, id):
+    fields = requested_fields(resource)
+    rows = resource_query(resource, fields).filter(resource['fields']['id'] == id).all()
+    if not rows:
+        abort(404)
+    etag, build = fetch(resource, fields, rows)
+    return conditional(etag, lambda: {'data': build()[0]})
+
+
+@api.route('/venues')
+@read_only
+def list_venues():
+    return listing(VENUES)
+
+
+@api.route('/venues/<int:venue_id>')
+@read_only
+def get_venue(venue_id):
+    return detail(VENUES, venue_id)
+
+
+@api.route('/artists')
+@read_only
+def list_artists():
+    return listing(ARTISTS)
+
+
+@api.route('/artists/<int:artist_id>')
+@read_only
+def get_artist(artist_id):
+    return detail(ARTISTS, artist_id)
+
+
+@api.route('/shows')
+@read_only
+def list_shows():
+    return listing(SHOWS)
+
+
+@api.route('/shows/calendar')
+@read_only
+def shows_calendar_counts():
+    try:
+        args = calendar_args(request.args, current_app.config['CALENDAR_MAX_BUCKETS'])
+    except ValueError as e:
+        abort(400, str(e))
+    buckets = shows_calendar(**args)
+    data = {
+        'bucket': args['bucket'],
+        'from': buckets[0][0],
+        'to': buckets[-1][1],
+        'buckets': [{'start': start, 'end': end, 'shows': count} for start, end, count in buckets],
+    }
+    etag = hashlib.sha1(dumps(data)).hexdigest()
+    return conditional(etag, lambda: {'data': data})
+
+
+@api.route('/shows/<int:show_id>')
+@read_only
+def get_show(show_id):
+    return detail(SHOWS, show_id)
+
+
+@api.after_request
+def compress(response):
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or response.direct_passthrough or response.content_encoding:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    if brotli is not None and request.accept_encodings['br']:
+        data, encoding = brotli.compress(data), 'br'
+    elif request.accept_encodings['gzip']:
+        data, encoding = gzip.compress(data, 6), 'gzip'
+    else:
+        return response
+    response.set_data(data)
+    response.content_encoding = encoding
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag('%s-%s' % (etag, encoding))
+    return response
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({'error': error.description}), error.code
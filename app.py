@@ -5,17 +5,32 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+import babel.dates
+from functools import lru_cache
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
-from config import SQLALCHEMY_DATABASE_URI
 from flask_migrate import Migrate
 from forms import *
-from datetime import datetime
-from models import db, Venue, Artist, Show
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres, booking_conflict, naive_utc, now_utc
+from api import api
+from importer import importer, import_command
+from exporter import exporter, export_command
+from cache import cache
+from assets import assets, assets_command
+from counters import counters_command, record_shows, drop_owner
+from jobs import jobs, worker_command
+from geo import geocode_command, distance_miles
+from timeline import shows_calendar, calendar_args
+from profiling import profiler
+from routing import read_only
+from queries import venue_areas, artists_page, shows_page, search, venue_shows, artist_shows, venue_detail, artist_detail, bookings_query, free_slots, nearby_venues, nearby_shows_query, DETAIL_SHOWS_LIMIT
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -24,10 +39,20 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 db.init_app(app)
+cache.init_app(app)
+assets.init_app(app)
+profiler.init_app(app)
+jobs.init_app(app)
 migrate = Migrate(app, db)
-
-# TODO: connect to a local postgresql database
-app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
+app.register_blueprint(api)
+app.register_blueprint(importer)
+app.cli.add_command(import_command)
+app.register_blueprint(exporter)
+app.cli.add_command(export_command)
+app.cli.add_command(counters_command)
+app.cli.add_command(worker_command)
+app.cli.add_command(geocode_command)
+app.cli.add_command(assets_command)
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
@@ -40,13 +65,40 @@ app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+NAMED_FORMATS = ('full', 'long', 'medium', 'short')
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # formatting function for a format name or pattern, resolved once per
+  # (format, locale) the way babel.dates.format_datetime resolves it
+  locale = babel.Locale.parse(locale)
+  format = DATETIME_FORMATS.get(format, format)
+  if format in NAMED_FORMATS:
+    combined = babel.dates.get_datetime_format(format, locale).replace("'", "")
+    date = babel.dates.get_date_format(format, locale)
+    time = babel.dates.get_time_format(format, locale)
+    return lambda value: combined.replace('{0}', time.apply(value, locale)).replace('{1}', date.apply(value, locale))
+  pattern = babel.dates.parse_pattern(format)
+  return lambda value: pattern.apply(value, locale)
+
+@lru_cache(maxsize=4096)
+def format_datetime_cached(value, tzinfo, tzname, format, locale):
+  # keyed on the zone too: aware datetimes naming the same instant compare
+  # equal but do not format alike
+  if value.tzinfo is None:
+    # as in babel.dates.format_datetime, naive values are UTC
+    value = value.replace(tzinfo=babel.dates.UTC)
+  return datetime_pattern(format, locale)(value)
+
+def format_datetime(value, format='medium', locale='en'):
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  return format_datetime_cached(value, value.tzinfo, value.tzname(), format, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -54,6 +106,99 @@ app.jinja_env.filters['datetime'] = format_datetime
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def shows_next(offset, count, endpoint, **values):
+  # url of the next "load more shows" page, or None on the last page
+  offset = offset + DETAIL_SHOWS_LIMIT
+  if offset >= count:
+    return None
+  return url_for(endpoint, offset=offset, **values)
+
+def found_or_404(read_model):
+  if read_model is None:
+    abort(404)
+  return read_model
+
+def delete_listing(model, id, show_column, genre_column, soft):
+  # A constant number of set-based statements however many shows the row
+  # has. The row is locked first, so a show booked at the same time is
+  # either refused or committed and uncounted below (see unlisted_owner).
+  # Either way its shows are uncounted from the counterparts' upcoming
+  # show counters; a soft delete then marks the row and bumps its
+  # version, so an edit loaded before the delete fails to commit, while a
+  # hard delete removes its shows and genre links before the row itself.
+  # Returns False if nothing matched.
+  row = db.session.query(model.id).filter(model.id == id)
+  if soft:
+    row = row.filter(model.deleted_at.is_(None))
+  if row.with_for_update().scalar() is None:
+    return False
+  drop_owner(model, id)
+  if soft:
+    model.query.filter_by(id=id).update(
+      {'deleted_at': now_utc(), 'version': model.version + 1}, synchronize_session=False
+    )
+    return True
+  Show.query.filter(show_column == id).delete(synchronize_session=False)
+  db.session.execute(genre_column.table.delete().where(genre_column == id))
+  model.query.filter_by(id=id).delete(synchronize_session=False)
+  return True
+
+def unlisted_owner(venue_id, artist_id):
+  # 'venue' or 'artist' when the show being booked names one that is
+  # missing or soft-deleted. The rows found are share-locked until the
+  # booking commits, so neither can be deleted under it.
+  for name, model, id in (('venue', Venue, venue_id), ('artist', Artist, artist_id)):
+    if db.session.query(model.id).filter_by(id=id, deleted_at=None).with_for_update(read=True).scalar() is None:
+      return name
+  return None
+
+def soft_delete_requested():
+  return request.args.get('soft', app.config['SOFT_DELETE'], type=lambda value: value.lower() in ('1', 'true', 'yes', 'on'))
+
+def datetime_arg(name, default):
+  # ISO datetime query argument, naive UTC if it names a zone; a
+  # malformed one is a 400
+  value = request.args.get(name)
+  if not value:
+    return default
+  try:
+    return naive_utc(datetime.fromisoformat(value))
+  except ValueError:
+    abort(400)
+
+def window_args():
+  # ?from= and ?to=, the coming week by default, at most AVAILABILITY_MAX_DAYS apart
+  start = datetime_arg('from', now_utc().replace(second=0, microsecond=0))
+  end = datetime_arg('to', start + timedelta(days=7))
+  if end <= start or end - start > timedelta(days=app.config['AVAILABILITY_MAX_DAYS']):
+    abort(400)
+  return start, end
+
+def point_args():
+  # ?lat=, ?lng= and ?radius= in miles, the radius clamped to NEARBY_MAX_MILES;
+  # missing, malformed or out of range is a 400
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  miles = request.args.get('radius', str(app.config['NEARBY_DEFAULT_MILES']))
+  if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    abort(400)
+  try:
+    miles = float(miles)
+  except ValueError:
+    abort(400)
+  if not 0 < miles:
+    abort(400)
+  return latitude, longitude, min(miles, float(app.config['NEARBY_MAX_MILES']))
+
+def show_end_time(start_time, end_time=None):
+  # the submitted end, or the default show length after the start
+  if not end_time:
+    return start_time + timedelta(minutes=app.config['SHOW_DEFAULT_MINUTES'])
+  end_time = naive_utc(dateutil.parser.parse(end_time))
+  if end_time <= start_time:
+    raise ValueError('a show must end after it starts')
+  return end_time
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -63,98 +208,102 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached('venues')
+@read_only
 def venues():
-  # TODO: replace with real venues data.
-  #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  venues = Venue.query.all()
-  now = datetime.now()
-  cities = []
-  data = []
-  for venue in venues:
-    venue_data ={}
-    venue_details={}
-    if venue.city not in cities:
-       venue_data['city'] = venue.city
-       venue_data['state'] = venue.state
-       venue_data['venues'] = []
-       venue_details['id'] = venue.id
-       venue_details['name'] = venue.name
-       venue_details['num_upcoming_shows'] = Show.query.filter(Show.venue_id==venue.id, Show.start_time > now ).count()
-       venue_data['venues'].append(venue_details)
-       data.append(venue_data)
-       cities.append(venue.city)
-    else:
-      venue_details['id'] = venue.id
-      venue_details['name'] = venue.name
-      venue_details['num_upcoming_shows'] = Show.query.filter(Show.venue_id==venue.id, Show.start_time > now ).count()
-      index = cities.index(venue.city)
-      data[index]['venues'].append(venue_details)
-  
-  return render_template('pages/venues.html', areas=data)
+  genre = request.args.get('genre')
+  state = request.args.get('state')
+  try:
+    data, after = venue_areas(genre=genre, state=state, after=request.args.get('after'))
+  except ValueError:
+    abort(400)
+  next_url = url_for('venues', genre=genre, state=state, after=after) if after else None
+  return render_template('pages/venues.html', areas=data, next_url=next_url)
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-
   search_term=request.form.get('search_term', '')
-  venues= Venue.query.filter(Venue.name.ilike('%'+search_term+'%'))
-  data =[]
-  now = datetime.now()
-  for venue in venues:
-    venue_details ={}
-    venue_details['id'] = venue.id 
-    venue_details['name'] = venue.name
-    venue_details['num_upcoming_shows'] = Show.query.filter(Show.venue_id==venue.id, Show.start_time > now ).count()
-    data.append(venue_details)
-  response={
-    "count": venues.count(),
-    "data": data
-  }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  page = max(request.form.get('page', 1, type=int), 1)
+  response = search(Venue, search_term, page)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@cache.cached('venue', 'venue:{venue_id}')
+@read_only
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  shows = Show.query.join(
-    Venue
-  ).join(
-      Artist, 
-    ).filter(Artist.id == Show.artist_id).filter(venue_id== Show.venue_id).with_entities(Show.artist_id, Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'), Show.start_time)
- 
-  now = datetime.now()
-  venue_data = {}
-  venue_data = venue.__dict__
-  venue_data['genres'] = venue_data['genres'].split(",")
-  venue_data['upcoming_shows'] =[]
-  venue_data['past_shows'] = []
-  past_shows_count =0
-  upcoming_shows_count = 0
-  for show in shows:
-    showdata ={}
-    if show.start_time>now:
-        showdata['artist_id'] = show.artist_id
-        showdata['artist_name'] = show.artist_name
-        showdata['artist_image_link'] = show.artist_image_link
-        showdata['start_time'] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        venue_data['upcoming_shows'].append(showdata)
-        upcoming_shows_count = upcoming_shows_count +1
-    else:
-        showdata['artist_id'] = show.artist_id
-        showdata['artist_name'] = show.artist_name
-        showdata['artist_image_link'] = show.artist_image_link
-        showdata['start_time'] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        venue_data['past_shows'].append(showdata)
-        past_shows_count = past_shows_count +1
-
-
-    venue_data['past_shows_count'] = past_shows_count
-    venue_data['upcoming_shows_count'] =upcoming_shows_count
-
-  return render_template('pages/show_venue.html', venue=venue_data)
+  venue = found_or_404(venue_detail(venue_id))
+  now = now_utc()
+  venue.upcoming_shows, venue.upcoming_shows_count = venue_shows(venue_id, now, upcoming=True)
+  venue.past_shows, venue.past_shows_count = venue_shows(venue_id, now, upcoming=False)
+  venue.upcoming_shows_next = shows_next(0, venue.upcoming_shows_count, 'venue_upcoming_shows', venue_id=venue_id)
+  venue.past_shows_next = shows_next(0, venue.past_shows_count, 'venue_past_shows', venue_id=venue_id)
+
+  return render_template('pages/show_venue.html', venue=venue)
+
+@app.route('/venues/<int:venue_id>/past_shows')
+@cache.cached('venue', 'venue:{venue_id}')
+@read_only
+def venue_past_shows(venue_id):
+  # next page of past shows for the "load more" button on the venue page
+  offset = max(request.args.get('offset', 0, type=int), 0)
+  shows, count = venue_shows(venue_id, now_utc(), upcoming=False, offset=offset)
+  return render_template('pages/venue_shows.html', shows=shows, when='past',
+    next_url=shows_next(offset, count, 'venue_past_shows', venue_id=venue_id))
+
+@app.route('/venues/<int:venue_id>/upcoming_shows')
+@cache.cached('venue', 'venue:{venue_id}')
+@read_only
+def venue_upcoming_shows(venue_id):
+  # next page of upcoming shows for the "load more" button on the venue page
+  offset = max(request.args.get('offset', 0, type=int), 0)
+  shows, count = venue_shows(venue_id, now_utc(), upcoming=True, offset=offset)
+  return render_template('pages/venue_shows.html', shows=shows, when='upcoming',
+    next_url=shows_next(offset, count, 'venue_upcoming_shows', venue_id=venue_id))
+
+@app.route('/venues/<int:venue_id>/availability')
+@read_only
+def venue_availability(venue_id):
+  # free slots between ?from= and ?to= (ISO datetimes), from one index
+  # range scan over the venue's bookings
+  start, end = window_args()
+  found_or_404(venue_detail(venue_id, genres=False))
+  bookings = bookings_query(Show.venue_id, venue_id, start, end).all()
+  return jsonify({
+    'venue_id': venue_id,
+    'from': start.isoformat(),
+    'to': end.isoformat(),
+    'booked': [{
+      'show_id': booking.id,
+      'artist_id': booking.artist_id,
+      'start_time': booking.start_time.isoformat(),
+      'end_time': booking.end_time.isoformat(),
+    } for booking in bookings],
+    'free': [{'start': free_from.isoformat(), 'end': free_until.isoformat()} for free_from, free_until in free_slots(bookings, start, end)],
+  })
+
+@app.route('/venues/nearby')
+@read_only
+def nearby_venues_search():
+  # the venues within ?radius= miles of ?lat=,?lng=, nearest first
+  latitude, longitude, miles = point_args()
+  return jsonify({
+    'lat': latitude,
+    'lng': longitude,
+    'radius': miles,
+    'venues': [{
+      'id': venue.id,
+      'name': venue.name,
+      'city': venue.city,
+      'state': venue.state,
+      'address': venue.address,
+      'latitude': venue.latitude,
+      'longitude': venue.longitude,
+      'distance': round(distance_miles(latitude, longitude, venue.latitude, venue.longitude), 2),
+      'num_upcoming_shows': venue.num_upcoming_shows,
+    } for venue in nearby_venues(latitude, longitude, miles)],
+  })
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -178,17 +327,20 @@ def create_venue_submission():
     venue.city =request.form['city']
     venue.address = request.form['address']
     venue.phone = request.form['phone'].strip()
-    venue.genres = (',').join(request.form.getlist('genres'))
+    venue.genres = Genre.from_names(request.form.getlist('genres'))
     venue.facebook_link = request.form['facebook_link']
     venue.image_link = request.form['image_link']
     venue.website_link = request.form['website_link']
     venue.seeking_talent =True if request.form.get('seeking_talent') =='y' or request.form.get('seeking_talent')=='t' else False
     venue.seeking_description = request.form['seeking_description']
     db.session.add(venue)
+    db.session.flush()
+    jobs.enqueue('check_links', kind='venue', id=venue.id)
     db.session.commit()
+    cache.invalidate('venues')
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  except Exception as e:
-    print(e)
+  except Exception:
+    app.logger.exception('could not create venue %r', request.form.get('name'))
     db.session.rollback()
     error = True
     flash('An error occurred. Venue ' +  request.form['name']+ ' could not be listed.')
@@ -207,26 +359,26 @@ def create_venue_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+  # Deletes the venue and its shows, or only marks it deleted when
+  # SOFT_DELETE / ?soft=1 is set. Handle cases where the session commit could fail.
   error = False
+  found = True
   try:
-    venue = Venue.query.get(venue_id)
-    shows = Show.query.filter_by(venue_id=venue.id).all()
-    for show in shows:
-        db.session.delete(show)
-
-    db.session.delete(venue)
+    found = delete_listing(Venue, venue_id, Show.venue_id, venue_genres.c.venue_id, soft_delete_requested())
     db.session.commit()
-  except:
+    cache.invalidate('venues', 'venue:%s' % venue_id, 'shows', 'artist')
+  except Exception:
+    app.logger.exception('could not delete venue %s', venue_id)
     db.session.rollback()
     error = True
   finally: 
     db.session.close()
   if error:
     abort(500)
+  elif not found:
+    abort(404)
   else:
     return render_template('pages/home.html')
 
@@ -237,95 +389,87 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.cached('artists')
+@read_only
 def artists():
-  # TODO: replace with real data returned from querying the database
-  artists = Artist.query.all()
-  data =[]
-  for artist in artists:
-    data.append({'id':artist.id, 'name': artist.name})
-#   data=[{
-#     "id": 4,
-#     "name": "Guns N Petals",
-#   }, {
-#     "id": 5,
-#     "name": "Matt Quevedo",
-#   }, {
-#     "id": 6,
-#     "name": "The Wild Sax Band",
-#   }]
-  return render_template('pages/artists.html', artists=data)
+  try:
+    data, after = artists_page(after=request.args.get('after'))
+  except ValueError:
+    abort(400)
+  next_url = url_for('artists', after=after) if after else None
+  return render_template('pages/artists.html', artists=data, next_url=next_url)
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
   search_term=request.form.get('search_term', '')
-  artists= Artist.query.filter(Artist.name.ilike('%'+search_term+'%'))
-  data =[]
-  now = datetime.now()
-  for artist in artists:
-    artist_details ={}
-    artist_details['id'] = artist.id 
-    artist_details['name'] = artist.name
-    artist_details['num_upcoming_shows'] = Show.query.filter(Show.artist_id==artist.id, Show.start_time > now ).count()
-    data.append(artist_details)
-  response={
-    "count": artists.count(),
-    "data": data
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  page = max(request.form.get('page', 1, type=int), 1)
+  response = search(Artist, search_term, page)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@cache.cached('artist', 'artist:{artist_id}')
+@read_only
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-
-  artist = Artist.query.get(artist_id)
-  shows = Show.query.join(
-    Venue
-  ).join(
-      Artist, 
-    ).filter(Venue.id == Show.venue_id).filter(artist_id== Show.artist_id).with_entities(Show.venue_id, Venue.name.label('venue_name'),Venue.image_link.label('venue_image_link'), Show.start_time)
- 
-  now = datetime.now()
-  artist_data = {}
-  artist_data = artist.__dict__
-  artist_data['genres'] = artist_data['genres'].split(",")
-  artist_data['upcoming_shows'] =[]
-  artist_data['past_shows']=[]
-  past_shows_count =0
-  upcoming_shows_count = 0
-  for show in shows:
-    showdata ={}
-    if show.start_time>now:
-        showdata['venue_id'] = show.venue_id
-        showdata['venue_name'] = shows.venue_name
-        showdata['venue_image_link'] = shows.venue_image_link
-        showdata['start_time'] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        artist_data['upcoming_shows'].append(showdata)
-        upcoming_shows_count = upcoming_shows_count +1
-    else:
-        showdata['venue_id'] = show.venue_id
-        showdata['venue_name'] = show.venue_name
-        showdata['venue_image_link'] = show.venue_image_link
-        showdata['start_time'] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        artist_data['past_shows'].append(showdata)
-        past_shows_count = past_shows_count +1
-
-
-    artist_data['past_shows_count'] = past_shows_count
-    artist_data['upcoming_shows_count'] =upcoming_shows_count
-
-  return render_template('pages/show_artist.html', artist=artist_data)
+  artist = found_or_404(artist_detail(artist_id))
+  now = now_utc()
+  artist.upcoming_shows, artist.upcoming_shows_count = artist_shows(artist_id, now, upcoming=True)
+  artist.past_shows, artist.past_shows_count = artist_shows(artist_id, now, upcoming=False)
+  artist.upcoming_shows_next = shows_next(0, artist.upcoming_shows_count, 'artist_upcoming_shows', artist_id=artist_id)
+  artist.past_shows_next = shows_next(0, artist.past_shows_count, 'artist_past_shows', artist_id=artist_id)
+
+  return render_template('pages/show_artist.html', artist=artist)
+
+@app.route('/artists/<int:artist_id>/past_shows')
+@cache.cached('artist', 'artist:{artist_id}')
+@read_only
+def artist_past_shows(artist_id):
+  # next page of past shows for the "load more" button on the artist page
+  offset = max(request.args.get('offset', 0, type=int), 0)
+  shows, count = artist_shows(artist_id, now_utc(), upcoming=False, offset=offset)
+  return render_template('pages/artist_shows.html', shows=shows, when='past',
+    next_url=shows_next(offset, count, 'artist_past_shows', artist_id=artist_id))
+
+@app.route('/artists/<int:artist_id>/upcoming_shows')
+@cache.cached('artist', 'artist:{artist_id}')
+@read_only
+def artist_upcoming_shows(artist_id):
+  # next page of upcoming shows for the "load more" button on the artist page
+  offset = max(request.args.get('offset', 0, type=int), 0)
+  shows, count = artist_shows(artist_id, now_utc(), upcoming=True, offset=offset)
+  return render_template('pages/artist_shows.html', shows=shows, when='upcoming',
+    next_url=shows_next(offset, count, 'artist_upcoming_shows', artist_id=artist_id))
+
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  # counterpart of delete_venue
+  error = False
+  found = True
+  try:
+    found = delete_listing(Artist, artist_id, Show.artist_id, artist_genres.c.artist_id, soft_delete_requested())
+    db.session.commit()
+    cache.invalidate('artists', 'artist:%s' % artist_id, 'shows', 'venues', 'venue')
+  except Exception:
+    app.logger.exception('could not delete artist %s', artist_id)
+    db.session.rollback()
+    error = True
+  finally:
+    db.session.close()
+  if error:
+    abort(500)
+  elif not found:
+    abort(404)
+  else:
+    return render_template('pages/home.html')
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@read_only
 def edit_artist(artist_id):
     form = ArtistForm()
-    artistData = Artist.query.get(artist_id)
-    artist= artistData.__dict__
+    artist = found_or_404(artist_detail(artist_id, genres=False))
 
     return render_template('forms/edit_artist.html', form=form, artist=artist)
   
@@ -338,34 +482,49 @@ def edit_artist_submission(artist_id):
   # artist record with ID <artist_id> using the new attributes
     form = ArtistForm()
     error = False
+    found = True
+    conflict = False
     try:
-        artist = Artist.query.get(artist_id)
-        artist.name = request.form['name']
-        artist.state = request.form['state'] 
-        artist.city =request.form['city']
-        artist.phone =request.form['phone'].strip()
-        artist.genres = (',').join(request.form.getlist('genres'))
-        artist.facebook_link = request.form['facebook_link']
-        artist.image_link = request.form['image_link']
-        artist.website = request.form['website_link']
-        artist.seeking_venue =True if request.form.get('seeking_venue') =='y' or request.form.get('seeking_talent')=='t' else False
-        artist.seeking_description = request.form['seeking_description']
-        db.session.commit()
-    except:
+        artist = Artist.query.options(db.selectinload(Artist.genres)).filter_by(id=artist_id, deleted_at=None).first()
+        found = artist is not None
+        if found:
+            artist.name = request.form['name']
+            artist.state = request.form['state'] 
+            artist.city =request.form['city']
+            artist.phone =request.form['phone'].strip()
+            artist.genres = Genre.from_names(request.form.getlist('genres'))
+            artist.facebook_link = request.form['facebook_link']
+            artist.image_link = request.form['image_link']
+            artist.website = request.form['website_link']
+            artist.seeking_venue =True if request.form.get('seeking_venue') =='y' or request.form.get('seeking_talent')=='t' else False
+            artist.seeking_description = request.form['seeking_description']
+            jobs.enqueue('check_links', kind='artist', id=artist_id)
+            db.session.commit()
+            cache.invalidate('artists', 'artist:%s' % artist_id, 'shows', 'venue')
+    except StaleDataError:
+        # deleted or edited by someone else since the row was read
+        db.session.rollback()
+        conflict = True
+    except Exception:
+        app.logger.exception('could not edit artist %s', artist_id)
         db.session.rollback()
         error = True
     finally:
         db.session.close()
     if error:
         abort(500)
+    elif not found:
+        abort(404)
+    elif conflict:
+        abort(409)
     else:
         return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@read_only
 def edit_venue(venue_id):
   form = VenueForm()
-  venueData = Venue.query.get(venue_id)
-  venue= venueData.__dict__
+  venue = found_or_404(venue_detail(venue_id, genres=False))
   # TODO: populate form with values from venue with ID <venue_id>
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
@@ -375,27 +534,42 @@ def edit_venue_submission(venue_id):
   # venue record with ID <venue_id> using the new attributes
     form = VenueForm()
     error = False
+    found = True
+    conflict = False
     try:
-        venue = Venue.query.get(venue_id)
-        venue.name = request.form['name']
-        venue.state = request.form['state'] 
-        venue.city =request.form['city']
-        venue.address = request.form['address']
-        venue.phone =request.form['phone'].strip()
-        venue.genres = (',').join(request.form.getlist('genres'))
-        venue.facebook_link = request.form['facebook_link']
-        venue.image_link = request.form['image_link']
-        venue.website_link = request.form['website_link']
-        venue.seeking_talent =True if request.form.get('seeking_talent') =='y' or request.form.get('seeking_talent')=='t' else False
-        venue.seeking_description = request.form['seeking_description']
-        db.session.commit()
-    except:
+        venue = Venue.query.options(db.selectinload(Venue.genres)).filter_by(id=venue_id, deleted_at=None).first()
+        found = venue is not None
+        if found:
+            venue.name = request.form['name']
+            venue.state = request.form['state'] 
+            venue.city =request.form['city']
+            venue.address = request.form['address']
+            venue.phone =request.form['phone'].strip()
+            venue.genres = Genre.from_names(request.form.getlist('genres'))
+            venue.facebook_link = request.form['facebook_link']
+            venue.image_link = request.form['image_link']
+            venue.website_link = request.form['website_link']
+            venue.seeking_talent =True if request.form.get('seeking_talent') =='y' or request.form.get('seeking_talent')=='t' else False
+            venue.seeking_description = request.form['seeking_description']
+            jobs.enqueue('check_links', kind='venue', id=venue_id)
+            db.session.commit()
+            cache.invalidate('venues', 'venue:%s' % venue_id, 'shows', 'artist')
+    except StaleDataError:
+        # deleted or edited by someone else since the row was read
+        db.session.rollback()
+        conflict = True
+    except Exception:
+        app.logger.exception('could not edit venue %s', venue_id)
         db.session.rollback()
         error = True
     finally:
         db.session.close()
     if error:
         abort(500)
+    elif not found:
+        abort(404)
+    elif conflict:
+        abort(409)
     else:
         return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -420,7 +594,7 @@ def create_artist_submission():
     artist.state = request.form['state'] 
     artist.city =request.form['city']
     artist.phone =request.form['phone'].strip()
-    artist.genres = (',').join(request.form.getlist('genres'))
+    artist.genres = Genre.from_names(request.form.getlist('genres'))
     artist.facebook_link = request.form['facebook_link']
     artist.image_link = request.form['image_link']
     artist.website = request.form['website_link']
@@ -428,10 +602,13 @@ def create_artist_submission():
     artist.seeking_description = request.form['seeking_description']
     
     db.session.add(artist)
+    db.session.flush()
+    jobs.enqueue('check_links', kind='artist', id=artist.id)
     db.session.commit()
+    cache.invalidate('artists')
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  except Exception as e:
-    print(e)
+  except Exception:
+    app.logger.exception('could not create artist %r', request.form.get('name'))
     db.session.rollback()
     error = True
     flash('An error occurred. Venue ' +  request.form['name'] + ' could not be listed.')
@@ -453,26 +630,60 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache.cached('shows')
+@read_only
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  shows = Show.query.join(
-    Venue
-  ).join(
-      Artist, 
-    ).filter(Venue.id == Show.venue_id).filter(Artist.id == Show.artist_id).with_entities(Show.venue_id, Venue.name.label('venue_name'), Show.artist_id, Artist.name.label('artist_name'), Artist.image_link, Show.start_time)
-  data =[]
-  for show in shows:
-    show_details = {}
-    show_details['venue_id']  = show.venue_id
-    show_details['venue_name'] =show.venue_name
-    show_details['artist_id'] = show.artist_id
-    show_details['artist_name'] = show.artist_name
-    show_details['artist_image_link'] = show.image_link
-    show_details['start_time'] =show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-    data.append(show_details) 
-
-  return render_template('pages/shows.html', shows=data)
+  try:
+    data, after = shows_page(after=request.args.get('after'))
+  except ValueError:
+    abort(400)
+  next_url = url_for('shows', after=after) if after else None
+  return render_template('pages/shows.html', shows=data, next_url=next_url)
+
+@app.route('/shows/calendar')
+@cache.cached('shows')
+@read_only
+def shows_calendar_page():
+  # show counts per ?bucket= (day, week or month) between ?from= and ?to=,
+  # optionally for one ?city=, ?state=, ?genre= or ?venue=
+  try:
+    args = calendar_args(request.args, app.config['CALENDAR_MAX_BUCKETS'])
+  except ValueError:
+    abort(400)
+  buckets = shows_calendar(**args)
+  start, end = buckets[0][0], buckets[-1][1]
+  def window_url(start, end):
+    return url_for('shows_calendar_page', **dict(request.args.to_dict(), **{'from': start.isoformat(), 'to': end.isoformat()}))
+  return render_template('pages/shows_calendar.html', buckets=buckets, bucket=args['bucket'],
+    total=sum(count for _, _, count in buckets),
+    previous_url=window_url(start - (end - start), start), next_url=window_url(end, end + (end - start)))
+
+@app.route('/shows/nearby')
+@read_only
+def nearby_shows():
+  # shows starting between ?from= and ?to= at the venues within ?radius=
+  # miles of ?lat=,?lng=, soonest first
+  latitude, longitude, miles = point_args()
+  start, end = window_args()
+  return jsonify({
+    'lat': latitude,
+    'lng': longitude,
+    'radius': miles,
+    'from': start.isoformat(),
+    'to': end.isoformat(),
+    'shows': [{
+      'show_id': show.id,
+      'start_time': show.start_time.isoformat(),
+      'end_time': show.end_time.isoformat(),
+      'venue_id': show.venue_id,
+      'venue_name': show.venue_name,
+      'distance': round(distance_miles(latitude, longitude, show.latitude, show.longitude), 2),
+      'artist_id': show.artist_id,
+      'artist_name': show.artist_name,
+      'artist_image_link': show.artist_image_link,
+    } for show in nearby_shows_query(latitude, longitude, miles, start, end)],
+  })
 
 @app.route('/shows/create')
 def create_shows():
@@ -486,21 +697,51 @@ def create_show_submission():
   # TODO: insert form data as a new Show record in the db, instead
   form = ShowForm()
   error = False
+  conflict = None
+  unlisted = None
+  invalid = None
   try:
     show = Show()
     show.artist_id= request.form['artist_id']
     show.venue_id = request.form['venue_id']
-    show.start_time =request.form.get('start_time')
-    db.session.add(show)
-    db.session.commit()
-    flash('Show was successfully listed!')
-  except Exception as e:
-    print(e)
+    show.start_time = naive_utc(dateutil.parser.parse(request.form.get('start_time') or ''))
+    show.end_time = show_end_time(show.start_time, request.form.get('end_time'))
+    unlisted = unlisted_owner(show.venue_id, show.artist_id)
+    if unlisted:
+      db.session.rollback()
+      flash('The %s is not listed. Show could not be listed.' % unlisted)
+    else:
+      db.session.add(show)
+      record_shows([(show.venue_id, show.artist_id, show.start_time)])
+      db.session.commit()
+      cache.invalidate('shows', 'venues', 'venue:%s' % show.venue_id, 'artist:%s' % show.artist_id)
+      flash('Show was successfully listed!')
+  except IntegrityError as e:
+    # a double booking is the user's to fix, anything else is ours
+    db.session.rollback()
+    conflict = booking_conflict(e)
+    error = conflict is None
+    if conflict:
+      flash('The %s is already booked at that time. Show could not be listed.' % conflict)
+    else:
+      app.logger.exception('could not create show')
+      flash('An error occurred. Show could not be listed.')
+  except ValueError as e:
+    # a start or end time that does not parse, or an end before the start
+    db.session.rollback()
+    invalid = str(e)
+    flash('Show could not be listed: %s.' % invalid)
+  except Exception:
+    app.logger.exception('could not create show')
     db.session.rollback()
     error = True
     flash('An error occurred. Show could not be listed.')
   finally:
     db.session.close()
+  if invalid:
+    return render_template('forms/new_show.html', form=form), 400
+  if conflict or unlisted:
+    return render_template('forms/new_show.html', form=form), 409
   if error:
     abort(500)
   else:
@@ -512,6 +753,53 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   
 
+#  Cache
+#  ----------------------------------------------------------------
+
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(cache.stats())
+
+#  Jobs
+#  ----------------------------------------------------------------
+
+@app.route('/jobs/stats')
+def jobs_stats():
+  return jsonify(jobs.stats())
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def metrics():
+  # job queue depth and latency, plus per-route timings and SQL counts
+  # when PROFILING_ENABLED is set
+  body = jobs.metrics()
+  if profiler.enabled:
+    body = profiler.metrics() + body
+  return Response(body, mimetype='text/plain; version=0.0.4')
+
+#  Health
+#  ----------------------------------------------------------------
+
+@app.route('/healthz/db')
+def healthz_db():
+  # connectivity check plus connection pool usage for the primary engine
+  engine = db.engine
+  status = {'status': 'ok', 'pool': type(engine.pool).__name__}
+  try:
+    with engine.connect() as connection:
+      connection.execute(db.text('SELECT 1'))
+  except Exception as e:
+    app.logger.error('database health check failed: %s', e)
+    status['status'] = 'error'
+  for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+    if hasattr(engine.pool, stat):
+      status[stat] = getattr(engine.pool, stat)()
+  if 'replicas' in app.extensions:
+    status['replicas'] = app.extensions['replicas'].status()
+  return jsonify(status), 200 if status['status'] == 'ok' else 503
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
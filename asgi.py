@@ -0,0 +1,252 @@
+import io
+import itertools
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, g, render_template, request, url_for
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+from app import app, shows_next
+from cache import cache
+from config import async_database_uri, async_engine_options
+from models import Venue, Artist, now_utc
+from queries import (
+    venue_areas_query, venue_areas_result, artists_query, shows_query, keyset_result,
+    ARTIST_KEYS, SHOW_KEYS, search_query, search_result,
+    VenueDetail, ArtistDetail, detail_query, detail_genres_query, detail_result,
+    venue_shows_query, artist_shows_query, show_page_result,
+)
+from routing import use_replica
+
+#----------------------------------------------------------------------------#
+# Async serving mode.
+#
+#   uvicorn asgi:application --workers 2
+#
+# The listing, detail and search pages are served by coroutines that run
+# the statements built in queries.py on an async engine (asyncpg, or
+# aiosqlite for local runs), so a worker keeps serving other requests
+# while one waits on the database. Templates are rendered inside a normal
+# Flask request context built from the ASGI scope, so url_for, sessions,
+# flashes, the page cache and after_request hooks behave as in app.py.
+# Every other route, including all the writes, falls through to the Flask
+# app unchanged.
+#----------------------------------------------------------------------------#
+
+
+async def fetch(connection, query):
+    return (await connection.execute(query.statement)).all()
+
+
+async def venues(connection):
+    genre = request.args.get('genre')
+    state = request.args.get('state')
+    try:
+        query = venue_areas_query(genre=genre, state=state, after=request.args.get('after'))
+    except ValueError:
+        abort(400)
+    data, after = venue_areas_result(await fetch(connection, query))
+    next_url = url_for('venues', genre=genre, state=state, after=after) if after else None
+    return render_template('pages/venues.html', areas=data, next_url=next_url)
+
+
+async def artists(connection):
+    try:
+        query = artists_query(after=request.args.get('after'))
+    except ValueError:
+        abort(400)
+    data, after = keyset_result(await fetch(connection, query), ARTIST_KEYS)
+    next_url = url_for('artists', after=after) if after else None
+    return render_template('pages/artists.html', artists=data, next_url=next_url)
+
+
+async def shows(connection):
+    try:
+        query = shows_query(after=request.args.get('after'))
+    except ValueError:
+        abort(400)
+    data, after = keyset_result(await fetch(connection, query), SHOW_KEYS)
+    next_url = url_for('shows', after=after) if after else None
+    return render_template('pages/shows.html', shows=data, next_url=next_url)
+
+
+async def _search(connection, model, template):
+    search_term = request.form.get('search_term', '')
+    page = max(request.form.get('page', 1, type=int), 1)
+    rows = await fetch(connection, search_query(model, search_term, page))
+    return render_template(template, results=search_result(rows, page), search_term=search_term)
+
+
+async def search_venues(connection):
+    return await _search(connection, Venue, 'pages/search_venues.html')
+
+
+async def search_artists(connection):
+    return await _search(connection, Artist, 'pages/search_artists.html')
+
+
+async def _detail(connection, read_model, id, shows_query, endpoint_prefix, **values):
+    rows = await fetch(connection, detail_query(read_model, id))
+    if not rows:
+        abort(404)
+    detail = detail_result(read_model, rows, await fetch(connection, detail_genres_query(read_model, id)))
+    now = now_utc()
+    detail.upcoming_shows, detail.upcoming_shows_count = show_page_result(
+        await fetch(connection, shows_query(id, now, upcoming=True)))
+    detail.past_shows, detail.past_shows_count = show_page_result(
+        await fetch(connection, shows_query(id, now, upcoming=False)))
+    detail.upcoming_shows_next = shows_next(
+        0, detail.upcoming_shows_count, endpoint_prefix + '_upcoming_shows', **values)
+    detail.past_shows_next = shows_next(0, detail.past_shows_count, endpoint_prefix + '_past_shows', **values)
+    return detail
+
+
+async def show_venue(connection, venue_id):
+    venue = await _detail(connection, VenueDetail, venue_id, venue_shows_query, 'venue', venue_id=venue_id)
+    return render_template('pages/show_venue.html', venue=venue)
+
+
+async def show_artist(connection, artist_id):
+    artist = await _detail(connection, ArtistDetail, artist_id, artist_shows_query, 'artist', artist_id=artist_id)
+    return render_template('pages/show_artist.html', artist=artist)
+
+
+# Same paths and page cache namespaces as the sync views in app.py.
+ROUTES = Map([
+    Rule('/venues', endpoint=(venues, ('venues',)), methods=['GET']),
+    Rule('/venues/search', endpoint=(search_venues, ()), methods=['POST']),
+    Rule('/venues/<int:venue_id>', endpoint=(show_venue, ('venue', 'venue:{venue_id}')), methods=['GET']),
+    Rule('/artists', endpoint=(artists, ('artists',)), methods=['GET']),
+    Rule('/artists/search', endpoint=(search_artists, ()), methods=['POST']),
+    Rule('/artists/<int:artist_id>', endpoint=(show_artist, ('artist', 'artist:{artist_id}')), methods=['GET']),
+    Rule('/shows', endpoint=(shows, ('shows',)), methods=['GET']),
+])
+
+
+def build_environ(scope, body):
+    # WSGI environ for the Flask request context, from an ASGI http scope.
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('latin-1').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+        elif 'HTTP_' + name in environ:
+            environ['HTTP_' + name] += ',' + value
+        else:
+            environ['HTTP_' + name] = value
+    return environ
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+class AsyncApp(object):
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        uri = flask_app.config['SQLALCHEMY_ASYNC_DATABASE_URI']
+        if uri is None:
+            raise ValueError('No async driver for %r' % flask_app.config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = create_async_engine(uri, **async_engine_options(uri))
+        # Replicas are picked round-robin; a replica that fails to connect
+        # falls back to the primary for that request.
+        self.replicas = [
+            create_async_engine(async_database_uri(replica), **async_engine_options(replica))
+            for replica in flask_app.config.get('SQLALCHEMY_REPLICA_URIS') or ()
+        ]
+        self._next_replica = itertools.cycle(self.replicas)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http':
+            try:
+                (handler, namespaces), values = ROUTES.bind('localhost').match(scope['path'], method=scope['method'])
+            except HTTPException:
+                pass
+            else:
+                return await self.respond(handler, namespaces, values, scope, receive, send)
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                for replica in self.replicas:
+                    await replica.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def connect(self):
+        if self.replicas and use_replica():
+            try:
+                return await next(self._next_replica).connect()
+            except Exception as e:
+                self.app.logger.warning('replica unavailable, reading from the primary: %s', e)
+        return await self.engine.connect()
+
+    async def dispatch(self, handler, namespaces, values):
+        key, body = cache.lookup([namespace.format(**values) for namespace in namespaces])
+        if body is not None:
+            return body
+        connection = await self.connect()
+        try:
+            body = await handler(connection, **values)
+        finally:
+            await connection.close()
+        cache.store(key, body)
+        return body
+
+    async def respond(self, handler, namespaces, values, scope, receive, send):
+        environ = build_environ(scope, await read_body(receive))
+        # Mirrors Flask.wsgi_app and full_dispatch_request around the coroutine.
+        with self.app.request_context(environ):
+            try:
+                try:
+                    g.db_read_only = True
+                    rv = self.app.preprocess_request()
+                    if rv is None:
+                        rv = await self.dispatch(handler, namespaces, values)
+                except Exception as e:
+                    rv = self.app.handle_user_exception(e)
+                response = self.app.finalize_request(rv)
+            except Exception as e:
+                response = self.app.handle_exception(e)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+application = AsyncApp(app)
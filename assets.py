@@ -0,0 +1,301 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+#----------------------------------------------------------------------------#
+# Static asset pipeline.
+#
+# `flask assets build` copies every file under static/ to static/dist/
+# with a content hash in its name, minifies the stylesheets (and the
+# scripts when rjsmin is installed), concatenates the BUNDLES and writes
+# gzip and brotli variants next to the compressible files. The manifest
+# maps each source name to its hashed copy, and url_for('static', ...)
+# is rewritten through it, so templates keep naming the sources. Hashed
+# files never change, so they are served with a one-year immutable
+# Cache-Control, precompressed when the client accepts it.
+#
+# The manifest lives outside static/ (ASSETS_MANIFEST), so it is never
+# served. Without one (no build yet, or ASSETS_MANIFEST empty) the
+# sources are served as they are and a bundle is linked part by part.
+#----------------------------------------------------------------------------#
+
+# Bundle name -> source files, in load order.
+BUNDLES = {
+    'css/site.css': [
+        'css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+        'css/main.responsive.css', 'css/main.quickfix.css',
+    ],
+    'js/site.js': [
+        'js/libs/jquery-1.11.1.min.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/libs/moment.min.js',
+        'js/plugins.js', 'js/script.js',
+    ],
+}
+
+DIST_DIR = 'dist'
+
+HASH_LENGTH = 12
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Worth precompressing; images and woff fonts are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.ttf', '.otf', '.eot')
+
+# A variant is only kept when it saves at least this share of the bytes.
+MIN_SAVING = 0.1
+
+_STRING = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+_CSS_COMMENTS = re.compile(r'(%s)|(/\*!.*?\*/)|/\*.*?\*/' % _STRING, re.S)
+_CSS_SPACE = re.compile(r'(%s)|\s+' % _STRING)
+_CSS_PUNCTUATION = re.compile(r'(%s)|\s*([{};,>])\s*' % _STRING)
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_SOURCE_MAP = re.compile(r'^\s*(?://[#@] sourceMappingURL=.*|/\*[#@] sourceMappingURL=.*?\*/)\s*$', re.M)
+
+
+def minify_css(text):
+    # Drops comments (bar /*! licences */) and the whitespace the syntax
+    # does not need, leaving strings alone.
+    text = _CSS_COMMENTS.sub(lambda match: match.group(1) or match.group(2) or ' ', text)
+    text = _CSS_SPACE.sub(lambda match: match.group(1) or ' ', text)
+    text = _CSS_PUNCTUATION.sub(lambda match: match.group(1) or match.group(2), text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(name, text):
+    if rjsmin is None or name.endswith('.min.js'):
+        return text
+    return rjsmin.jsmin(text, keep_bang_comments=True)
+
+
+def hashed_name(name, content):
+    root, ext = posixpath.splitext(name)
+    return posixpath.join(DIST_DIR, '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:HASH_LENGTH], ext))
+
+
+def rewrite_urls(text, source, output, files):
+    # Points the url()s of a stylesheet read from source at the hashed
+    # files, relative to where it is written (output).
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r'[a-z][a-z0-9+.-]*:|/|#', target, re.I):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', target).groups()
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        path = files.get(path, path)
+        return 'url(%s%s%s%s)' % (quote, posixpath.relpath(path, posixpath.dirname(output)), suffix, quote)
+    return _CSS_URL.sub(replace, text)
+
+
+def source_files(static_folder):
+    # Static file names relative to the folder, in a stable order, leaving
+    # out earlier builds.
+    names = []
+    for root, dirs, filenames in os.walk(static_folder):
+        relative = os.path.relpath(root, static_folder).replace(os.sep, '/')
+        if relative == DIST_DIR:
+            dirs[:] = []
+            continue
+        dirs.sort()
+        for filename in sorted(filenames):
+            names.append(filename if relative == '.' else posixpath.join(relative, filename))
+    return names
+
+
+def build(static_folder, compress=True):
+    # Writes the hashed files and returns the manifest and a size report
+    # for each bundle.
+    outputs = {}
+    files = {}
+
+    def read(name):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            return f.read()
+
+    def processed(name, output):
+        # The minified text of a source as written to output.
+        text = read(name).decode('utf-8')
+        if name.endswith('.css'):
+            return minify_css(rewrite_urls(text, name, output, files))
+        return minify_js(name, text)
+
+    names = source_files(static_folder)
+    clashes = set(names) & set(BUNDLES)
+    if clashes:
+        raise click.ClickException('bundle names clash with static files: %s' % ', '.join(sorted(clashes)))
+    # Everything a stylesheet can point at is hashed before the stylesheets.
+    for name in sorted(names, key=lambda name: name.endswith('.css')):
+        if name.endswith(('.css', '.js')):
+            content = processed(name, hashed_name(name, b'')).encode('utf-8')
+        else:
+            content = read(name)
+        files[name] = hashed_name(name, content)
+        outputs[files[name]] = content
+    report = {}
+    for bundle, parts in BUNDLES.items():
+        output = hashed_name(bundle, b'')
+        if bundle.endswith('.css'):
+            text = '\n'.join(_SOURCE_MAP.sub('', processed(part, output)).strip() for part in parts)
+        else:
+            # On a line of its own, so a trailing // comment cannot swallow it.
+            text = ''.join(_SOURCE_MAP.sub('', processed(part, output)).strip() + '\n;\n' for part in parts)
+        content = text.encode('utf-8')
+        files[bundle] = hashed_name(bundle, content)
+        outputs[files[bundle]] = content
+        report[bundle] = {
+            'parts': len(parts),
+            'source_bytes': sum(len(read(part)) for part in parts),
+            'bytes': len(content),
+        }
+    encodings = {}
+    for name, content in sorted(outputs.items()):
+        path = os.path.join(static_folder, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write(path, content)
+        if not compress or not name.endswith(COMPRESSIBLE):
+            continue
+        variants = [('gzip', '.gz', gzip.compress(content, 9, mtime=0))]
+        if brotli is not None:
+            variants.insert(0, ('br', '.br', brotli.compress(content, quality=11)))
+        for encoding, suffix, compressed in variants:
+            if len(compressed) <= len(content) * (1 - MIN_SAVING):
+                _write(path + suffix, compressed)
+                encodings.setdefault(name, {})[encoding] = len(compressed)
+    for bundle, sizes in report.items():
+        sizes.update(encodings.get(files[bundle], {}))
+    return {'files': files, 'encodings': dict((name, sorted(found)) for name, found in encodings.items())}, report
+
+
+def _write(path, content):
+    # Hashed files are immutable; one already written is left alone.
+    if os.path.exists(path):
+        return
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+class Assets(object):
+
+    def __init__(self, app=None):
+        self.files = {}
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.manifest_path = app.config.get('ASSETS_MANIFEST')
+        self.load()
+        app.url_defaults(self._hashed_url)
+        app.add_template_global(self.urls, 'asset_urls')
+        if 'static' in app.view_functions:
+            app.view_functions['static'] = self.send_static
+        app.extensions['assets'] = self
+
+    def load(self):
+        self.files, self.encodings = {}, {}
+        if self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            self.files = manifest['files']
+            self.encodings = dict((name, set(found)) for name, found in manifest['encodings'].items())
+
+    def _hashed_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.files:
+            values['filename'] = self.files[values['filename']]
+
+    def urls(self, name):
+        # The URLs to link for a bundle or static file: the built file, or
+        # every part of an unbuilt bundle.
+        if name in BUNDLES and name not in self.files:
+            return [url_for('static', filename=part) for part in BUNDLES[name]]
+        return [url_for('static', filename=name)]
+
+    def send_static(self, filename):
+        if not filename.startswith(DIST_DIR + '/'):
+            return current_app.send_static_file(filename)
+        encoding = None
+        for candidate in ('br', 'gzip'):
+            if candidate in self.encodings.get(filename, ()) and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        if encoding is None:
+            response = send_from_directory(current_app.static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+        else:
+            response = send_from_directory(
+                current_app.static_folder, filename + ('.br' if encoding == 'br' else '.gz'),
+                mimetype=mimetypes.guess_type(filename)[0], max_age=IMMUTABLE_MAX_AGE
+            )
+            response.headers['Content-Encoding'] = encoding
+        if filename in self.encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@click.group('assets')
+def assets_command():
+    """Build the hashed, minified and precompressed static files."""
+
+
+@assets_command.command('build')
+@click.option('--no-compress', is_flag=True, help='Skip the gzip and brotli variants.')
+@with_appcontext
+def build_command(no_compress):
+    """Bundle, minify and fingerprint static/ into static/dist/."""
+    if not assets.manifest_path:
+        raise click.ClickException('ASSETS_MANIFEST is not set')
+    manifest, report = build(current_app.static_folder, compress=not no_compress)
+    with open(assets.manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(assets.manifest_path + '.tmp', assets.manifest_path)
+    assets.load()
+    for bundle, sizes in sorted(report.items()):
+        click.echo('%s -> %s: %d files, %d bytes -> %d (gzip %s, br %s)' % (
+            bundle, manifest['files'][bundle], sizes['parts'], sizes['source_bytes'], sizes['bytes'],
+            sizes.get('gzip', '-'), sizes.get('br', '-')
+        ))
+    if brotli is None and not no_compress:
+        click.echo('brotli is not installed, only gzip variants were written', err=True)
+    click.echo('%d files hashed, manifest written to %s' % (len(manifest['files']), assets.manifest_path))
+
+
+@assets_command.command('clean')
+@with_appcontext
+def clean_command():
+    """Delete the built files the current manifest no longer names."""
+    current = set(assets.files.values())
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    # A manifest configured inside static/dist/ is not a built file.
+    manifest = os.path.abspath(assets.manifest_path) if assets.manifest_path else None
+    removed = 0
+    for name in source_files(dist):
+        path = os.path.join(dist, *name.split('/'))
+        built = posixpath.join(DIST_DIR, re.sub(r'\.(gz|br)$', '', name))
+        if built not in current and os.path.abspath(path) != manifest:
+            os.remove(path)
+            removed += 1
+    click.echo('%d stale files removed' % removed)
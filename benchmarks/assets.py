@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import re
+import tempfile
+
+from benchmarks.run import git_commit
+
+#----------------------------------------------------------------------------#
+# Static asset benchmark.
+#
+# Renders a page twice, once linking the static sources and once through
+# the `flask assets build` manifest, and fetches every local stylesheet
+# and script it links the way a browser accepting gzip and brotli would:
+#
+#   first paint  stylesheets and the synchronous scripts in <head>, which
+#                block rendering
+#   total        every local stylesheet and script
+#   revisit      requests a returning browser still makes, i.e. responses
+#                without a max-age to reuse them for
+#
+# Scripts from other hosts are counted but not fetched.
+#----------------------------------------------------------------------------#
+
+_CONDITIONAL = re.compile(r'<!--\[if.*?<!\[endif\]-->', re.S)
+_TAG = re.compile(r'<(link|script)\b([^>]*)>', re.I)
+_ATTRIBUTE = re.compile(r'([a-z-]+)(?:="([^"]*)")?', re.I)
+
+
+def page_assets(html):
+    # [(url, blocks first paint)] for the stylesheets and scripts of a page.
+    html = _CONDITIONAL.sub('', html)
+    head_end = html.find('</head>')
+    found = []
+    for match in _TAG.finditer(html):
+        attributes = dict((name.lower(), value) for name, value in _ATTRIBUTE.findall(match.group(2)))
+        if match.group(1).lower() == 'link':
+            if attributes.get('rel') == 'stylesheet' and attributes.get('href'):
+                found.append((attributes['href'], True))
+        elif attributes.get('src'):
+            blocking = match.start() < head_end and 'defer' not in attributes and 'async' not in attributes
+            found.append((attributes['src'], blocking))
+    return found
+
+
+def measure(client, path):
+    html = client.get(path).get_data(as_text=True)
+    result = {
+        'first_paint_requests': 0, 'first_paint_bytes': 0, 'requests': 0, 'bytes': 0,
+        'revisit_requests': 0, 'external_requests': 0, 'errors': 0,
+    }
+    for url, blocking in page_assets(html):
+        if not url.startswith('/') or url.startswith('//'):
+            result['external_requests'] += 1
+            continue
+        response = client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        size = len(response.get_data())
+        result['errors'] += response.status_code != 200
+        result['requests'] += 1
+        result['bytes'] += size
+        if blocking:
+            result['first_paint_requests'] += 1
+            result['first_paint_bytes'] += size
+        if not response.cache_control.max_age:
+            result['revisit_requests'] += 1
+        response.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the static requests and bytes of a page before and after `flask assets build`.')
+    parser.add_argument('--path', default='/', help='Page to measure.')
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>-assets.json.')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur-assets.db'))
+    os.environ['CACHE_TYPE'] = 'null'
+    os.environ['JOB_EXECUTOR_THREADS'] = '0'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    from app import app
+    from assets import assets, assets_command
+    from models import db
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    result = app.test_cli_runner().invoke(assets_command, ['build'])
+    print(result.output, end='')
+    if result.exit_code:
+        raise SystemExit(result.exit_code)
+    built = measure(client, args.path)
+    files, encodings = assets.files, assets.encodings
+    assets.files, assets.encodings = {}, {}
+    try:
+        sources = measure(client, args.path)
+    finally:
+        assets.files, assets.encodings = files, encodings
+    for name, measured in (('sources', sources), ('built', built)):
+        print('%-8s first paint %2d requests %8d bytes  total %2d requests %8d bytes  revisit %2d  external %d' % (
+            name, measured['first_paint_requests'], measured['first_paint_bytes'], measured['requests'],
+            measured['bytes'], measured['revisit_requests'], measured['external_requests']
+        ))
+
+    report = {'commit': git_commit(), 'path': args.path, 'sources': sources, 'built': built}
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', '%s-assets.json' % (report['commit'] or 'local')
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import generate
+from benchmarks.run import StatementCounter, git_commit, percentile
+
+#----------------------------------------------------------------------------#
+# Show calendar benchmark.
+#
+# Seeds a catalog with a flat, dense show table (every venue plays once a
+# day, so no booking is refused and the row count is exact) and times the
+# calendar API over year-long windows for each bucket:
+#
+#   cold      the 'shows' namespace bumped first, every bucket counted in SQL
+#   warm      the same window again, every bucket read from the cache
+#   adjacent  a cached window moved a month earlier, only that month counted
+#
+# plus cold runs filtered by city, genre and venue. The shows start on the
+# first day of the earliest window; --shows / --venues days should cover
+# the 13 months measured. The default is 10M shows (500 days); seeding
+# that many takes a while, so --no-seed reuses a database seeded earlier
+# with the same sizes.
+#----------------------------------------------------------------------------#
+
+DEFAULT_SIZES = {'venues': 20000, 'artists': 40000, 'shows': 10000000}
+
+QUICK_SIZES = {'venues': 50, 'artists': 100, 'shows': 20000}
+
+SHOW_HOURS = (18, 19, 20, 21)
+
+
+def show_rows(venues, artists, shows, first_day):
+    # Show n plays venue n % venues on day n // venues. An artist's shows
+    # on one day go to distinct venues only when artists >= venues, so
+    # nobody is booked twice a day.
+    for index in range(shows):
+        day, venue = divmod(index, venues)
+        start = first_day + timedelta(days=day, hours=SHOW_HOURS[index % len(SHOW_HOURS)])
+        yield {
+            'id': index + 1, 'start_time': start, 'end_time': start + timedelta(minutes=generate.SHOW_MINUTES),
+            'venue_id': venue + 1, 'artist_id': (venue + day * 7919) % artists + 1, 'version': 1,
+        }
+
+
+def seed_shows(db, venues, artists, shows, first_day):
+    table = db.metadata.tables['shows']
+    chunk = []
+    for row in show_rows(venues, artists, shows, first_day):
+        chunk.append(row)
+        if len(chunk) == generate.INSERT_CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            db.session.commit()
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('shows', 'id'), COALESCE(MAX(id), 1)) FROM shows"
+        ))
+    db.session.commit()
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def run_case(client, counter, path, requests, prepare=None):
+    latencies = []
+    statements = 0
+    errors = 0
+    for index in range(requests):
+        request_path = prepare(index) if prepare else path
+        before = counter.count
+        started = time.perf_counter()
+        response = client.get(request_path)
+        latencies.append(time.perf_counter() - started)
+        statements += counter.count - before
+        errors += response.status_code != 200
+        response.close()
+    latencies.sort()
+    return {
+        'path': path,
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'sql_per_request': round(statements / float(requests), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the show calendar over year-long windows.')
+    parser.add_argument('--venues', type=int, default=DEFAULT_SIZES['venues'])
+    parser.add_argument('--artists', type=int, default=DEFAULT_SIZES['artists'])
+    parser.add_argument('--shows', type=int, default=DEFAULT_SIZES['shows'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anchor', type=datetime.fromisoformat,
+                        help='Date the show times are centred on; defaults to today.')
+    parser.add_argument('--requests', type=int, default=10, help='Measured requests per case.')
+    parser.add_argument('--database-url', help='Defaults to a fresh SQLite file in the temp directory.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse an already seeded database.')
+    parser.add_argument('--quick', action='store_true', help='Tiny catalog and few requests, as a smoke test.')
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>-calendar.json.')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.venues, args.artists, args.shows = QUICK_SIZES['venues'], QUICK_SIZES['artists'], QUICK_SIZES['shows']
+        args.requests = 3
+    if args.artists < args.venues:
+        parser.error('--artists must be at least --venues')
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), 'fyyur-calendar.db')
+        if not args.no_seed and os.path.exists(path):
+            os.remove(path)
+        database_url = 'sqlite:///' + path
+    # config.py reads the environment at import time.
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['CACHE_TYPE'] = 'simple'
+    os.environ['PROFILING_ENABLED'] = 'false'
+    os.environ['JOB_EXECUTOR_THREADS'] = '0'
+    # Room for every day bucket of the windows measured below.
+    os.environ.setdefault('CACHE_MAX_ENTRIES', '8192')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from cache import cache
+    from counters import rebuild
+    from models import db
+    app.debug = False
+
+    anchor = args.anchor or datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    start = add_months(anchor.replace(day=1), -6)
+    end = add_months(start, 12)
+    first_day = add_months(start, -1)
+    days = -(-args.shows // args.venues)
+    if first_day + timedelta(days=days) < end:
+        print('note: %d days of shows leave the end of the windows empty' % days)
+    sizes = {'venues': args.venues, 'artists': args.artists, 'shows': args.shows}
+    if not args.no_seed:
+        started = time.perf_counter()
+        with app.app_context():
+            generate.seed_database(db, args.venues, args.artists, 0, args.seed, anchor,
+                                   reset=args.database_url is not None)
+            seed_shows(db, args.venues, args.artists, args.shows, first_day)
+            rebuild()
+            db.session.commit()
+        print('seeded %(venues)d venues, %(artists)d artists, %(shows)d shows' % sizes, end='')
+        print(' in %.1fs' % (time.perf_counter() - started))
+
+    counter = StatementCounter()
+    event.listen(Engine, 'after_cursor_execute', counter)
+    client = app.test_client()
+
+    def window(bucket, months=0, filters=''):
+        return '/api/v1/shows/calendar?bucket=%s&from=%s&to=%s%s' % (
+            bucket, add_months(start, months).date().isoformat(), add_months(end, months).date().isoformat(), filters
+        )
+
+    def cold(path):
+        def prepare(index):
+            with app.app_context():
+                cache.invalidate('shows')
+            return path
+        return prepare
+
+    def adjacent(bucket):
+        def prepare(index):
+            with app.app_context():
+                cache.invalidate('shows')
+            client.get(window(bucket)).close()
+            return window(bucket, -1)
+        return prepare
+
+    city, state = generate.CITIES[0]
+    cases = {}
+    for bucket in ('day', 'week', 'month'):
+        path = window(bucket)
+        cases['%s_cold' % bucket] = run_case(client, counter, path, args.requests, cold(path))
+        cases['%s_warm' % bucket] = run_case(client, counter, path, args.requests)
+        cases['%s_adjacent' % bucket] = run_case(client, counter, window(bucket, -1), args.requests,
+                                                 adjacent(bucket))
+    for name, filters in (
+        ('city', '&city=%s&state=%s' % (city.replace(' ', '+'), state)),
+        ('genre', '&genre=%s' % generate.GENRES[0].replace(' ', '+')),
+        ('venue', '&venue=1'),
+    ):
+        path = window('week', filters=filters)
+        cases['week_%s_cold' % name] = run_case(client, counter, path, args.requests, cold(path))
+    for name, result in sorted(cases.items()):
+        print('%-20s p50 %9.2fms  p95 %9.2fms  sql %5.2f  errors %d' % (
+            name, result['p50_ms'], result['p95_ms'], result['sql_per_request'], result['errors']
+        ))
+
+    report = {
+        'commit': git_commit(),
+        'database': database_url.split(':', 1)[0],
+        'dataset': dict(sizes, seed=args.seed, days=days),
+        'window': {'from': start.isoformat(), 'to': end.isoformat(), 'first_show': first_day.isoformat()},
+        'cases': cases,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', '%s-calendar.json' % (report['commit'] or 'local')
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import json
+import sys
+
+#----------------------------------------------------------------------------#
+# Compare two benchmark reports written by benchmarks/run.py.
+#
+# Exits non-zero when a route's p95 latency grew by more than --threshold
+# percent or it started issuing more SQL statements per request.
+#----------------------------------------------------------------------------#
+
+
+def _change(base, new):
+    if not base or new is None:
+        return None
+    return (new - base) / base * 100.0
+
+
+def compare(base, new, threshold):
+    regressions = []
+    rows = []
+    for name in sorted(set(base['routes']) | set(new['routes'])):
+        before = base['routes'].get(name)
+        after = new['routes'].get(name)
+        if before is None or after is None:
+            rows.append((name, 'only in %s' % ('new' if before is None else 'base')))
+            continue
+        p95 = _change(before['p95_ms'], after['p95_ms'])
+        sql_before, sql_after = before.get('sql_per_request'), after.get('sql_per_request')
+        line = 'p50 %8.2f -> %8.2fms  p95 %8.2f -> %8.2fms (%+6.1f%%)  sql %s -> %s' % (
+            before['p50_ms'], after['p50_ms'], before['p95_ms'], after['p95_ms'], p95 or 0.0,
+            sql_before, sql_after
+        )
+        if p95 is not None and p95 > threshold:
+            regressions.append('%s: p95 %+.1f%%' % (name, p95))
+            line += '  SLOWER'
+        if sql_before is not None and sql_after is not None and sql_after > sql_before:
+            regressions.append('%s: %s -> %s statements' % (name, sql_before, sql_after))
+            line += '  MORE SQL'
+        rows.append((name, line))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports.')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=20.0, help='Allowed p95 growth in percent.')
+    args = parser.parse_args(argv)
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print('%s -> %s' % (base.get('commit'), new.get('commit')))
+    rows, regressions = compare(base, new, args.threshold)
+    for name, line in rows:
+        print('%-26s %s' % (name, line))
+    if regressions:
+        print('\nregressions:\n  ' + '\n  '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
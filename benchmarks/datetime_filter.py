@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from benchmarks.run import git_commit
+
+#----------------------------------------------------------------------------#
+# Datetime filter microbenchmark.
+#
+# Formats the same timestamps with the filter the templates used before
+# (views strftime each show, the filter parses the string back with
+# dateutil and formats it with babel) and with app.format_datetime, over
+# two sets:
+#
+#   shows     start times drawn like benchmarks/generate.py (evenings on
+#             the half hour over a year), so most repeat, as on a page
+#   distinct  every timestamp different, so the LRU never hits
+#
+# The new filter starts each run with an empty LRU.
+#----------------------------------------------------------------------------#
+
+DEFAULT_COUNT = 100000
+
+FORMATS = ('full', 'medium')
+
+
+def old_format_datetime(value, format='medium'):
+    # app.py's filter before native datetimes and precompiled patterns.
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def show_times(count, anchor, seed):
+    rng = random.Random(seed)
+    return [
+        anchor + timedelta(days=rng.randint(-365, 182), hours=rng.choice((18, 19, 20, 20, 21, 21, 22)),
+                           minutes=rng.choice((0, 0, 30)))
+        for _ in range(count)
+    ]
+
+
+def distinct_times(count, anchor):
+    return [anchor + timedelta(minutes=17 * index) for index in range(count)]
+
+
+def timed(function, values, format):
+    started = time.perf_counter()
+    for value in values:
+        function(value, format)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the old and new datetime filter.')
+    parser.add_argument('--count', type=int, default=DEFAULT_COUNT, help='Timestamps per set.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='1,000 timestamps, as a smoke test.')
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>-datetime_filter.json.')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.count = 1000
+
+    # config.py reads the environment at import time.
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur-filter.db'))
+    os.environ['CACHE_TYPE'] = 'null'
+    os.environ['JOB_EXECUTOR_THREADS'] = '0'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    from app import format_datetime, format_datetime_cached
+
+    anchor = datetime(2030, 1, 1)
+    sets = {'shows': show_times(args.count, anchor, args.seed), 'distinct': distinct_times(args.count, anchor)}
+    cases = {}
+    for name, values in sorted(sets.items()):
+        strings = [value.strftime('%m/%d/%Y, %H:%M:%S') for value in values]
+        for format in FORMATS:
+            for value, string in zip(values[:100], strings[:100]):
+                assert format_datetime(value, format) == old_format_datetime(string, format)
+            old = timed(old_format_datetime, strings, format)
+            format_datetime_cached.cache_clear()
+            new = timed(format_datetime, values, format)
+            info = format_datetime_cached.cache_info()
+            cases['%s_%s' % (name, format)] = result = {
+                'timestamps': len(values),
+                'unique': len(set(values)),
+                'old_us': round(old / len(values) * 1e6, 3),
+                'new_us': round(new / len(values) * 1e6, 3),
+                'speedup': round(old / new, 1),
+                'lru_hit_rate': round(info.hits / float(info.hits + info.misses), 3),
+            }
+            print('%-16s %7d unique  old %7.2fus  new %7.2fus  %6.1fx  lru hits %5.1f%%' % (
+                '%s_%s' % (name, format), result['unique'], result['old_us'], result['new_us'],
+                result['speedup'], result['lru_hit_rate'] * 100
+            ))
+
+    report = {'commit': git_commit(), 'count': args.count, 'seed': args.seed, 'cases': cases}
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', '%s-datetime_filter.json' % (report['commit'] or 'local')
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import itertools
+import math
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+#----------------------------------------------------------------------------#
+# Deterministic synthetic catalog.
+#
+# The same seed and sizes always produce the same rows. Venues cluster in a
+# few large cities (Zipf-like weights), genres follow a skewed popularity
+# curve, a few venues and artists host most of the shows, and shows start
+# in the evening, spread over the year around the anchor date.
+#----------------------------------------------------------------------------#
+
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll',
+    'Soul', 'Other',
+]
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('San Francisco', 'CA'), ('Austin', 'TX'), ('Seattle', 'WA'),
+    ('Denver', 'CO'), ('Nashville', 'TN'), ('Boston', 'MA'), ('Portland', 'OR'),
+    ('Las Vegas', 'NV'), ('Detroit', 'MI'), ('Memphis', 'TN'), ('New Orleans', 'LA'),
+]
+
+WORDS = [
+    'Blue', 'Velvet', 'Electric', 'Golden', 'Silver', 'Midnight', 'Red', 'Wild',
+    'Lonely', 'Crystal', 'Iron', 'Neon', 'Hidden', 'Broken', 'Brass', 'Paper',
+]
+
+VENUE_KINDS = ['Hall', 'Lounge', 'Club', 'Room', 'Theatre', 'Tavern', 'Garden', 'Stage']
+ARTIST_KINDS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Quartet', 'Project', 'Kings', 'Sisters']
+
+INSERT_CHUNK_SIZE = 5000
+
+SHOW_MINUTES = 120
+
+# Venues are scattered uniformly within this many miles of their city's
+# gazetteer centroid.
+VENUE_SPREAD_MILES = 15
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'gazetteer.csv')
+
+DEFAULT_SIZES = {'venues': 1000, 'artists': 2000, 'shows': 20000}
+
+
+def zipf_weights(count, exponent=1.0):
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def _name(rng, kinds, number):
+    return '%s %s %s %d' % (rng.choice(WORDS), rng.choice(WORDS), rng.choice(kinds), number)
+
+
+def _genres(rng, weights):
+    count = rng.choice((1, 1, 2, 2, 3))
+    return sorted(set(rng.choices(range(1, len(GENRES) + 1), weights, k=count)))
+
+
+def generate(venues, artists, shows, seed=0, anchor=None):
+    # Returns a dict of table name -> list of row dicts. Ids are assigned
+    # explicitly so runners can address rows 1..N.
+    from geo import Gazetteer, encode, MILES_PER_DEGREE
+    rng = random.Random(seed)
+    # Its own stream, so adding coordinates left the other columns as they were.
+    place_rng = random.Random('%s-places' % seed)
+    gazetteer = Gazetteer()
+    gazetteer.load(GAZETTEER_PATH)
+    if anchor is None:
+        anchor = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    genre_weights = zipf_weights(len(GENRES), 0.8)
+    city_weights = zipf_weights(len(CITIES), 1.1)
+    data = {
+        'Genre': [{'id': index, 'name': name} for index, name in enumerate(GENRES, 1)],
+        'Venue': [], 'venue_genres': [], 'Artist': [], 'artist_genres': [], 'shows': [],
+    }
+    for id in range(1, venues + 1):
+        city, state = rng.choices(CITIES, city_weights)[0]
+        centre_latitude, centre_longitude = gazetteer.lookup(city, state)
+        distance = VENUE_SPREAD_MILES * math.sqrt(place_rng.random()) / MILES_PER_DEGREE
+        bearing = place_rng.uniform(0, 2 * math.pi)
+        latitude = centre_latitude + distance * math.cos(bearing)
+        longitude = centre_longitude + distance * math.sin(bearing) / math.cos(math.radians(centre_latitude))
+        data['Venue'].append({
+            'id': id, 'name': _name(rng, VENUE_KINDS, id), 'city': city, 'state': state,
+            'latitude': latitude, 'longitude': longitude, 'geohash': encode(latitude, longitude),
+            'address': '%d %s St' % (rng.randint(1, 9999), rng.choice(WORDS)),
+            'phone': '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            'image_link': 'https://images.example.com/venues/%d.jpg' % id,
+            'facebook_link': 'https://www.facebook.com/venue%d' % id,
+            'website_link': 'https://venue%d.example.com' % id,
+            'seeking_talent': rng.random() < 0.4,
+            'seeking_description': 'Looking for local acts.' if rng.random() < 0.3 else None,
+            'version': 1,
+        })
+        data['venue_genres'].extend({'venue_id': id, 'genre_id': genre} for genre in _genres(rng, genre_weights))
+    for id in range(1, artists + 1):
+        city, state = rng.choices(CITIES, city_weights)[0]
+        data['Artist'].append({
+            'id': id, 'name': _name(rng, ARTIST_KINDS, id), 'city': city, 'state': state,
+            'phone': '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            'image_link': 'https://images.example.com/artists/%d.jpg' % id,
+            'facebook_link': 'https://www.facebook.com/artist%d' % id,
+            'website': 'https://artist%d.example.com' % id,
+            'seeking_venue': rng.random() < 0.6,
+            'seeking_description': 'Booking for the season.' if rng.random() < 0.3 else None,
+            'version': 1,
+        })
+        data['artist_genres'].extend({'artist_id': id, 'genre_id': genre} for genre in _genres(rng, genre_weights))
+    if venues and artists:
+        # A shuffled popularity rank so busy venues are spread over the ids.
+        venue_ids = list(range(1, venues + 1))
+        artist_ids = list(range(1, artists + 1))
+        rng.shuffle(venue_ids)
+        rng.shuffle(artist_ids)
+        # Cumulative, so drawing a show does not re-add every weight: the
+        # same draws as passing the weights, in O(log n).
+        venue_weights = list(itertools.accumulate(zipf_weights(venues, 0.7)))
+        artist_weights = list(itertools.accumulate(zipf_weights(artists, 0.7)))
+        for id in range(1, shows + 1):
+            # Two thirds in the past year, one third in the next six months.
+            days = rng.randint(-365, -1) if rng.random() < 2.0 / 3 else rng.randint(0, 182)
+            start = anchor + timedelta(days=days, hours=rng.choice((18, 19, 20, 20, 21, 21, 22)),
+                                       minutes=rng.choice((0, 0, 30)))
+            data['shows'].append({
+                'id': id, 'start_time': start, 'end_time': start + timedelta(minutes=SHOW_MINUTES),
+                'venue_id': rng.choices(venue_ids, cum_weights=venue_weights)[0],
+                'artist_id': rng.choices(artist_ids, cum_weights=artist_weights)[0],
+                'version': 1,
+            })
+        clip_bookings(data['shows'])
+    return data
+
+
+def clip_bookings(shows):
+    # End each show no later than the next one at its venue or by its
+    # artist, so the catalog passes the double-booking guard. Same rule
+    # as the end_time backfill migration.
+    last = {}
+    for show in sorted(shows, key=lambda show: (show['start_time'], show['id'])):
+        for owner in (('venue', show['venue_id']), ('artist', show['artist_id'])):
+            previous = last.get(owner)
+            if previous is not None and previous['end_time'] > show['start_time']:
+                previous['end_time'] = show['start_time']
+            last[owner] = show
+
+
+def seed_database(db, venues, artists, shows, seed=0, anchor=None, reset=False):
+    # Writes the generated catalog through Core executemany. Refuses to
+    # touch a database that already holds venues unless reset is set.
+    from counters import rebuild
+    from models import Venue
+    if reset:
+        db.drop_all()
+    db.create_all()
+    if not reset and db.session.query(Venue.id).first() is not None:
+        raise RuntimeError('The database already holds venues; use --reset to drop and reseed it.')
+    data = generate(venues, artists, shows, seed, anchor)
+    tables = db.metadata.tables
+    for name in ('Genre', 'Venue', 'venue_genres', 'Artist', 'artist_genres', 'shows'):
+        rows = data[name]
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            db.session.execute(tables[name].insert(), rows[start:start + INSERT_CHUNK_SIZE])
+    if db.engine.dialect.name == 'postgresql':
+        # Explicit ids leave the serial sequences behind.
+        for name in ('Genre', 'Venue', 'Artist', 'shows'):
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), COALESCE(MAX(id), 1)) FROM \"%s\"" % (name, name)
+            ))
+    rebuild()
+    db.session.commit()
+    return dict((name, len(rows)) for name, rows in data.items())
+
+
+def add_arguments(parser):
+    parser.add_argument('--venues', type=int, default=DEFAULT_SIZES['venues'])
+    parser.add_argument('--artists', type=int, default=DEFAULT_SIZES['artists'])
+    parser.add_argument('--shows', type=int, default=DEFAULT_SIZES['shows'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anchor', type=datetime.fromisoformat,
+                        help='Date the show times are spread around; defaults to today.')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed the database named by DATABASE_URL with a synthetic catalog.')
+    add_arguments(parser)
+    parser.add_argument('--reset', action='store_true', help='Drop and recreate every table first.')
+    args = parser.parse_args(argv)
+    from app import app
+    from models import db
+    with app.app_context():
+        counts = seed_database(db, args.venues, args.artists, args.shows, args.seed, args.anchor, args.reset)
+    print(', '.join('%s=%d' % item for item in sorted(counts.items())))
+
+
+if __name__ == '__main__':
+    main()
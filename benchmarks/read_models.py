@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import generate
+from benchmarks.run import StatementCounter, git_commit
+
+#----------------------------------------------------------------------------#
+# Read model allocation benchmark.
+#
+# Loads venue and artist detail records the way the views did before the
+# slotted read models, an ORM entity copied into a dict with its genre
+# names, against the read models:
+#
+#   orm         Venue.query...first() with its genres selectin loaded,
+#               copied by dict(venue.__dict__)
+#   read_model  queries.venue_detail() / artist_detail()
+#
+# Each run looks up --lookups ids in one session, as a request or a job
+# holding its session would, and reports per lookup the time, the SQL
+# statements, the peak traced allocation and what is still allocated
+# before the session is removed (the identity map keeps ORM entities).
+#----------------------------------------------------------------------------#
+
+DEFAULT_SIZES = {'venues': 2000, 'artists': 2000, 'shows': 20000}
+
+QUICK_SIZES = {'venues': 100, 'artists': 100, 'shows': 500}
+
+DEFAULT_LOOKUPS = 1000
+
+
+def orm_detail(db, model):
+    def load(id):
+        owner = model.query.options(db.selectinload(model.genres)).filter_by(id=id, deleted_at=None).first()
+        data = dict(owner.__dict__)
+        data['genres'] = [genre.name for genre in owner.genres]
+        return data
+    return load
+
+
+def measure(db, load, ids):
+    # (seconds, peak bytes, retained bytes) for one pass over ids
+    db.session.remove()
+    started = time.perf_counter()
+    for id in ids:
+        load(id)
+    elapsed = time.perf_counter() - started
+    db.session.remove()
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        results = [load(id) for id in ids]
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del results
+    db.session.remove()
+    return elapsed, peak - baseline, current - baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare ORM entities with the slotted detail read models.')
+    parser.add_argument('--venues', type=int, default=DEFAULT_SIZES['venues'])
+    parser.add_argument('--artists', type=int, default=DEFAULT_SIZES['artists'])
+    parser.add_argument('--shows', type=int, default=DEFAULT_SIZES['shows'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS, help='Records loaded per run.')
+    parser.add_argument('--database-url', help='Defaults to a fresh SQLite file in the temp directory.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse an already seeded database.')
+    parser.add_argument('--quick', action='store_true', help='Tiny catalog and 50 lookups, as a smoke test.')
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>-read_models.json.')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.venues, args.artists, args.shows = QUICK_SIZES['venues'], QUICK_SIZES['artists'], QUICK_SIZES['shows']
+        args.lookups = 50
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), 'fyyur-read-models.db')
+        if not args.no_seed and os.path.exists(path):
+            os.remove(path)
+        database_url = 'sqlite:///' + path
+    # config.py reads the environment at import time.
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['CACHE_TYPE'] = 'null'
+    os.environ['PROFILING_ENABLED'] = 'false'
+    os.environ['JOB_EXECUTOR_THREADS'] = '0'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from models import db, Venue, Artist
+    from queries import venue_detail, artist_detail
+
+    sizes = {'venues': args.venues, 'artists': args.artists, 'shows': args.shows}
+    if not args.no_seed:
+        with app.app_context():
+            generate.seed_database(db, args.venues, args.artists, args.shows, args.seed,
+                                   reset=args.database_url is not None)
+            db.session.commit()
+
+    counter = StatementCounter()
+    event.listen(Engine, 'after_cursor_execute', counter)
+    loaders = {
+        'venue': (args.venues, {'orm': orm_detail(db, Venue), 'read_model': venue_detail}),
+        'artist': (args.artists, {'orm': orm_detail(db, Artist), 'read_model': artist_detail}),
+    }
+    cases = {}
+    with app.app_context():
+        for kind, (count, approaches) in sorted(loaders.items()):
+            ids = [index % count + 1 for index in range(args.lookups)]
+            for approach, load in sorted(approaches.items()):
+                before = counter.count
+                elapsed, peak, retained = measure(db, load, ids)
+                # measure() makes two passes
+                statements = (counter.count - before) / 2.0
+                cases['%s_%s' % (kind, approach)] = {
+                    'lookups': len(ids),
+                    'us_per_lookup': round(elapsed / len(ids) * 1e6, 2),
+                    'sql_per_lookup': round(statements / len(ids), 2),
+                    'peak_kib': round(peak / 1024.0, 1),
+                    'retained_bytes_per_lookup': round(retained / float(len(ids))),
+                }
+            orm, read_model = cases[kind + '_orm'], cases[kind + '_read_model']
+            read_model['peak_ratio'] = round(read_model['peak_kib'] / orm['peak_kib'], 3)
+    for name, result in sorted(cases.items()):
+        print('%-18s %8.1fus  sql %4.2f  peak %9.1fKiB  retained %7dB/lookup' % (
+            name, result['us_per_lookup'], result['sql_per_lookup'], result['peak_kib'],
+            result['retained_bytes_per_lookup']
+        ))
+
+    report = {
+        'commit': git_commit(),
+        'database': database_url.split(':', 1)[0],
+        'dataset': dict(sizes, seed=args.seed),
+        'cases': cases,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', '%s-read_models.json' % (report['commit'] or 'local')
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+
+from benchmarks import generate
+
+#----------------------------------------------------------------------------#
+# Route benchmark.
+#
+# Seeds a synthetic catalog, then hits every route in ROUTES in turn,
+# either sequentially through the Flask test client or over HTTP at a
+# given concurrency. Each route gets its own batch, so the SQL statements
+# counted during the batch (in-process server only) divide cleanly into a
+# per-request figure. Latency percentiles, SQL counts and RSS are written
+# to JSON; compare two runs with benchmarks/compare.py.
+#----------------------------------------------------------------------------#
+
+# (endpoint, method, path, form data). Placeholders are filled per request
+# from the seeded catalog.
+ROUTES = [
+    ('index', 'GET', '/', None),
+    ('venues', 'GET', '/venues', None),
+    ('venues_by_state', 'GET', '/venues?state={state}', None),
+    ('search_venues', 'POST', '/venues/search', {'search_term': '{term}'}),
+    ('show_venue', 'GET', '/venues/{venue}', None),
+    ('venue_upcoming_shows', 'GET', '/venues/{venue}/upcoming_shows?offset=20', None),
+    ('venue_past_shows', 'GET', '/venues/{venue}/past_shows?offset=20', None),
+    ('venue_availability', 'GET', '/venues/{venue}/availability', None),
+    ('nearby_venues', 'GET', '/venues/nearby?lat={lat}&lng={lng}', None),
+    ('create_venue_form', 'GET', '/venues/create', None),
+    ('edit_venue', 'GET', '/venues/{venue}/edit', None),
+    ('artists', 'GET', '/artists', None),
+    ('artists_deep', 'GET', '/artists?after={artists_deep}', None),
+    ('search_artists', 'POST', '/artists/search', {'search_term': '{term}'}),
+    ('show_artist', 'GET', '/artists/{artist}', None),
+    ('artist_upcoming_shows', 'GET', '/artists/{artist}/upcoming_shows?offset=20', None),
+    ('artist_past_shows', 'GET', '/artists/{artist}/past_shows?offset=20', None),
+    ('create_artist_form', 'GET', '/artists/create', None),
+    ('edit_artist', 'GET', '/artists/{artist}/edit', None),
+    ('shows', 'GET', '/shows', None),
+    ('shows_deep', 'GET', '/shows?after={shows_deep}', None),
+    ('nearby_shows', 'GET', '/shows/nearby?lat={lat}&lng={lng}', None),
+    ('shows_calendar_page', 'GET', '/shows/calendar?bucket=week&city={city}', None),
+    ('create_shows', 'GET', '/shows/create', None),
+    ('cache_stats', 'GET', '/cache/stats', None),
+    ('healthz_db', 'GET', '/healthz/db', None),
+    ('metrics', 'GET', '/metrics', None),
+    ('api.list_venues', 'GET', '/api/v1/venues', None),
+    ('api.get_venue', 'GET', '/api/v1/venues/{venue}', None),
+    ('api.list_artists', 'GET', '/api/v1/artists', None),
+    ('api.get_artist', 'GET', '/api/v1/artists/{artist}', None),
+    ('api.list_shows', 'GET', '/api/v1/shows', None),
+    ('api.get_show', 'GET', '/api/v1/shows/{show}', None),
+    ('api.shows_calendar_counts', 'GET', '/api/v1/shows/calendar?bucket=month&genre={genre}', None),
+    ('exporter.export', 'GET', '/export/shows.csv?city={city}', None),
+]
+
+# Only run with --writes; they grow the catalog as they go. The DELETE
+# routes are left out so every run sees the same rows.
+WRITE_ROUTES = [
+    ('create_venue_submission', 'POST', '/venues/create', {
+        'name': 'Bench Venue {n}', 'city': '{city}', 'state': '{state}', 'address': '1 Bench St',
+        'phone': '555-555-5555', 'genres': '{genre}', 'facebook_link': 'https://www.facebook.com/bench',
+        'image_link': 'https://images.example.com/bench.jpg', 'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }),
+    ('edit_venue_submission', 'POST', '/venues/{venue}/edit', {
+        'name': 'Edited Venue {n}', 'city': '{city}', 'state': '{state}', 'address': '2 Bench St',
+        'phone': '555-555-5555', 'genres': '{genre}', 'facebook_link': 'https://www.facebook.com/bench',
+        'image_link': 'https://images.example.com/bench.jpg', 'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }),
+    ('create_artist_submission', 'POST', '/artists/create', {
+        'name': 'Bench Artist {n}', 'city': '{city}', 'state': '{state}', 'phone': '555-555-5555',
+        'genres': '{genre}', 'facebook_link': 'https://www.facebook.com/bench',
+        'image_link': 'https://images.example.com/bench.jpg', 'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }),
+    ('edit_artist_submission', 'POST', '/artists/{artist}/edit', {
+        'name': 'Edited Artist {n}', 'city': '{city}', 'state': '{state}', 'phone': '555-555-5555',
+        'genres': '{genre}', 'facebook_link': 'https://www.facebook.com/bench',
+        'image_link': 'https://images.example.com/bench.jpg', 'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }),
+    ('create_show_submission', 'POST', '/shows/create', {
+        'venue_id': '{venue}', 'artist_id': '{artist}', 'start_time': '{start_time}',
+    }),
+]
+
+QUICK_SIZES = {'venues': 50, 'artists': 100, 'shows': 500}
+
+# The *_deep routes open this page of the keyset listings, to compare with
+# page 1; a catalog with fewer pages gets its last one.
+DEEP_PAGE = 10000
+
+
+class StatementCounter(object):
+    # Counts cursor executes on every engine of this process.
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Catalog(object):
+    # Fills route placeholders with rows known to exist.
+
+    def __init__(self, sizes, seed, cursors=None):
+        self.sizes = sizes
+        self.cursors = cursors or {}
+        self.rng = random.Random(seed)
+        self.numbers = itertools.count(1)
+        self._lock = threading.Lock()
+        from geo import Gazetteer
+        self.gazetteer = Gazetteer()
+        self.gazetteer.load(generate.GAZETTEER_PATH)
+
+    def values(self):
+        with self._lock:
+            number = next(self.numbers)
+            city, state = self.rng.choice(generate.CITIES)
+            latitude, longitude = self.gazetteer.lookup(city, state)
+            return {
+                'venue': self.rng.randint(1, max(self.sizes['venues'], 1)),
+                'artist': self.rng.randint(1, max(self.sizes['artists'], 1)),
+                'show': self.rng.randint(1, max(self.sizes['shows'], 1)),
+                'city': city, 'state': state, 'lat': latitude, 'lng': longitude,
+                'genre': self.rng.choice(generate.GENRES),
+                'term': self.rng.choice(generate.WORDS + [city]).lower()[:4],
+                # One show a day, so created shows never double-book.
+                'start_time': (datetime(2030, 1, 1, 20) + timedelta(days=number)).isoformat(' '),
+                'n': number,
+                **self.cursors
+            }
+
+    def request(self, method, path, data):
+        values = self.values()
+        path = path.format(**values)
+        if data is not None:
+            data = dict((key, value.format(**values)) for key, value in data.items())
+        return method, path, data
+
+
+def deep_cursors(page):
+    # ({route: ?after= cursor}, {route: page reached}) for the *_deep routes.
+    from models import db
+    from queries import ARTIST_KEYS, LISTING_PAGE_SIZE, SHOW_KEYS, artists_query, encode_cursor, shows_query
+    cursors, pages = {}, {}
+    for name, query, keys in (('artists_deep', artists_query, ARTIST_KEYS), ('shows_deep', shows_query, SHOW_KEYS)):
+        rows = query().limit(None).order_by(None).with_entities(*keys).order_by(*keys)
+        last_page = max(-(-rows.count() // LISTING_PAGE_SIZE), 1)
+        pages[name] = min(page, last_page)
+        row = rows.offset((pages[name] - 1) * LISTING_PAGE_SIZE - 1).first() if pages[name] > 1 else None
+        cursors[name] = encode_cursor(*row) if row else ''
+    return cursors, pages
+
+
+def client_sender(app):
+    client = app.test_client()
+
+    def send(method, path, data):
+        response = client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code
+    return send
+
+
+class NoRedirect(HTTPRedirectHandler):
+    # Time the redirect itself, like the test client, not the page behind it.
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def http_sender(base_url):
+    opener = build_opener(NoRedirect)
+
+    def send(method, path, data):
+        body = urlencode(data).encode('utf-8') if data is not None else None
+        request = Request(base_url + path, data=body, method=method)
+        try:
+            with opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except HTTPError as e:
+            return e.code
+    return send
+
+
+def run_route(send, catalog, route, requests, warmup, concurrency, counter):
+    name, method, path, data = route
+    for _ in range(warmup):
+        send(*catalog.request(method, path, data))
+    latencies = []
+    statuses = []
+
+    def one(_):
+        request = catalog.request(method, path, data)
+        started = time.perf_counter()
+        try:
+            status = send(*request)
+        except Exception:
+            status = None
+        latencies.append(time.perf_counter() - started)
+        statuses.append(status)
+
+    statements = counter.count if counter else None
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, range(requests)))
+    else:
+        for index in range(requests):
+            one(index)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    rss = rss_mb() if counter else None
+    errors = sum(1 for status in statuses if status is None or status >= 400)
+    return {
+        'method': method,
+        'path': path,
+        'requests': requests,
+        'errors': errors,
+        'rps': round(requests / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'sql_per_request': round((counter.count - statements) / float(requests), 2) if counter else None,
+        'rss_mb': round(rss, 1) if rss is not None else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every route against a synthetic catalog.')
+    generate.add_arguments(parser)
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrent requests in http mode.')
+    parser.add_argument('--requests', type=int, default=50, help='Measured requests per route.')
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per route.')
+    parser.add_argument('--url', help='Benchmark an already running server (http mode, no SQL counts).')
+    parser.add_argument('--database-url', help='Defaults to a fresh SQLite file in the temp directory.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse an already seeded database.')
+    parser.add_argument('--cache', choices=['null', 'simple', 'redis'], default='null',
+                        help='Page cache backend; null measures the uncached path.')
+    parser.add_argument('--writes', action='store_true', help='Also run the create and edit submissions.')
+    parser.add_argument('--routes', help='Comma separated endpoint names to run.')
+    parser.add_argument('--deep-page', type=int, default=DEEP_PAGE,
+                        help='Listing page the *_deep routes open; 500k shows have 10,000.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Run with PROFILING_ENABLED, which also benchmarks /metrics.')
+    parser.add_argument('--quick', action='store_true', help='Tiny catalog and few requests, as a smoke test.')
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>-<mode>.json.')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.venues, args.artists, args.shows = QUICK_SIZES['venues'], QUICK_SIZES['artists'], QUICK_SIZES['shows']
+        args.requests, args.warmup = 5, 1
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), 'fyyur-bench.db')
+        if not args.no_seed and os.path.exists(path):
+            os.remove(path)
+        database_url = 'sqlite:///' + path
+    # config.py reads the environment at import time.
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['CACHE_TYPE'] = args.cache
+    os.environ['PROFILING_ENABLED'] = 'true' if args.profile else 'false'
+    # Queued jobs stay in the table; worker threads would skew the SQL counts.
+    os.environ['JOB_EXECUTOR_THREADS'] = '0'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from models import db
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.debug = False
+
+    sizes = {'venues': args.venues, 'artists': args.artists, 'shows': args.shows}
+    if not args.no_seed:
+        started = time.perf_counter()
+        with app.app_context():
+            generate.seed_database(db, args.venues, args.artists, args.shows, args.seed, args.anchor,
+                                   reset=args.database_url is not None)
+        print('seeded %(venues)d venues, %(artists)d artists, %(shows)d shows' % sizes, end='')
+        print(' in %.1fs' % (time.perf_counter() - started))
+
+    routes = ROUTES + (WRITE_ROUTES if args.writes else [])
+    if not args.profile:
+        routes = [route for route in routes if route[0] != 'metrics']
+    if args.routes:
+        wanted = set(name.strip() for name in args.routes.split(','))
+        routes = [route for route in routes if route[0] in wanted]
+
+    counter = None
+    server = None
+    if args.url:
+        send = http_sender(args.url.rstrip('/'))
+    else:
+        counter = StatementCounter()
+        event.listen(Engine, 'after_cursor_execute', counter)
+        if args.mode == 'http':
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            send = http_sender('http://127.0.0.1:%d' % server.server_port)
+        else:
+            send = client_sender(app)
+    concurrency = args.concurrency if args.mode == 'http' else 1
+
+    with app.app_context():
+        cursors, deep_pages = deep_cursors(args.deep_page)
+        db.session.remove()
+    for name, page in sorted(deep_pages.items()):
+        print('%s opens page %d' % (name, page))
+    catalog = Catalog(sizes, args.seed, cursors)
+    results = {}
+    try:
+        for route in routes:
+            results[route[0]] = result = run_route(
+                send, catalog, route, args.requests, args.warmup, concurrency, counter
+            )
+            print('%-26s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  sql %5s  errors %d' % (
+                route[0], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['sql_per_request'], result['errors']
+            ))
+    finally:
+        if server is not None:
+            server.shutdown()
+        if counter is not None:
+            event.remove(Engine, 'after_cursor_execute', counter)
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'mode': args.mode,
+        'target': args.url or 'in-process',
+        'concurrency': concurrency,
+        'requests_per_route': args.requests,
+        'cache': args.cache,
+        'database': database_url.split(':', 1)[0],
+        'dataset': dict(sizes, seed=args.seed),
+        'deep_pages': deep_pages,
+        'python': platform.python_version(),
+        'peak_rss_mb': round(peak_rss_mb(), 1) if counter else None,
+        'routes': results,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results',
+        '%s-%s.json' % (report['commit'] or 'local', args.mode)
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % output)
+    return 1 if any(result['errors'] for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
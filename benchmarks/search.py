@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import generate
+from benchmarks.calendar import seed_shows
+from benchmarks.run import StatementCounter, git_commit, percentile
+
+#----------------------------------------------------------------------------#
+# Search benchmark.
+#
+# Streams a large catalog (1M venues and 1M artists by default, in
+# INSERT_CHUNK_SIZE batches so memory stays flat) and times the venue and
+# artist search pages for each term in terms(), first page and a deep page:
+#
+#   common    a name word roughly one row in eight contains
+#   rare      the id at the end of one name, a single hit
+#   city      a city name, matched on the city column
+#   genre     a genre name, matched through the genre links
+#   none      no hit at all, the worst case for a scan
+#   wildcard  a lone '_', taken literally, so no hit either
+#
+# Names and cities come from the generate.py vocabulary. Seeding 2M rows
+# takes a few minutes; --no-seed reuses a database seeded earlier.
+#
+# The report also keeps each search statement's query plan. On Postgres
+# with at least INDEXED_ROWS rows, a plan that scans the venue or artist
+# table sequentially instead of using the pg_trgm indexes fails the run.
+#----------------------------------------------------------------------------#
+
+DEFAULT_SIZES = {'venues': 1000000, 'artists': 1000000, 'shows': 100000}
+
+QUICK_SIZES = {'venues': 2000, 'artists': 2000, 'shows': 1000}
+
+PAGES = (1, 10)
+
+# Below this many rows Postgres may rightly prefer a sequential scan.
+INDEXED_ROWS = 100000
+
+SEQ_SCAN = re.compile(r'Seq Scan on "(Venue|Artist)"')
+
+
+def terms(sizes):
+    city, state = generate.CITIES[3]
+    return {
+        'common': generate.WORDS[1].lower(),
+        # Names end in the id, so only one row ends in this number.
+        'rare': ' %d' % (sizes['venues'] // 2 + 1),
+        'city': city,
+        'genre': generate.GENRES[10],
+        'none': 'zzzz',
+        'wildcard': '_',
+    }
+
+
+def owner_rows(kind, count, seed):
+    # (owner rows, genre link rows) in INSERT_CHUNK_SIZE chunks.
+    rng = random.Random('%s-%s' % (seed, kind))
+    genre_weights = generate.zipf_weights(len(generate.GENRES), 0.8)
+    city_weights = generate.zipf_weights(len(generate.CITIES), 1.1)
+    kinds = generate.VENUE_KINDS if kind == 'venue' else generate.ARTIST_KINDS
+    flag = 'seeking_talent' if kind == 'venue' else 'seeking_venue'
+    owners, links = [], []
+    for id in range(1, count + 1):
+        city, state = rng.choices(generate.CITIES, city_weights)[0]
+        owners.append({
+            'id': id, 'name': generate._name(rng, kinds, id), 'city': city, 'state': state,
+            flag: rng.random() < 0.5, 'version': 1,
+        })
+        links.extend({kind + '_id': id, 'genre_id': genre} for genre in generate._genres(rng, genre_weights))
+        if len(owners) == generate.INSERT_CHUNK_SIZE:
+            yield owners, links
+            owners, links = [], []
+    if owners:
+        yield owners, links
+
+
+def seed_catalog(db, venues, artists, shows, seed, first_day):
+    tables = db.metadata.tables
+    for kind, table, count in (('venue', 'Venue', venues), ('artist', 'Artist', artists)):
+        for owners, links in owner_rows(kind, count, seed):
+            db.session.execute(tables[table].insert(), owners)
+            db.session.execute(tables[kind + '_genres'].insert(), links)
+            db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        for name in ('Venue', 'Artist'):
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), COALESCE(MAX(id), 1)) FROM \"%s\"" % (name, name)
+            ))
+    seed_shows(db, venues, artists, shows, first_day)
+
+
+def search_plan(db, model, term):
+    # The plan of the search statement, one line per row.
+    from queries import search_query
+    compiled = search_query(model, term).statement.compile(db.engine)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    prefix = 'EXPLAIN ' if db.engine.dialect.name == 'postgresql' else 'EXPLAIN QUERY PLAN '
+    rows = db.session.connection().exec_driver_sql(prefix + str(compiled), params).fetchall()
+    db.session.rollback()
+    return [str(row[-1]) for row in rows]
+
+
+def run_case(client, counter, path, term, page, requests):
+    latencies = []
+    statements = 0
+    errors = 0
+    for index in range(requests):
+        before = counter.count
+        started = time.perf_counter()
+        response = client.post(path, data={'search_term': term, 'page': page})
+        latencies.append(time.perf_counter() - started)
+        statements += counter.count - before
+        errors += response.status_code != 200
+        response.close()
+    latencies.sort()
+    return {
+        'path': path,
+        'term': term,
+        'page': page,
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'sql_per_request': round(statements / float(requests), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark venue and artist search over a large catalog.')
+    parser.add_argument('--venues', type=int, default=DEFAULT_SIZES['venues'])
+    parser.add_argument('--artists', type=int, default=DEFAULT_SIZES['artists'])
+    parser.add_argument('--shows', type=int, default=DEFAULT_SIZES['shows'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=10, help='Measured requests per case.')
+    parser.add_argument('--database-url', help='Defaults to a fresh SQLite file in the temp directory.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse an already seeded database.')
+    parser.add_argument('--quick', action='store_true', help='Tiny catalog and few requests, as a smoke test.')
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>-search.json.')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.venues, args.artists, args.shows = QUICK_SIZES['venues'], QUICK_SIZES['artists'], QUICK_SIZES['shows']
+        args.requests = 3
+    if args.artists < args.venues:
+        parser.error('--artists must be at least --venues')
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), 'fyyur-search.db')
+        if not args.no_seed and os.path.exists(path):
+            os.remove(path)
+        database_url = 'sqlite:///' + path
+    # config.py reads the environment at import time.
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['CACHE_TYPE'] = 'null'
+    os.environ['PROFILING_ENABLED'] = 'false'
+    os.environ['JOB_EXECUTOR_THREADS'] = '0'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from counters import rebuild
+    from models import db, Venue, Artist
+    app.debug = False
+
+    sizes = {'venues': args.venues, 'artists': args.artists, 'shows': args.shows}
+    if not args.no_seed:
+        started = time.perf_counter()
+        # Upcoming, so the counters the results carry are not all zero.
+        first_day = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        with app.app_context():
+            generate.seed_database(db, 0, 0, 0, reset=args.database_url is not None)
+            seed_catalog(db, args.venues, args.artists, args.shows, args.seed, first_day)
+            rebuild()
+            db.session.commit()
+        print('seeded %(venues)d venues, %(artists)d artists, %(shows)d shows' % sizes, end='')
+        print(' in %.1fs' % (time.perf_counter() - started))
+
+    counter = StatementCounter()
+    event.listen(Engine, 'after_cursor_execute', counter)
+    client = app.test_client()
+
+    cases = {}
+    for name, term in sorted(terms(sizes).items()):
+        for kind in ('venues', 'artists'):
+            for page in PAGES:
+                cases['%s_%s_page%d' % (kind, name, page)] = run_case(
+                    client, counter, '/%s/search' % kind, term, page, args.requests
+                )
+    for name, result in sorted(cases.items()):
+        print('%-28s p50 %9.2fms  p95 %9.2fms  sql %5.2f  errors %d' % (
+            name, result['p50_ms'], result['p95_ms'], result['sql_per_request'], result['errors']
+        ))
+
+    plans = {}
+    scanned = []
+    check_index = database_url.startswith('postgres') and min(args.venues, args.artists) >= INDEXED_ROWS
+    with app.app_context():
+        for name, term in sorted(terms(sizes).items()):
+            for kind, model in (('venues', Venue), ('artists', Artist)):
+                plans['%s_%s' % (kind, name)] = plan = search_plan(db, model, term)
+                if check_index and any(SEQ_SCAN.search(line) for line in plan):
+                    scanned.append('%s_%s' % (kind, name))
+
+    report = {
+        'commit': git_commit(),
+        'database': database_url.split(':', 1)[0],
+        'dataset': dict(sizes, seed=args.seed),
+        'cases': cases,
+        'plans': plans,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', '%s-search.json' % (report['commit'] or 'local')
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % output)
+    if scanned:
+        raise SystemExit('sequential scan instead of the trigram indexes: %s' % ', '.join(scanned))
+
+
+if __name__ == '__main__':
+    main()
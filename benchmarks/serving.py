@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from benchmarks import generate
+from benchmarks.run import git_commit, percentile
+
+#----------------------------------------------------------------------------#
+# Sync vs async serving.
+#
+# Starts one server process per mode and drives the async read routes at
+# the same concurrency for a fixed duration:
+#
+#   sync   gunicorn, one worker with --concurrency threads, app:app
+#   async  uvicorn, one worker, asgi:application
+#
+# Throughput per core is requests served per CPU second of the server
+# process tree. Connections held is the peak number of backends open on
+# the benchmark database (Postgres only; SQLite has no server side).
+#----------------------------------------------------------------------------#
+
+READ_PATHS = [
+    '/venues', '/artists', '/shows',
+    '/venues/{venue}', '/artists/{artist}',
+]
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid):
+    pids = [pid]
+    for candidate in os.listdir('/proc'):
+        if candidate.isdigit():
+            try:
+                with open('/proc/%s/stat' % candidate) as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(candidate))
+            except (OSError, IndexError, ValueError):
+                pass
+    return pids
+
+
+def cpu_seconds(pid):
+    # user + system time of the process and its direct children
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open('/proc/%d/stat' % member) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / float(CLOCK_TICKS)
+
+
+def server_command(mode, port, concurrency):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '--workers', '1', '--threads', str(concurrency),
+                '--bind', '127.0.0.1:%d' % port, '--log-level', 'warning', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', '--workers', '1', '--host', '127.0.0.1',
+            '--port', str(port), '--log-level', 'warning', '--no-access-log', 'asgi:application']
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urlopen(url, timeout=2) as response:
+                response.read()
+                return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError('server at %s did not start' % url)
+
+
+class ConnectionSampler(threading.Thread):
+    # Peak backends on the benchmark database, sampled every 100ms.
+
+    def __init__(self, database_url):
+        super(ConnectionSampler, self).__init__(daemon=True)
+        self.engine = create_engine(database_url, poolclass=NullPool)
+        self.query = text(
+            'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()'
+        )
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        with self.engine.connect() as connection:
+            while not self.stopped.wait(0.1):
+                self.peak = max(self.peak, connection.execute(self.query).scalar())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.engine.dispose()
+
+
+def drive(base_url, sizes, concurrency, duration, seed):
+    catalog_rng = random.Random(seed)
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + duration
+
+    def path():
+        with lock:
+            return catalog_rng.choice(READ_PATHS).format(
+                venue=catalog_rng.randint(1, sizes['venues']),
+                artist=catalog_rng.randint(1, sizes['artists'])
+            )
+
+    def worker(_):
+        while time.perf_counter() < deadline:
+            url = base_url + path()
+            started = time.perf_counter()
+            try:
+                with urlopen(url, timeout=60) as response:
+                    response.read()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    latencies.sort()
+    return latencies, errors[0]
+
+
+def bench_mode(mode, args, sizes, env):
+    port = free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(server_command(mode, port, args.concurrency), cwd=root, env=env)
+    base_url = 'http://127.0.0.1:%d' % port
+    sampler = None
+    try:
+        wait_until_up(base_url + '/venues')
+        drive(base_url, sizes, args.concurrency, min(args.duration, 2), args.seed)  # warm up
+        if env['DATABASE_URL'].startswith('postgresql'):
+            sampler = ConnectionSampler(env['DATABASE_URL'])
+            sampler.start()
+        cpu_before = cpu_seconds(server.pid)
+        started = time.perf_counter()
+        latencies, errors = drive(base_url, sizes, args.concurrency, args.duration, args.seed)
+        elapsed = time.perf_counter() - started
+        cpu = cpu_seconds(server.pid) - cpu_before
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        server.terminate()
+        server.wait()
+    return {
+        'server': server_command(mode, port, args.concurrency)[2],
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'cpu_seconds': round(cpu, 2),
+        'requests_per_cpu_second': round(len(latencies) / cpu, 1) if cpu else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'peak_connections': sampler.peak if sampler is not None else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare sync (gunicorn) and async (uvicorn) serving of the read routes.')
+    generate.add_arguments(parser)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per mode.')
+    parser.add_argument('--database-url', help='Defaults to a fresh SQLite file in the temp directory.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse an already seeded database.')
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--output', help='Defaults to benchmarks/results/<commit>-serving.json.')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), 'fyyur-serving.db')
+        if not args.no_seed and os.path.exists(path):
+            os.remove(path)
+        database_url = 'sqlite:///' + path
+    env = dict(os.environ, DATABASE_URL=database_url, CACHE_TYPE='null', PROFILING_ENABLED='false',
+               JOB_EXECUTOR_THREADS='0',
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'))
+    sizes = {'venues': args.venues, 'artists': args.artists, 'shows': args.shows}
+    if not args.no_seed:
+        os.environ.update(DATABASE_URL=database_url)
+        from app import app
+        from models import db
+        with app.app_context():
+            generate.seed_database(db, args.venues, args.artists, args.shows, args.seed, args.anchor,
+                                   reset=args.database_url is not None)
+
+    results = {}
+    for mode in args.modes.split(','):
+        results[mode] = result = bench_mode(mode, args, sizes, env)
+        print('%-5s %8.1f req/s  %8.1f req/cpu-s  p95 %8.2fms  connections %s  errors %d' % (
+            mode, result['rps'], result['requests_per_cpu_second'] or 0, result['p95_ms'] or 0,
+            result['peak_connections'], result['errors']
+        ))
+
+    report = {
+        'commit': git_commit(),
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'database': database_url.split(':', 1)[0],
+        'dataset': dict(sizes, seed=args.seed),
+        'modes': results,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', '%s-serving.json' % (report['commit'] or 'local')
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % output)
+
+
+if __name__ == '__main__':
+    main()
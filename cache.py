@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session
+
+from routing import read_from_primary
+
+#----------------------------------------------------------------------------#
+# Rendered page cache for the read-heavy listing and detail views.
+#
+# Entries are keyed on the request path plus the current version of every
+# namespace the page depends on ('venues', 'venue:4', ...). Invalidation
+# bumps a namespace version, so stale entries simply stop being addressed
+# and age out of the backend; no key scans are needed.
+#
+# With read replicas, a replica may not have the write behind a bump yet.
+# For DB_REPLICA_PIN_SECONDS after a bump, pages and fragments depending on
+# the namespace are rendered from the primary, so what is stored under the
+# new version has the write in it.
+#----------------------------------------------------------------------------#
+
+
+class NullBackend(object):
+
+    def get(self, key):
+        return None
+
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def set_many(self, mapping, timeout=None):
+        pass
+
+    def incr(self, key):
+        return 0
+
+
+class LRUBackend(object):
+    # In-process LRU with a per-entry TTL. Counters live outside the LRU so
+    # a namespace version is never evicted back to zero.
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set_many(self, mapping, timeout=None):
+        for key, value in mapping.items():
+            self.set(key, value, timeout)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+            return value
+
+
+class RedisBackend(object):
+    # Works with any client exposing get/mget/set/incr/pipeline, e.g.
+    # redis.Redis or fakeredis.FakeRedis.
+
+    def __init__(self, client=None, url=None, default_timeout=300, prefix='fyyur:'):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.default_timeout = default_timeout
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def get_many(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [value.decode('utf-8') if isinstance(value, bytes) else value for value in values]
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        self.client.set(self.prefix + key, value, ex=timeout or None)
+
+    def set_many(self, mapping, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        pipeline = self.client.pipeline()
+        for key, value in mapping.items():
+            pipeline.set(self.prefix + key, value, ex=timeout or None)
+        pipeline.execute()
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class PageCache(object):
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.timeout = None
+        self.replica_lag = 0
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'simple')
+        self.timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        if cache_type == 'simple':
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024), self.timeout)
+        elif cache_type == 'redis':
+            self.backend = RedisBackend(url=app.config['CACHE_REDIS_URL'], default_timeout=self.timeout)
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError('Unknown CACHE_TYPE %r' % cache_type)
+        if app.config.get('SQLALCHEMY_REPLICA_URIS'):
+            self.replica_lag = app.config.get('DB_REPLICA_PIN_SECONDS', 10)
+        app.extensions['page_cache'] = self
+
+    def _versions(self, namespaces):
+        # The namespace versions joined with ':', in one backend round trip
+        # with the recent-bump markers. Within replica_lag seconds of a bump
+        # the rest of the request reads from the primary.
+        keys = ['ns:' + namespace for namespace in namespaces]
+        if self.replica_lag:
+            keys += ['bumped:' + namespace for namespace in namespaces]
+        values = self.backend.get_many(keys)
+        if any(values[len(namespaces):]):
+            read_from_primary()
+        return ':'.join(str(version or 0) for version in values[:len(namespaces)])
+
+    def _key(self, namespaces):
+        return 'page:%s:%s' % (request.full_path, self._versions(namespaces))
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.incr('ns:' + namespace)
+            if self.replica_lag:
+                self.backend.set('bumped:' + namespace, '1', self.replica_lag)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def lookup(self, namespaces):
+        # (key, cached body) for the current request. The key is None when
+        # the request must not be cached: pages with pending flash messages
+        # are per-user.
+        if request.method != 'GET' or session.get('_flashes'):
+            return None, None
+        key = self._key(namespaces)
+        body = self.backend.get(key)
+        if body is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return key, body
+
+    def fragments(self, namespaces, keys):
+        # Values cached with store_fragments() under the current versions of
+        # the namespaces, None where missing. Returns the key prefix to store
+        # the missing ones under as well.
+        prefix = 'fragment:%s:' % self._versions(namespaces)
+        return prefix, self.backend.get_many([prefix + key for key in keys])
+
+    def store_fragments(self, prefix, values):
+        if values:
+            self.backend.set_many(dict((prefix + key, value) for key, value in values.items()), self.timeout)
+
+    def store(self, key, body):
+        if key is not None and isinstance(body, str):
+            self.backend.set(key, body, self.timeout)
+
+    def cached(self, *namespaces):
+        # Cache a view's rendered body. Namespaces may reference the view's
+        # arguments, e.g. cached('venue:{venue_id}').
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key, body = self.lookup([namespace.format(**kwargs) for namespace in namespaces])
+                if body is not None:
+                    return body
+                body = view(*args, **kwargs)
+                self.store(key, body)
+                return body
+            return wrapper
+        return decorator
+
+
+cache = PageCache()
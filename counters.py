@@ -0,0 +1,233 @@
+import sys
+from collections import Counter
+
+import click
+from flask.cli import with_appcontext
+
+from cache import cache
+from models import db, now_utc, Venue, Artist, Show, venue_upcoming_shows, artist_upcoming_shows, upcoming_shows_as_of
+
+#----------------------------------------------------------------------------#
+# Materialized upcoming-show counters.
+#
+# venue_upcoming_shows and artist_upcoming_shows hold each owner's number
+# of shows starting after the as_of watermark; the venue listing and the
+# searches LEFT JOIN them instead of counting shows on every request.
+#
+#   writes  creating, importing or deleting shows applies +/- deltas in
+#           the write's own transaction (INSERT .. ON CONFLICT DO UPDATE,
+#           so concurrent writers add up rather than overwrite)
+#   time    roll_forward() subtracts the shows that started since the
+#           watermark and moves it to now; the job workers run it every
+#           COUNTERS_ROLL_SECONDS (jobs.py), `flask counters roll` by hand
+#   checks  `flask counters check` compares a random sample with a live
+#           COUNT; `flask counters rebuild` recounts everything
+#
+# Between rolls a count still includes shows that started after the last
+# roll, so listings lag real time by at most the roll interval. Shows of
+# soft-deleted venues and artists are not counted: deleting one, hard or
+# soft, goes through drop_owner().
+#----------------------------------------------------------------------------#
+
+# model -> (counter table, its owner column, the Show column for the owner)
+COUNTERS = {
+    Venue: (venue_upcoming_shows, venue_upcoming_shows.c.venue_id, Show.venue_id),
+    Artist: (artist_upcoming_shows, artist_upcoming_shows.c.artist_id, Show.artist_id),
+}
+
+COUNTERPART = {Venue: Artist, Artist: Venue}
+
+
+def upcoming_join(query, model):
+    # LEFT JOIN the model's counters; returns the query and the count column.
+    table, owner, _ = COUNTERS[model]
+    return query.outerjoin(table, owner == model.id), db.func.coalesce(table.c.upcoming, 0)
+
+
+def as_of():
+    # The watermark, or None before the first roll or rebuild.
+    return db.session.execute(db.select(db.func.max(upcoming_shows_as_of.c.as_of))).scalar()
+
+
+def _watermark():
+    # SQL side of as_of(), falling back to the current time.
+    return db.func.coalesce(
+        db.select(db.func.max(upcoming_shows_as_of.c.as_of)).scalar_subquery(), now_utc()
+    )
+
+
+def _live():
+    # Shows whose venue and artist are both not soft-deleted.
+    return db.and_(
+        Show.venue_id.in_(db.select(Venue.id).where(Venue.deleted_at.is_(None))),
+        Show.artist_id.in_(db.select(Artist.id).where(Artist.deleted_at.is_(None))),
+    )
+
+
+def _upsert(table):
+    # Both supported dialects spell INSERT .. ON CONFLICT the same way.
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def adjust(model, deltas):
+    # Add {owner id: delta} to the model's counters, one executemany.
+    deltas = [(id, delta) for id, delta in deltas.items() if delta]
+    if not deltas:
+        return
+    table, owner, _ = COUNTERS[model]
+    insert = _upsert(table)
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=[owner], set_={'upcoming': table.c.upcoming + insert.excluded.upcoming}
+        ),
+        [{owner.name: id, 'upcoming': delta} for id, delta in deltas]
+    )
+
+
+def record_shows(shows, sign=1):
+    # Count new shows, given as (venue_id, artist_id, start_time), that
+    # start after the watermark. sign=-1 uncounts them.
+    watermark = as_of() or now_utc()
+    venues, artists = Counter(), Counter()
+    for venue_id, artist_id, start_time in shows:
+        if start_time > watermark:
+            venues[int(venue_id)] += sign
+            artists[int(artist_id)] += sign
+    adjust(Venue, venues)
+    adjust(Artist, artists)
+
+
+def drop_owner(model, id):
+    # Before deleting a venue or artist, hard or soft: uncount its shows
+    # from the counterparts and remove the owner's own row.
+    table, owner, show_owner = COUNTERS[model]
+    other_owner = COUNTERS[COUNTERPART[model]][2]
+    rows = db.session.execute(
+        db.select(other_owner, db.func.count(Show.id)).where(
+            show_owner == id, Show.start_time > _watermark(), _live()
+        ).group_by(other_owner)
+    )
+    adjust(COUNTERPART[model], dict((other_id, -count) for other_id, count in rows))
+    db.session.execute(table.delete().where(owner == id))
+
+
+def rebuild(now=None):
+    # Recount every owner from scratch and set the watermark to now.
+    now = now or now_utc()
+    for table, owner, show_owner in COUNTERS.values():
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select(
+            [owner.name, 'upcoming'],
+            db.select(show_owner, db.func.count(Show.id)).where(Show.start_time > now, _live()).group_by(show_owner)
+        ))
+    db.session.execute(upcoming_shows_as_of.delete())
+    db.session.execute(upcoming_shows_as_of.insert().values(id=1, as_of=now))
+    return now
+
+
+def roll_forward(now=None):
+    # Uncount the shows that started between the watermark and now, one
+    # UPDATE per counter table over the (start_time, id) index. Returns
+    # the number of counters changed.
+    now = now or now_utc()
+    watermark = as_of()
+    if watermark is None:
+        rebuild(now)
+        return None
+    if now <= watermark:
+        return 0
+    # Claim the window first: a concurrent roll waits on the watermark row
+    # and then matches nothing, so no window is subtracted twice.
+    claimed = db.session.execute(
+        upcoming_shows_as_of.update().where(upcoming_shows_as_of.c.as_of == watermark).values(as_of=now)
+    ).rowcount
+    if not claimed:
+        return 0
+    started = db.and_(Show.start_time > watermark, Show.start_time <= now, _live())
+    changed = 0
+    for table, owner, show_owner in COUNTERS.values():
+        passed = db.select(db.func.count(Show.id)).where(show_owner == owner, started).scalar_subquery()
+        changed += db.session.execute(
+            table.update().where(
+                owner.in_(db.select(show_owner).where(started))
+            ).values(upcoming=table.c.upcoming - passed)
+        ).rowcount
+    return changed
+
+
+def roll():
+    # roll_forward() in its own transaction, dropping the cached listings
+    # if any count moved.
+    changed = roll_forward()
+    db.session.commit()
+    if changed != 0:
+        cache.invalidate('venues')
+    return changed
+
+
+def check(sample=100):
+    # Compare up to `sample` random live venues and artists with a live
+    # COUNT over the same window. Returns (model, id, stored, actual) for
+    # each mismatch.
+    mismatches = []
+    for model, (table, owner, show_owner) in COUNTERS.items():
+        actual = db.select(db.func.count(Show.id)).where(
+            show_owner == model.id, Show.start_time > _watermark(), _live()
+        ).scalar_subquery()
+        query, stored = upcoming_join(db.session.query(model.id), model)
+        rows = query.add_columns(stored, actual).filter(
+            model.deleted_at.is_(None)
+        ).order_by(db.func.random()).limit(sample)
+        mismatches.extend((model, id, stored, actual) for id, stored, actual in rows if stored != actual)
+    return mismatches
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@click.group('counters')
+def counters_command():
+    """Maintain the materialized upcoming-show counters."""
+
+
+@counters_command.command('roll')
+@with_appcontext
+def roll_command():
+    """Move the counters forward past the shows that have started."""
+    changed = roll()
+    click.echo('rebuilt' if changed is None else 'rolled to %s, %d counters changed' % (as_of(), changed))
+
+
+@counters_command.command('rebuild')
+@with_appcontext
+def rebuild_command():
+    """Recount every counter from the shows table."""
+    now = rebuild()
+    db.session.commit()
+    cache.invalidate('venues')
+    click.echo('rebuilt as of %s' % now)
+
+
+@counters_command.command('check')
+@click.option('--sample', default=100, show_default=True, help='Venues and artists to sample, each.')
+@click.option('--fix', is_flag=True, help='Correct the mismatched counters.')
+@with_appcontext
+def check_command(sample, fix):
+    """Compare a sample of counters with a live COUNT."""
+    mismatches = check(sample)
+    watermark = as_of()
+    click.echo('as of %s (%s behind)' % (watermark, now_utc() - watermark if watermark else 'never rolled'))
+    for model, id, stored, actual in mismatches:
+        click.echo('%s %d: counter %d, actual %d' % (model.__tablename__, id, stored, actual), err=True)
+    if fix and mismatches:
+        for model, id, stored, actual in mismatches:
+            adjust(model, {id: actual - stored})
+        db.session.commit()
+        cache.invalidate('venues')
+    click.echo('%d mismatched' % len(mismatches))
+    if mismatches and not fix:
+        sys.exit(1)
@@ -0,0 +1,157 @@
+import csv
+import io
+import sys
+from datetime import datetime
+
+import click
+from flask import Blueprint, Response, abort, request, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from api import dumps
+from models import db, naive_utc, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from routing import read_only
+
+#----------------------------------------------------------------------------#
+# Streaming catalog export.
+#
+# Rows come off a server-side cursor (yield_per) and are encoded and
+# flushed in small batches, so memory stays flat whatever the table size.
+#----------------------------------------------------------------------------#
+
+EXPORT_BATCH_SIZE = 1000
+
+exporter = Blueprint('exporter', __name__)
+
+
+def _genre_list(association, owner_column, model):
+    # Comma separated genre names for one venue or artist, in name order so
+    # exports of the same rows are identical.
+    genres = db.select([Genre.name]).select_from(association).join(
+        Genre, Genre.id == association.c.genre_id
+    ).where(owner_column == model.id)
+    if db.engine.dialect.name == 'postgresql':
+        return genres.with_only_columns([
+            db.func.string_agg(Genre.name, aggregate_order_by(db.literal_column("','"), Genre.name))
+        ]).scalar_subquery()
+    # group_concat has no ORDER BY before SQLite 3.44; it concatenates in
+    # the order an ordered subquery yields.
+    ordered = genres.order_by(Genre.name).correlate(model).subquery()
+    return db.select([db.func.group_concat(ordered.c.name, ',')]).scalar_subquery()
+
+
+def export_query(kind, start=None, end=None, city=None, genre=None):
+    if kind == 'shows':
+        query = db.session.query(
+            Show.id,
+            Show.start_time,
+            Show.end_time,
+            Show.venue_id,
+            Venue.name.label('venue_name'),
+            Show.artist_id,
+            Artist.name.label('artist_name')
+        ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).filter(
+            Venue.deleted_at.is_(None), Artist.deleted_at.is_(None)
+        )
+        if start is not None:
+            query = query.filter(Show.start_time >= start)
+        if end is not None:
+            query = query.filter(Show.start_time < end)
+        if city:
+            query = query.filter(Venue.city == city)
+        if genre:
+            query = query.filter(db.or_(
+                Venue.genres.any(Genre.name == genre), Artist.genres.any(Genre.name == genre)
+            ))
+        return query.order_by(Show.start_time, Show.id)
+
+    if kind == 'venues':
+        model, columns = Venue, (
+            Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+            _genre_list(venue_genres, venue_genres.c.venue_id, Venue).label('genres'),
+            Venue.image_link, Venue.facebook_link, Venue.website_link,
+            Venue.seeking_talent, Venue.seeking_description
+        )
+    elif kind == 'artists':
+        model, columns = Artist, (
+            Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+            _genre_list(artist_genres, artist_genres.c.artist_id, Artist).label('genres'),
+            Artist.image_link, Artist.facebook_link, Artist.website,
+            Artist.seeking_venue, Artist.seeking_description
+        )
+    else:
+        raise ValueError('Unknown export %r' % kind)
+    query = db.session.query(*columns).filter(model.deleted_at.is_(None))
+    if city:
+        query = query.filter(model.city == city)
+    if genre:
+        query = query.filter(model.genres.any(Genre.name == genre))
+    return query.order_by(model.id)
+
+
+def export_lines(query, format, batch_size=EXPORT_BATCH_SIZE):
+    # Yields encoded chunks of at most batch_size rows.
+    rows = query.yield_per(batch_size)
+    fields = [column['name'] for column in query.column_descriptions]
+    buffer = io.StringIO()
+    if format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+    count = 0
+    for row in rows:
+        if format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(dumps(dict(zip(fields, row))).decode('utf-8'))
+            buffer.write('\n')
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _parse_date(value):
+    # Show times are naive UTC, so a zoned bound is converted to match.
+    return naive_utc(datetime.fromisoformat(value)) if value else None
+
+
+@exporter.route('/export/<any(shows, venues, artists):kind>.<any(csv, ndjson):format>')
+@read_only
+def export(kind, format):
+    try:
+        query = export_query(
+            kind,
+            start=_parse_date(request.args.get('from')),
+            end=_parse_date(request.args.get('to')),
+            city=request.args.get('city'),
+            genre=request.args.get('genre')
+        )
+    except ValueError:
+        abort(400)
+    mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(export_lines(query, format)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, format)
+    return response
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(['shows', 'venues', 'artists']))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--from', 'start', help='Only shows starting on or after this ISO date.')
+@click.option('--to', 'end', help='Only shows starting before this ISO date.')
+@click.option('--city')
+@click.option('--genre')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), help='Defaults to stdout.')
+@with_appcontext
+def export_command(kind, format, start, end, city, genre, output):
+    """Stream venues, artists or shows to CSV or NDJSON."""
+    query = export_query(kind, _parse_date(start), _parse_date(end), city, genre)
+    stream = io.open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        for chunk in export_lines(query, format):
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
@@ -1,7 +1,12 @@
 from datetime import datetime
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, AnyOf, URL, Optional
+from models import Genre
+
+
+def genre_choices():
+    return [(genre.name, genre.name) for genre in Genre.query.order_by(Genre.name)]
 
 
 
@@ -17,6 +22,10 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -93,27 +102,7 @@ class VenueForm(Form):
     genres = SelectMultipleField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=[]
     )
     facebook_link = StringField(
         'facebook_link', validators=[URL()]
@@ -128,6 +117,12 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    def __init__(self, *args, **kwargs):
+        # Bulk callers pass a preloaded choice list to skip the query.
+        choices = kwargs.pop('genre_choices', None)
+        super(VenueForm, self).__init__(*args, **kwargs)
+        self.genres.choices = genre_choices() if choices is None else choices
+
     
 
 
@@ -206,27 +201,7 @@ class ArtistForm(Form):
     )
     genres = SelectMultipleField(
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=[]
      )
     facebook_link = StringField(
         # TODO implement enum restriction
@@ -243,3 +218,8 @@ class ArtistForm(Form):
             'seeking_description'
      )
 
+    def __init__(self, *args, **kwargs):
+        # Bulk callers pass a preloaded choice list to skip the query.
+        choices = kwargs.pop('genre_choices', None)
+        super(ArtistForm, self).__init__(*args, **kwargs)
+        self.genres.choices = genre_choices() if choices is None else choices
@@ -0,0 +1,230 @@
+import csv
+import math
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db, Venue
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#
+# Venues carry a latitude, a longitude and the geohash of that point. A
+# geohash shares its prefix with every point in the same cell, so the
+# cells covering a search area are a handful of B-tree range scans on
+# ix_venue_geohash, the same on Postgres and SQLite.
+#
+# Coordinates come from the bundled gazetteer (GAZETTEER_PATH, a CSV of
+# city,state,latitude,longitude), looked up offline by city and state, so
+# a venue sits at its city's centroid. Inserts and city or state changes
+# fill them in through the mapper events below; `flask geocode` fills in
+# existing rows.
+#----------------------------------------------------------------------------#
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Stored precision, cells of about 5m.
+GEOHASH_PRECISION = 9
+
+# The most cells a search area is covered with; fewer, coarser cells
+# beyond that.
+MAX_COVER_CELLS = 32
+
+MILES_PER_DEGREE = 69.055
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            middle = (west + east) / 2
+            value = value * 2 + (longitude >= middle)
+            west, east = (middle, east) if longitude >= middle else (west, middle)
+        else:
+            middle = (south + north) / 2
+            value = value * 2 + (latitude >= middle)
+            south, north = (middle, north) if latitude >= middle else (south, middle)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (degrees of latitude, degrees of longitude) of one cell.
+    bits = precision * 5
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def successor(prefix):
+    # The first geohash past every hash starting with prefix, None past 'zzz..'.
+    prefix = prefix.rstrip(BASE32[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+
+def bounding_box(latitude, longitude, miles):
+    # (south, west, north, east) around a circle, clamped at the poles and
+    # at the antimeridian rather than wrapped.
+    rise = miles / MILES_PER_DEGREE
+    south, north = max(latitude - rise, -90.0), min(latitude + rise, 90.0)
+    scale = math.cos(math.radians(max(abs(south), abs(north))))
+    run = rise / scale if scale > 1e-6 else 360.0
+    return south, max(longitude - run, -180.0), north, min(longitude + run, 180.0)
+
+
+def cover(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    # Geohash ranges [low, high) whose cells cover the box: the finest
+    # precision that needs at most max_cells, adjacent cells merged.
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((south + 90) // height), min(int((north + 90) // height), int(180 / height) - 1) + 1)
+        columns = range(int((west + 180) // width), min(int((east + 180) // width), int(360 / width) - 1) + 1)
+        if len(rows) * len(columns) <= max_cells or precision == 1:
+            break
+    cells = sorted(
+        encode(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+        for row in rows for column in columns
+    )
+    ranges = []
+    for cell in cells:
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1][1] = successor(cell)
+        else:
+            ranges.append([cell, successor(cell)])
+    return [tuple(bounds) for bounds in ranges]
+
+
+def distance_expression(latitude, longitude):
+    # Squared distance in degrees of latitude on a flat projection around
+    # the point: plain arithmetic, so both databases can filter and sort by
+    # it. Under 1% off within a few hundred miles.
+    scale = math.cos(math.radians(latitude))
+    return (
+        (Venue.latitude - latitude) * (Venue.latitude - latitude)
+        + (Venue.longitude - longitude) * scale * (Venue.longitude - longitude) * scale
+    )
+
+
+def distance_miles(latitude, longitude, to_latitude, to_longitude):
+    # The same flat distance as distance_expression(), in miles.
+    scale = math.cos(math.radians(latitude))
+    return math.hypot(to_latitude - latitude, (to_longitude - longitude) * scale) * MILES_PER_DEGREE
+
+
+def within(latitude, longitude, miles):
+    # Filter clauses for the live venues within miles of the point.
+    south, west, north, east = bounding_box(latitude, longitude, miles)
+    cells = [
+        db.and_(Venue.geohash >= low, Venue.geohash < high) if high else Venue.geohash >= low
+        for low, high in cover(south, west, north, east)
+    ]
+    return (
+        Venue.deleted_at.is_(None),
+        db.or_(*cells),
+        Venue.latitude.between(south, north),
+        Venue.longitude.between(west, east),
+        distance_expression(latitude, longitude) <= (miles / MILES_PER_DEGREE) ** 2,
+    )
+
+
+#  Gazetteer
+#  ----------------------------------------------------------------
+
+def _place_key(city, state):
+    return ' '.join((city or '').split()).lower(), (state or '').strip().upper()
+
+
+class Gazetteer(object):
+    # (city, state) -> (latitude, longitude), read on first use.
+
+    def __init__(self):
+        self.places = None
+
+    def load(self, path):
+        places = {}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                places[_place_key(row['city'], row['state'])] = (float(row['latitude']), float(row['longitude']))
+        self.places = places
+
+    def lookup(self, city, state):
+        if self.places is None:
+            self.load(current_app.config['GAZETTEER_PATH'])
+        return self.places.get(_place_key(city, state))
+
+
+gazetteer = Gazetteer()
+
+
+def locate(city, state):
+    # {latitude, longitude, geohash} for a city, all None when unknown.
+    point = gazetteer.lookup(city, state)
+    if point is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {'latitude': point[0], 'longitude': point[1], 'geohash': encode(*point)}
+
+
+@db.event.listens_for(Venue, 'before_insert')
+def locate_new_venue(mapper, connection, venue):
+    if venue.latitude is None:
+        for name, value in locate(venue.city, venue.state).items():
+            setattr(venue, name, value)
+
+
+@db.event.listens_for(Venue, 'before_update')
+def locate_moved_venue(mapper, connection, venue):
+    state = db.inspect(venue)
+    if state.attrs.city.history.has_changes() or state.attrs.state.history.has_changes():
+        for name, value in locate(venue.city, venue.state).items():
+            setattr(venue, name, value)
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@click.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Locate every venue again, not only the unlocated ones.')
+@click.option('--batch-size', default=1000, show_default=True)
+@with_appcontext
+def geocode_command(everything, batch_size):
+    """Fill in venue coordinates from the bundled gazetteer."""
+    table = Venue.__table__
+    update = table.update().where(table.c.id == db.bindparam('venue_id')).values(
+        latitude=db.bindparam('latitude'), longitude=db.bindparam('longitude'),
+        geohash=db.bindparam('geohash'), version=table.c.version + 1
+    )
+    located = unknown = 0
+    after = 0
+    while True:
+        query = db.select(
+            table.c.id, table.c.city, table.c.state, table.c.latitude, table.c.longitude, table.c.geohash
+        ).where(table.c.id > after)
+        if not everything:
+            query = query.where(table.c.latitude.is_(None))
+        rows = db.session.execute(query.order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        after = rows[-1].id
+        updates = []
+        for row in rows:
+            values = locate(row.city, row.state)
+            if values['latitude'] is None:
+                unknown += 1
+            else:
+                located += 1
+            # Only changed rows, so their API ETags stay valid otherwise.
+            if values != {'latitude': row.latitude, 'longitude': row.longitude, 'geohash': row.geohash}:
+                updates.append(dict(values, venue_id=row.id))
+        if updates:
+            db.session.execute(update, updates)
+        db.session.commit()
+    click.echo('%d venues located, %d not in the gazetteer' % (located, unknown))
@@ -0,0 +1,324 @@
+import csv
+import io
+import itertools
+import json
+import os
+from datetime import timedelta
+
+import click
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask.cli import with_appcontext
+from werkzeug.datastructures import MultiDict
+
+from cache import cache
+from counters import record_shows
+from forms import VenueForm, ArtistForm, ShowForm, genre_choices
+from models import db, Venue, Artist, Show, Genre
+
+#----------------------------------------------------------------------------#
+# Bulk CSV/NDJSON import.
+#
+# Rows are streamed in chunks, validated with the same forms the create
+# pages use, and written one transaction per chunk: venues and artists
+# through a batched ORM flush (their genres need the new ids), shows
+# through a Core executemany. Per-row errors, unparsable lines included,
+# are collected rather than aborting the run, and the number of rows
+# already committed is reported so an interrupted run can resume with
+# --resume / skip=. A file that stops decoding as UTF-8 ends the run
+# with a file-level error after the rows read before it.
+#----------------------------------------------------------------------------#
+
+IMPORT_CHUNK_SIZE = 1000
+
+importer = Blueprint('importer', __name__)
+
+
+class BadRow(object):
+    # Stands in for a row read_rows could not parse, so it is reported and
+    # counted like a row that failed validation.
+
+    def __init__(self, message):
+        self.message = message
+
+
+class UnreadableFile(BadRow):
+    # The last item read_rows yields when the rest of the file cannot be
+    # decoded; the decoder reads ahead, so it is not tied to one row.
+    pass
+
+
+def _undecodable(error):
+    return UnreadableFile('The rest of the file is not valid %s text: %s.' % (error.encoding.upper(), error.reason))
+
+
+def read_rows(stream, format):
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except UnicodeDecodeError as e:
+                yield _undecodable(e)
+                return
+            except csv.Error as e:
+                yield BadRow(str(e))
+                continue
+            # Cells past the header are collected under the None key.
+            yield BadRow('More cells than header columns.') if None in row else row
+    elif format == 'ndjson':
+        lines = iter(stream)
+        while True:
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            except UnicodeDecodeError as e:
+                yield _undecodable(e)
+                return
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield BadRow('Invalid JSON: %s' % e)
+                continue
+            yield row if isinstance(row, dict) else BadRow('Expected a JSON object.')
+    else:
+        raise ValueError('Unsupported import format %r' % format)
+
+
+def format_for(filename):
+    return 'ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def _formdata(row):
+    # CSV cells hold comma separated genres; NDJSON may use a list.
+    items = []
+    for key, value in row.items():
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [genre.strip() for genre in value.split(',') if genre.strip()]
+            items.extend(('genres', genre) for genre in value or ())
+        elif value is not None:
+            items.append((key, value if isinstance(value, str) else str(value)))
+    return MultiDict(items)
+
+
+def _form_errors(form):
+    return dict((name, errors) for name, errors in form.errors.items())
+
+
+class VenueImport(object):
+    kind = 'venues'
+    form = VenueForm
+    model = Venue
+    # form field -> model attribute
+    columns = {
+        'name': 'name', 'city': 'city', 'state': 'state', 'address': 'address',
+        'phone': 'phone', 'image_link': 'image_link', 'facebook_link': 'facebook_link',
+        'website_link': 'website_link', 'seeking_talent': 'seeking_talent',
+        'seeking_description': 'seeking_description',
+    }
+
+    def __init__(self):
+        self.choices = genre_choices()
+        self.genres = dict((genre.name, genre) for genre in Genre.query)
+
+    def prepare(self, rows):
+        records = []
+        for number, row in rows:
+            form = self.form(formdata=_formdata(row), meta={'csrf': False}, genre_choices=self.choices)
+            if not form.validate():
+                records.append((number, None, _form_errors(form)))
+                continue
+            record = dict((attribute, form[field].data) for field, attribute in self.columns.items())
+            record['genres'] = [self.genres[name] for name in form.genres.data]
+            records.append((number, record, None))
+        return records
+
+    def write(self, records):
+        db.session.add_all(self.model(**record) for record in records)
+        db.session.flush()
+
+
+class ArtistImport(VenueImport):
+    kind = 'artists'
+    form = ArtistForm
+    model = Artist
+    columns = {
+        'name': 'name', 'city': 'city', 'state': 'state', 'phone': 'phone',
+        'image_link': 'image_link', 'facebook_link': 'facebook_link',
+        'website_link': 'website', 'seeking_venue': 'seeking_venue',
+        'seeking_description': 'seeking_description',
+    }
+
+
+class ShowImport(object):
+    kind = 'shows'
+
+    def _resolve(self, model, rows, key):
+        # Map the chunk's natural keys (id or name) to ids with two IN queries.
+        ids = set()
+        names = set()
+        for _, row in rows:
+            if row.get(key + '_id') not in (None, ''):
+                try:
+                    ids.add(int(row[key + '_id']))
+                except (TypeError, ValueError):
+                    pass
+            elif row.get(key + '_name'):
+                names.add(row[key + '_name'])
+        live = model.deleted_at.is_(None)
+        existing = set(id for (id,) in db.session.query(model.id).filter(model.id.in_(ids), live)) if ids else set()
+        by_name = {}
+        if names:
+            for id, name in db.session.query(model.id, model.name).filter(model.name.in_(names), live):
+                by_name[name] = None if name in by_name else id
+        return existing, by_name
+
+    def prepare(self, rows):
+        venues = self._resolve(Venue, rows, 'venue')
+        artists = self._resolve(Artist, rows, 'artist')
+        records = []
+        for number, row in rows:
+            errors = {}
+            record = {}
+            for key, (existing, by_name) in (('venue', venues), ('artist', artists)):
+                value = row.get(key + '_id')
+                if value not in (None, ''):
+                    try:
+                        value = int(value)
+                    except (TypeError, ValueError):
+                        value = None
+                    if value not in existing:
+                        errors[key + '_id'] = ['Unknown %s id.' % key]
+                elif row.get(key + '_name'):
+                    value = by_name.get(row[key + '_name'])
+                    if value is None:
+                        errors[key + '_name'] = [
+                            ('Ambiguous %s name.' if row[key + '_name'] in by_name else 'Unknown %s name.') % key
+                        ]
+                else:
+                    errors[key + '_id'] = ['A %s id or name is required.' % key]
+                record[key + '_id'] = value
+            form = ShowForm(formdata=MultiDict([
+                ('start_time', row.get('start_time') or ''), ('end_time', row.get('end_time') or '')
+            ]), meta={'csrf': False})
+            if not form.validate():
+                errors.update(_form_errors(form))
+            elif form.end_time.data is not None and form.end_time.data <= form.start_time.data:
+                errors['end_time'] = ['The show must end after it starts.']
+            record['start_time'] = form.start_time.data
+            record['end_time'] = form.end_time.data or (
+                form.start_time.data and form.start_time.data + timedelta(minutes=current_app.config['SHOW_DEFAULT_MINUTES'])
+            )
+            records.append((number, None if errors else record, errors or None))
+        return records
+
+    def write(self, records):
+        db.session.execute(Show.__table__.insert(), records)
+        record_shows((record['venue_id'], record['artist_id'], record['start_time']) for record in records)
+
+
+IMPORTS = {
+    'venues': VenueImport,
+    'artists': ArtistImport,
+    'shows': ShowImport,
+}
+
+
+def run_import(kind, rows, chunk_size=IMPORT_CHUNK_SIZE, skip=0, on_commit=None):
+    # rows is any iterable of dicts (or BadRows); the first `skip` rows are
+    # assumed to be committed by an earlier run. Returns a summary with
+    # per-row errors, and a file-level one when the file stops decoding.
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+    handler = IMPORTS[kind]()
+    summary = {'imported': 0, 'failed': 0, 'committed': skip, 'errors': []}
+    # An unreadable file is reported even inside the skipped rows.
+    numbered = (
+        (number, row) for number, row in enumerate(rows, 1) if number > skip or isinstance(row, UnreadableFile)
+    )
+    unreadable = None
+    while unreadable is None:
+        chunk = list(itertools.islice(numbered, chunk_size))
+        if chunk and isinstance(chunk[-1][1], UnreadableFile):
+            unreadable = chunk.pop()[1]
+        if not chunk:
+            break
+        parsed = [(number, row) for number, row in chunk if not isinstance(row, BadRow)]
+        prepared = handler.prepare(parsed) + [
+            (number, None, {'row': [row.message]}) for number, row in chunk if isinstance(row, BadRow)
+        ]
+        records = [record for _, record, _ in prepared if record is not None]
+        for number, _, errors in sorted(prepared, key=lambda item: item[0]):
+            if errors:
+                summary['errors'].append({'row': number, 'errors': errors})
+        summary['failed'] += len(prepared) - len(records)
+        try:
+            if records:
+                handler.write(records)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            summary['failed'] += len(records)
+            summary['errors'].append({'rows': [chunk[0][0], chunk[-1][0]], 'errors': {'database': [str(e)]}})
+        else:
+            summary['imported'] += len(records)
+        summary['committed'] = chunk[-1][0]
+        if on_commit is not None:
+            on_commit(summary['committed'])
+    if unreadable is not None:
+        # Not counted as failed: the rows it hides are unknown.
+        summary['errors'].append({'errors': {'file': [unreadable.message]}})
+    cache.invalidate('venues', 'artists', 'shows', 'venue', 'artist')
+    return summary
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, type=click.IntRange(min=1))
+@click.option('--resume', is_flag=True, help='Skip the rows committed by the last run of this file.')
+@with_appcontext
+def import_command(kind, path, format, chunk_size, resume):
+    """Bulk import venues, artists or shows from CSV or NDJSON."""
+    progress = path + '.progress'
+    skip = 0
+    if resume and os.path.exists(progress):
+        with open(progress) as f:
+            skip = int(f.read().strip() or 0)
+
+    def checkpoint(committed):
+        with open(progress, 'w') as f:
+            f.write(str(committed))
+
+    with io.open(path, newline='', encoding='utf-8') as stream:
+        summary = run_import(kind, read_rows(stream, format or format_for(path)), chunk_size, skip, checkpoint)
+    for error in summary['errors']:
+        where = 'row %s' % error.get('row', error.get('rows')) if 'row' in error or 'rows' in error else 'file'
+        click.echo('%s: %s' % (where, json.dumps(error['errors'])), err=True)
+    click.echo('imported %(imported)d, failed %(failed)d, committed through row %(committed)d' % summary)
+
+
+@importer.route('/import/<kind>', methods=['POST'])
+def import_upload(kind):
+    # Upload counterpart of `flask import`; resume with skip=<committed>.
+    if kind not in IMPORTS or 'file' not in request.files:
+        abort(400)
+    upload = request.files['file']
+    format = request.form.get('format') or format_for(upload.filename or '')
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    try:
+        summary = run_import(
+            kind, read_rows(stream, format),
+            chunk_size=request.form.get('chunk_size', IMPORT_CHUNK_SIZE, type=int),
+            skip=request.form.get('skip', 0, type=int)
+        )
+    except ValueError as e:
+        current_app.logger.warning('import failed: %s', e)
+        abort(400)
+    return jsonify(summary)
@@ -0,0 +1,428 @@
+import ipaddress
+import json
+import signal
+import socket
+import ssl
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from http.client import HTTPS_PORT, HTTPConnection, HTTPException
+from urllib.error import URLError
+from urllib.parse import urlsplit, urlunsplit
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, orm
+
+from counters import roll
+from models import db, now_utc, Job, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#
+# enqueue() inserts a row into the jobs table through the caller's
+# session, so a job is committed or rolled back together with the write
+# that asked for it. Workers claim due rows (FOR UPDATE SKIP LOCKED on
+# Postgres, a guarded UPDATE elsewhere), run them on a thread pool, and
+# mark them done or queue them again with exponential backoff until
+# max_attempts. A row a dead worker left 'running' is claimed again after
+# JOB_TIMEOUT_SECONDS, or marked failed if that was its last attempt.
+#
+# Every web process runs JOB_EXECUTOR_THREADS threads of its own, started
+# by its first request and woken by each commit that enqueued a job;
+# `flask worker` runs the same loop in the foreground. Periodic tasks
+# (the counter roll, pruning old jobs) run from both loops.
+#----------------------------------------------------------------------------#
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+# Finished jobs the latency figures are computed over.
+STATS_WINDOW = timedelta(hours=1)
+STATS_SAMPLE = 1000
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {'p50': None, 'p95': None, 'max': None}
+    pick = lambda fraction: values[min(len(values) - 1, int(fraction * len(values)))]
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'max': values[-1]}
+
+
+class JobQueue(object):
+
+    def __init__(self, app=None):
+        self.tasks = {}
+        # [task, config key holding its interval in seconds]
+        self.periodic_tasks = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.threads = app.config.get('JOB_EXECUTOR_THREADS', 2)
+        self.poll = app.config.get('JOB_POLL_SECONDS', 1)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.retry_seconds = app.config.get('JOB_RETRY_SECONDS', 10)
+        self.timeout = app.config.get('JOB_TIMEOUT_SECONDS', 300)
+        self.retention = timedelta(hours=app.config.get('JOB_RETENTION_HOURS', 24))
+        app.extensions['jobs'] = self
+        if self.threads:
+            app.before_request(self._start_in_process)
+        if not event.contains(orm.Session, 'after_commit', self._after_commit):
+            event.listen(orm.Session, 'after_commit', self._after_commit)
+
+    #  Registration
+    #  ----------------------------------------------------------------
+
+    def task(self, name=None, max_attempts=None):
+        def decorator(function):
+            self.tasks[name or function.__name__] = (function, max_attempts)
+            return function
+        return decorator
+
+    def periodic(self, interval_setting):
+        # Run the function every app.config[interval_setting] seconds.
+        def decorator(function):
+            self.periodic_tasks.append((function, interval_setting))
+            return function
+        return decorator
+
+    #  Producing
+    #  ----------------------------------------------------------------
+
+    def enqueue(self, name, delay=0, **payload):
+        # Queue a registered task in the current transaction.
+        function, max_attempts = self.tasks[name]
+        now = now_utc()
+        db.session.execute(Job.__table__.insert().values(
+            name=name, payload=json.dumps(payload, sort_keys=True), status='queued', attempts=0,
+            max_attempts=max_attempts or self.max_attempts, run_at=now + timedelta(seconds=delay), created_at=now
+        ))
+        db.session().info['jobs_enqueued'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('jobs_enqueued', False):
+            self._wake.set()
+
+    #  Consuming
+    #  ----------------------------------------------------------------
+
+    def claim(self, limit):
+        # Mark up to `limit` due jobs running; returns their ids.
+        table = Job.__table__
+        now = now_utc()
+        stale = db.and_(table.c.status == 'running', table.c.started_at < now - timedelta(seconds=self.timeout))
+        # A job whose worker died on its last attempt is not run again.
+        expired = db.session.execute(table.update().where(stale, table.c.attempts >= table.c.max_attempts).values(
+            status='failed', finished_at=now, last_error='timed out after %d seconds' % self.timeout
+        )).rowcount
+        if expired:
+            self.app.logger.error('%d jobs timed out on their last attempt', expired)
+        claimable = db.or_(
+            db.and_(table.c.status == 'queued', table.c.run_at <= now),
+            db.and_(stale, table.c.attempts < table.c.max_attempts),
+        )
+        due = db.select(table.c.id).where(claimable).order_by(table.c.run_at, table.c.id).limit(limit)
+        if db.engine.dialect.name == 'postgresql':
+            due = due.with_for_update(skip_locked=True)
+        claimed = []
+        for (id,) in db.session.execute(due).all():
+            # Under SKIP LOCKED this always matches; elsewhere it loses to a
+            # worker that claimed the row first.
+            if db.session.execute(table.update().where(table.c.id == id, claimable).values(
+                status='running', started_at=now, attempts=table.c.attempts + 1
+            )).rowcount:
+                claimed.append(id)
+        db.session.commit()
+        return claimed
+
+    def run(self, id):
+        table = Job.__table__
+        job = db.session.execute(db.select(table).where(table.c.id == id)).one()
+        try:
+            function, _ = self.tasks[job.name]
+            result = function(**json.loads(job.payload))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._failed(job, e)
+        else:
+            db.session.execute(table.update().where(table.c.id == id).values(
+                status='done', finished_at=now_utc(), last_error=None,
+                result=None if result is None else json.dumps(result, sort_keys=True)
+            ))
+        db.session.commit()
+
+    def _failed(self, job, error):
+        table = Job.__table__
+        message = ''.join(traceback.format_exception_only(type(error), error)).strip()
+        now = now_utc()
+        if job.attempts >= job.max_attempts:
+            self.app.logger.error('job %d %s failed after %d attempts: %s', job.id, job.name, job.attempts, message)
+            values = {'status': 'failed', 'finished_at': now}
+        else:
+            delay = self.retry_seconds * 2 ** (job.attempts - 1)
+            self.app.logger.warning('job %d %s failed, retrying in %ds: %s', job.id, job.name, delay, message)
+            values = {'status': 'queued', 'run_at': now + timedelta(seconds=delay)}
+        db.session.execute(table.update().where(table.c.id == job.id).values(last_error=message, **values))
+
+    def _call(self, function, *args):
+        with self.app.app_context():
+            try:
+                function(*args)
+            except Exception:
+                self.app.logger.exception('job worker error in %s', function.__name__)
+
+    def _due_periodic(self, schedule):
+        now = time.monotonic()
+        for index, (function, setting) in enumerate(self.periodic_tasks):
+            interval = self.app.config.get(setting, 0)
+            if interval and schedule.get(index, 0) <= now:
+                schedule[index] = now + interval
+                yield function
+
+    def work(self, threads, once=False):
+        # Claim and run due jobs and periodic tasks on `threads` threads
+        # until stop(), or until nothing is left to do when `once` is set.
+        self._stop.clear()
+        schedule = {}
+        running = set()
+        with ThreadPoolExecutor(threads, thread_name_prefix='job') as pool:
+            while not self._stop.is_set():
+                running = set(future for future in running if not future.done())
+                for function in self._due_periodic(schedule):
+                    running.add(pool.submit(self._call, function))
+                free = threads - len(running)
+                claimed = []
+                if free > 0:
+                    with self.app.app_context():
+                        try:
+                            claimed = self.claim(free)
+                        except Exception:
+                            self.app.logger.exception('could not claim jobs')
+                running.update(pool.submit(self._call, self.run, id) for id in claimed)
+                if once and free > len(claimed):
+                    wait(running)
+                    return
+                if running and len(running) >= threads:
+                    wait(running, timeout=self.poll, return_when=FIRST_COMPLETED)
+                elif not claimed:
+                    self._wake.wait(self.poll)
+                    self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _start_in_process(self):
+        # before_request: one dispatcher thread per process, started after
+        # any fork by the server.
+        if self._dispatcher is None:
+            with self._lock:
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(
+                        target=self.work, args=(self.threads,), name='job-dispatcher', daemon=True
+                    )
+                    self._dispatcher.start()
+
+    #  Reporting
+    #  ----------------------------------------------------------------
+
+    def stats(self):
+        # Queue depth by status, the age of the oldest due job and wait
+        # (due to started) and run times of the jobs finished in the last hour.
+        table = Job.__table__
+        now = now_utc()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(db.session.execute(
+            db.select(table.c.status, db.func.count()).group_by(table.c.status)
+        ).all())
+        due, oldest = db.session.execute(
+            db.select(db.func.count(), db.func.min(table.c.run_at)).where(
+                table.c.status == 'queued', table.c.run_at <= now
+            )
+        ).one()
+        finished = db.session.execute(
+            db.select(table.c.run_at, table.c.started_at, table.c.finished_at).where(
+                table.c.status == 'done', table.c.finished_at >= now - STATS_WINDOW
+            ).order_by(table.c.finished_at.desc()).limit(STATS_SAMPLE)
+        ).all()
+        return {
+            'jobs': counts,
+            'due': due,
+            'oldest_due_seconds': (now - oldest).total_seconds() if oldest else 0.0,
+            'wait_seconds': _percentiles([max((row.started_at - row.run_at).total_seconds(), 0.0) for row in finished]),
+            'run_seconds': _percentiles([(row.finished_at - row.started_at).total_seconds() for row in finished]),
+            'finished_last_hour': len(finished),
+        }
+
+    def metrics(self):
+        # Prometheus text exposition format, version 0.0.4.
+        stats = self.stats()
+        lines = [
+            '# HELP fyyur_jobs Background jobs by status.',
+            '# TYPE fyyur_jobs gauge',
+        ]
+        lines.extend('fyyur_jobs{status="%s"} %d' % (status, stats['jobs'][status]) for status in JOB_STATUSES)
+        lines.extend([
+            '# HELP fyyur_jobs_due Queued jobs whose run time has passed.',
+            '# TYPE fyyur_jobs_due gauge',
+            'fyyur_jobs_due %d' % stats['due'],
+            '# HELP fyyur_job_oldest_due_seconds Age of the oldest due job.',
+            '# TYPE fyyur_job_oldest_due_seconds gauge',
+            'fyyur_job_oldest_due_seconds %.3f' % stats['oldest_due_seconds'],
+        ])
+        for name, help in (('wait', 'From due to started'), ('run', 'Run time')):
+            lines.append('# HELP fyyur_job_%s_seconds %s, jobs finished in the last hour.' % (name, help))
+            lines.append('# TYPE fyyur_job_%s_seconds summary' % name)
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('1', 'max')):
+                value = stats['%s_seconds' % name][key]
+                if value is not None:
+                    lines.append('fyyur_job_%s_seconds{quantile="%s"} %.6f' % (name, quantile, value))
+            lines.append('fyyur_job_%s_seconds_count %d' % (name, stats['finished_last_hour']))
+        return '\n'.join(lines) + '\n'
+
+
+jobs = JobQueue()
+
+
+#  Tasks
+#  ----------------------------------------------------------------
+
+@jobs.periodic('COUNTERS_ROLL_SECONDS')
+def roll_counters():
+    roll()
+
+
+@jobs.periodic('JOB_PRUNE_SECONDS')
+def prune_jobs():
+    table = Job.__table__
+    db.session.execute(table.delete().where(
+        table.c.status.in_(('done', 'failed')), table.c.finished_at < now_utc() - jobs.retention
+    ))
+    db.session.commit()
+
+
+LISTINGS = {'venue': Venue, 'artist': Artist}
+
+LINK_COLUMNS = {
+    Venue: ('image_link', 'facebook_link', 'website_link'),
+    Artist: ('image_link', 'facebook_link', 'website'),
+}
+
+
+class _PinnedHTTPConnection(HTTPConnection):
+    # Connects to addresses resolved and checked beforehand rather than
+    # resolving the host again, so a DNS answer that changes in between
+    # cannot point the request at an internal address. The Host header
+    # still names the host.
+    def __init__(self, host, addresses, **kwargs):
+        super().__init__(host, **kwargs)
+        self.addresses = addresses
+
+    def _pinned_socket(self):
+        error = None
+        for address in self.addresses:
+            try:
+                return socket.create_connection((address, self.port), self.timeout, self.source_address)
+            except OSError as e:
+                error = e
+        raise error
+
+    def connect(self):
+        self.sock = self._pinned_socket()
+
+
+class _PinnedHTTPSConnection(_PinnedHTTPConnection):
+    # TLS with SNI and the certificate checked against the host name.
+    default_port = HTTPS_PORT
+
+    def __init__(self, host, addresses, **kwargs):
+        super().__init__(host, addresses, **kwargs)
+        self.context = ssl.create_default_context()
+
+    def connect(self):
+        self.sock = self.context.wrap_socket(self._pinned_socket(), server_hostname=self.host)
+
+
+def link_status(url, timeout):
+    # HTTP status of a public http(s) URL, None for anything else. A
+    # redirect is not followed, so a public URL cannot bounce the check
+    # onto an internal address; it counts as reachable. Network failures
+    # raise URLError so the job is retried.
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return None
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or parts.scheme, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        if e.errno == socket.EAI_AGAIN:
+            raise URLError(e)
+        return 404
+    except UnicodeError:
+        return 404
+    addresses = [address[4][0] for address in addresses]
+    if not all(ipaddress.ip_address(address.split('%')[0]).is_global for address in addresses):
+        return None
+    connection_class = _PinnedHTTPSConnection if parts.scheme == 'https' else _PinnedHTTPConnection
+    path = urlunsplit(('', '', parts.path or '/', parts.query, ''))
+    for method in ('HEAD', 'GET'):
+        connection = connection_class(parts.hostname, addresses, port=parts.port, timeout=timeout)
+        try:
+            connection.request(method, path, headers={'User-Agent': 'fyyur-link-check'})
+            status = connection.getresponse().status
+        except (OSError, HTTPException) as e:
+            raise URLError(e)
+        finally:
+            connection.close()
+        # Some servers refuse HEAD; ask again with GET.
+        if status not in (403, 405) or method == 'GET':
+            return status
+
+
+@jobs.task()
+def check_links(kind, id):
+    # Probe a listing's image, Facebook and website links after a create
+    # or edit; links answering 4xx/5xx are logged and returned as broken.
+    model = LISTINGS[kind]
+    columns = LINK_COLUMNS[model]
+    row = db.session.query(*[getattr(model, column) for column in columns]).filter(
+        model.id == id, model.deleted_at.is_(None)
+    ).first()
+    if row is None:
+        return None
+    broken = {}
+    for column, url in zip(columns, row):
+        if url:
+            status = link_status(url, current_app.config.get('LINK_CHECK_TIMEOUT', 5))
+            if status is not None and status >= 400:
+                broken[column] = status
+    if broken:
+        current_app.logger.warning('%s %d has broken links: %s', kind, id, broken)
+    return {'broken': broken}
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@click.command('worker')
+@click.option('--threads', type=int, help='Defaults to JOB_EXECUTOR_THREADS, or 2 when that is 0.')
+@click.option('--once', is_flag=True, help='Run the jobs that are due, then exit.')
+@with_appcontext
+def worker_command(threads, once):
+    """Run queued background jobs and the periodic tasks."""
+    threads = threads or jobs.threads or 2
+    signal.signal(signal.SIGTERM, lambda *args: jobs.stop())
+    click.echo('worker running %d threads' % threads)
+    try:
+        jobs.work(threads, once)
+    except KeyboardInterrupt:
+        jobs.stop()
@@ -0,0 +1,34 @@
+"""keyset pagination indexes
+
+Revision ID: 1d9f6b2e8c37
+Revises: e7b40c3f5a28
+Create Date: 2026-10-18 14:25:09.331870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d9f6b2e8c37'
+down_revision = 'e7b40c3f5a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Extend the listing sort indexes with the id tie-breaker used by the
+    # ?after= cursors.
+    op.create_index('ix_artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.create_index('ix_venue_state_city_id', 'Venue', ['state', 'city', 'id'], unique=False)
+    op.drop_index('ix_venue_state_city', table_name='Venue')
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'], unique=False)
+    op.drop_index('ix_shows_start_time', table_name='shows')
+
+
+def downgrade():
+    op.create_index('ix_shows_start_time', 'shows', ['start_time'], unique=False)
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.create_index('ix_venue_state_city', 'Venue', ['state', 'city'], unique=False)
+    op.drop_index('ix_venue_state_city_id', table_name='Venue')
+    op.drop_index('ix_artist_name_id', table_name='Artist')
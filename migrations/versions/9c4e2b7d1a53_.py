@@ -0,0 +1,40 @@
+"""listing sort keys not null
+
+Revision ID: 9c4e2b7d1a53
+Revises: f3a7c18d2e64
+Create Date: 2026-10-19 09:12:44.508117
+
+Rows with a NULL name, city or state are given an empty string first.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e2b7d1a53'
+down_revision = 'f3a7c18d2e64'
+branch_labels = None
+depends_on = None
+
+# table -> columns the ?after= cursors compare
+SORT_KEYS = {
+    'Venue': [('name', sa.String()), ('city', sa.String(length=120)), ('state', sa.String(length=120))],
+    'Artist': [('name', sa.String())],
+}
+
+
+def upgrade():
+    for table, columns in SORT_KEYS.items():
+        for column, type_ in columns:
+            op.execute('UPDATE "%s" SET %s = \'\' WHERE %s IS NULL' % (table, column, column))
+        with op.batch_alter_table(table) as batch_op:
+            for column, type_ in columns:
+                batch_op.alter_column(column, existing_type=type_, nullable=False)
+
+
+def downgrade():
+    for table, columns in SORT_KEYS.items():
+        with op.batch_alter_table(table) as batch_op:
+            for column, type_ in columns:
+                batch_op.alter_column(column, existing_type=type_, nullable=True)
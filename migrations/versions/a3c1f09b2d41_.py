@@ -0,0 +1,44 @@
+"""add trigram search indexes
+
+Revision ID: a3c1f09b2d41
+Revises: 7fe894476cec
+Create Date: 2026-10-18 09:12:04.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1f09b2d41'
+down_revision = '7fe894476cec'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = {
+    'Venue': ('name', 'city', 'genres'),
+    'Artist': ('name', 'city', 'genres'),
+}
+
+
+def upgrade():
+    # pg_trgm GIN indexes serve the ILIKE '%term%' filters used by search;
+    # other dialects fall back to a plain scan.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            op.create_index(
+                'ix_%s_%s_trgm' % (table.lower(), column), table, [column],
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'}
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            op.drop_index('ix_%s_%s_trgm' % (table.lower(), column), table_name=table)
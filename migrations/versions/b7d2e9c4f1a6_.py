@@ -0,0 +1,35 @@
+"""trigram index on genre names
+
+Revision ID: b7d2e9c4f1a6
+Revises: 9c4e2b7d1a53
+Create Date: 2026-10-19 14:03:51.227904
+
+Search matches genre names first and the owners through the link
+tables, so the genre arm is an index lookup like the name and city arms.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e9c4f1a6'
+down_revision = '9c4e2b7d1a53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.create_index(
+        'ix_genre_name_trgm', 'Genre', ['name'],
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_genre_name_trgm', table_name='Genre')
@@ -0,0 +1,117 @@
+"""normalize genres into a join table
+
+Revision ID: c52e8d7a9f10
+Revises: a3c1f09b2d41
+Create Date: 2026-10-18 11:40:27.503114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e8d7a9f10'
+down_revision = 'a3c1f09b2d41'
+branch_labels = None
+depends_on = None
+
+# The choice list previously hard-coded in forms.py.
+DEFAULT_GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll',
+    'Soul', 'Other',
+]
+
+# owner table -> (association table, owner key column)
+ASSOCIATIONS = {
+    'Venue': ('venue_genres', 'venue_id'),
+    'Artist': ('artist_genres', 'artist_id'),
+}
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for owner, (table, key) in ASSOCIATIONS.items():
+        op.create_table(table,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([key], [owner + '.id'], ),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint(key, 'genre_id')
+        )
+        op.create_index('ix_%s_genre_id_%s' % (table, key), table, ['genre_id', key])
+    op.create_index('ix_venue_state_city', 'Venue', ['state', 'city'])
+
+    # Convert the comma-joined strings into association rows.
+    bind = op.get_bind()
+    owners = {}
+    names = list(DEFAULT_GENRES)
+    for owner in ASSOCIATIONS:
+        rows = bind.execute(sa.text('SELECT id, genres FROM "%s"' % owner)).fetchall()
+        owners[owner] = [
+            (row.id, [name.strip() for name in (row.genres or '').split(',') if name.strip()])
+            for row in rows
+        ]
+        for _, row_genres in owners[owner]:
+            names.extend(row_genres)
+    names = list(dict.fromkeys(names))
+    op.bulk_insert(genre, [{'name': name} for name in names])
+    genre_ids = dict(
+        (row.name, row.id) for row in bind.execute(sa.text('SELECT id, name FROM "Genre"'))
+    )
+    for owner, (table, key) in ASSOCIATIONS.items():
+        association = sa.table(table, sa.column(key, sa.Integer), sa.column('genre_id', sa.Integer))
+        links = [
+            {key: owner_id, 'genre_id': genre_ids[name]}
+            for owner_id, row_genres in owners[owner]
+            for name in dict.fromkeys(row_genres)
+        ]
+        if links:
+            op.bulk_insert(association, links)
+
+    if bind.dialect.name == 'postgresql':
+        for owner in ASSOCIATIONS:
+            op.drop_index('ix_%s_genres_trgm' % owner.lower(), table_name=owner)
+    for owner in ASSOCIATIONS:
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    op.add_column('Venue', sa.Column('genres', sa.String(), nullable=True))
+    op.add_column('Artist', sa.Column('genres', sa.String(length=120), nullable=True))
+
+    bind = op.get_bind()
+    for owner, (table, key) in ASSOCIATIONS.items():
+        rows = bind.execute(sa.text(
+            'SELECT a.%s AS owner_id, g.name AS name FROM %s a '
+            'JOIN "Genre" g ON g.id = a.genre_id ORDER BY a.%s, g.name' % (key, table, key)
+        ))
+        genres = {}
+        for row in rows:
+            genres.setdefault(row.owner_id, []).append(row.name)
+        for owner_id, names in genres.items():
+            bind.execute(
+                sa.text('UPDATE "%s" SET genres = :genres WHERE id = :id' % owner),
+                {'genres': ','.join(names), 'id': owner_id}
+            )
+
+    if bind.dialect.name == 'postgresql':
+        for owner in ASSOCIATIONS:
+            op.create_index(
+                'ix_%s_genres_trgm' % owner.lower(), owner, ['genres'],
+                postgresql_using='gin',
+                postgresql_ops={'genres': 'gin_trgm_ops'}
+            )
+
+    op.drop_index('ix_venue_state_city', table_name='Venue')
+    for owner, (table, key) in ASSOCIATIONS.items():
+        op.drop_index('ix_%s_genre_id_%s' % (table, key), table_name=table)
+        op.drop_table(table)
+    op.drop_table('Genre')
@@ -0,0 +1,94 @@
+"""add show end times and the double-booking guard
+
+Revision ID: e94a0c3d5b16
+Revises: d1c84e5b7f20
+Create Date: 2026-10-18 20:31:08.442917
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e94a0c3d5b16'
+down_revision = 'd1c84e5b7f20'
+branch_labels = None
+depends_on = None
+
+# Existing shows get this length, cut short where the venue or the artist
+# has a later show starting sooner, so the guard holds for old rows too.
+BACKFILL_MINUTES = 120
+
+BOOKING_CONSTRAINTS = {'venue': 'ex_shows_venue_booking', 'artist': 'ex_shows_artist_booking'}
+
+
+def backfill_end_times(bind):
+    if bind.dialect.name == 'postgresql':
+        op.execute(
+            "UPDATE shows SET end_time = LEAST(shows.start_time + interval '%d minutes', n.next_venue, n.next_artist) "
+            "FROM (SELECT id, "
+            "LEAD(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS next_venue, "
+            "LEAD(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id) AS next_artist "
+            "FROM shows) n WHERE n.id = shows.id" % BACKFILL_MINUTES
+        )
+        return
+    # SQLite: computed in Python, its date functions drop the microseconds
+    # SQLAlchemy stores.
+    shows = sa.table('shows', sa.column('id'), sa.column('venue_id'), sa.column('artist_id'),
+                     sa.column('start_time', sa.DateTime), sa.column('end_time', sa.DateTime))
+    ends = {}
+    last = {}
+    rows = bind.execute(sa.select(shows.c.id, shows.c.venue_id, shows.c.artist_id, shows.c.start_time)
+                        .order_by(shows.c.start_time, shows.c.id))
+    for id, venue_id, artist_id, start_time in rows:
+        ends[id] = start_time + timedelta(minutes=BACKFILL_MINUTES)
+        for owner in (('venue', venue_id), ('artist', artist_id)):
+            previous = last.get(owner)
+            if previous is not None:
+                ends[previous] = min(ends[previous], start_time)
+            last[owner] = id
+    if ends:
+        bind.execute(shows.update().where(shows.c.id == sa.bindparam('show_id')).values(end_time=sa.bindparam('end')),
+                     [{'show_id': id, 'end': end} for id, end in ends.items()])
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    backfill_end_times(bind)
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+    op.create_index('ix_shows_venue_id_end_time', 'shows', ['venue_id', 'end_time', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_end_time', 'shows', ['artist_id', 'end_time', 'start_time'], unique=False)
+    if bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        op.execute('ALTER TABLE shows ADD COLUMN during tsrange GENERATED ALWAYS AS (tsrange(start_time, end_time)) STORED')
+        for owner, name in BOOKING_CONSTRAINTS.items():
+            op.execute('ALTER TABLE shows ADD CONSTRAINT %s EXCLUDE USING gist (%s_id WITH =, during WITH &&)' % (name, owner))
+    elif bind.dialect.name == 'sqlite':
+        for owner, name in BOOKING_CONSTRAINTS.items():
+            op.execute(
+                "CREATE TRIGGER %(name)s BEFORE INSERT ON shows "
+                "WHEN NEW.end_time > NEW.start_time AND ("
+                "SELECT start_time FROM shows WHERE %(owner)s_id = NEW.%(owner)s_id "
+                "AND end_time > NEW.start_time AND end_time > start_time "
+                "ORDER BY end_time, start_time LIMIT 1) < NEW.end_time "
+                "BEGIN SELECT RAISE(ABORT, '%(name)s'); END" % {'name': name, 'owner': owner}
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for name in BOOKING_CONSTRAINTS.values():
+            op.execute('ALTER TABLE shows DROP CONSTRAINT %s' % name)
+        op.execute('ALTER TABLE shows DROP COLUMN during')
+    elif bind.dialect.name == 'sqlite':
+        for name in BOOKING_CONSTRAINTS.values():
+            op.execute('DROP TRIGGER %s' % name)
+    op.drop_index('ix_shows_artist_id_end_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_end_time', table_name='shows')
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.drop_column('end_time')
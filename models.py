@@ -1,43 +1,96 @@
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timezone
+from routing import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def from_names(cls, names):
+        # Resolve submitted genre names to rows, creating any that are new.
+        names = [name for name in dict.fromkeys(names) if name]
+        genres = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))}
+        return [genres.get(name) or cls(name=name) for name in names]
+
+# Relationships load lazy='raise': touching one the query did not load
+# raises instead of quietly issuing a SELECT per row. A view that needs one
+# asks for it, e.g. query.options(db.selectinload(Venue.genres)); the read
+# paths select columns into read models (queries.py) and use none of them.
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_state_city_id', 'state', 'city', 'id'),
+        db.Index('ix_venue_geohash', 'geohash'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # name, city and state are listing sort keys, hence NOT NULL.
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String)
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name', lazy='raise')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(300))
     seeking_talent = db.Column(db.Boolean, nullable=False, default= False)
     seeking_description = db.Column(db.String(1000))
-    artists = db.relationship('Artist', secondary='shows',
-      backref=db.backref('venues', lazy=True, uselist= False))
+    # Filled in from the gazetteer by geo.py; NULL when the city is unknown.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    # Bumped on every UPDATE; the API derives ETags from it.
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Set by a soft delete; read paths only see rows where it is NULL.
+    deleted_at = db.Column(db.DateTime)
+    shows = db.relationship('Show', back_populates='venue', lazy='raise', passive_deletes='all')
+    # Everyone who has a show here, read-only: book through Show.
+    artists = db.relationship('Artist', secondary='shows', viewonly=True, lazy='raise', collection_class=set)
+
+    __mapper_args__ = {'version_id_col': version}
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (db.Index('ix_artist_name_id', 'name', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    # The listing sort key, hence NOT NULL.
+    name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String)
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name', lazy='raise')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(200))
     seeking_venue = db.Column(db.Boolean, nullable=False, default= True)
     seeking_description = db.Column(db.String(1000))
-    
+    version = db.Column(db.Integer, nullable=False, default=1)
+    deleted_at = db.Column(db.DateTime)
+    shows = db.relationship('Show', back_populates='artist', lazy='raise', passive_deletes='all')
+    # Every venue the artist has a show at, read-only: book through Show.
+    venues = db.relationship('Venue', secondary='shows', viewonly=True, lazy='raise', collection_class=set)
 
+    __mapper_args__ = {'version_id_col': version}
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -47,8 +100,116 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        db.Index('ix_shows_venue_id_end_time', 'venue_id', 'end_time', 'start_time'),
+        db.Index('ix_shows_artist_id_end_time', 'artist_id', 'end_time', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.now()) 
+    # Exclusive: a show books its venue and artist for [start_time, end_time).
+    end_time = db.Column(db.DateTime, nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    artist_id = db.Column( db.Integer, db.ForeignKey('Artist.id'), nullable=False)
\ No newline at end of file
+    artist_id = db.Column( db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    venue = db.relationship('Venue', back_populates='shows', lazy='raise')
+    artist = db.relationship('Artist', back_populates='shows', lazy='raise')
+
+    __mapper_args__ = {'version_id_col': version}
+
+def naive_utc(value):
+    # Show times are stored without a zone; an aware value is converted
+    # to UTC first.
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def now_utc():
+    # The current time the way show times are stored, naive UTC. Every
+    # upcoming/past split and stored timestamp uses it, whatever the
+    # server's local zone.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Double-booking guard: a venue or an artist holds one show at a time.
+# Postgres enforces it with exclusion constraints over a generated tsrange,
+# checked through their GiST index. SQLite has no exclusion constraints, so
+# BEFORE INSERT triggers look up the only show that can overlap: as one
+# owner's shows never overlap, that is the first one ending after the new
+# start, read off the (owner, end_time, start_time) index. Zero-length
+# shows (left by the end_time backfill) book nothing. Both raise an
+# IntegrityError naming the constraint; see booking_conflict().
+BOOKING_CONSTRAINTS = {'venue': 'ex_shows_venue_booking', 'artist': 'ex_shows_artist_booking'}
+
+def booking_ddl(dialect):
+    if dialect == 'postgresql':
+        return [
+            'CREATE EXTENSION IF NOT EXISTS btree_gist',
+            'ALTER TABLE shows ADD COLUMN during tsrange GENERATED ALWAYS AS (tsrange(start_time, end_time)) STORED',
+        ] + [
+            'ALTER TABLE shows ADD CONSTRAINT %s EXCLUDE USING gist (%s_id WITH =, during WITH &&)' % (name, owner)
+            for owner, name in BOOKING_CONSTRAINTS.items()
+        ]
+    if dialect == 'sqlite':
+        return [
+            "CREATE TRIGGER %(name)s BEFORE INSERT ON shows "
+            "WHEN NEW.end_time > NEW.start_time AND ("
+            "SELECT start_time FROM shows WHERE %(owner)s_id = NEW.%(owner)s_id "
+            "AND end_time > NEW.start_time AND end_time > start_time "
+            "ORDER BY end_time, start_time LIMIT 1) < NEW.end_time "
+            "BEGIN SELECT RAISE(ABORT, '%(name)s'); END" % {'name': name, 'owner': owner}
+            for owner, name in BOOKING_CONSTRAINTS.items()
+        ]
+    return []
+
+for dialect in ('postgresql', 'sqlite'):
+    for statement in booking_ddl(dialect):
+        db.event.listen(Show.__table__, 'after_create', db.DDL(statement).execute_if(dialect=dialect))
+
+def booking_conflict(error):
+    # 'venue' or 'artist' when an IntegrityError came from the guard.
+    message = str(getattr(error, 'orig', error))
+    for owner, name in BOOKING_CONSTRAINTS.items():
+        if name in message:
+            return owner
+    return None
+
+class Job(db.Model):
+    # Background work queued by jobs.py; rows move queued -> running ->
+    # done, or back to queued for a retry, or failed.
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)
+    last_error = db.Column(db.Text)
+
+# Materialized upcoming-show counts, maintained by counters.py: the number
+# of each owner's shows starting after upcoming_shows_as_of.as_of. A
+# missing row means zero.
+venue_upcoming_shows = db.Table('venue_upcoming_shows',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
+    db.Column('upcoming', db.Integer, nullable=False, default=0)
+)
+
+artist_upcoming_shows = db.Table('artist_upcoming_shows',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
+    db.Column('upcoming', db.Integer, nullable=False, default=0)
+)
+
+# Single row: the time the counters were last rolled forward to.
+upcoming_shows_as_of = db.Table('upcoming_shows_as_of',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('as_of', db.DateTime, nullable=False)
+)
@@ -0,0 +1,234 @@
+import cProfile
+import heapq
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Opt-in request profiling.
+#
+# Each request records its wall time, SQL statement count and time (from
+# the cursor execute events of every engine, replicas included), template
+# render time and its slowest statements. Per-route totals are exported
+# in the Prometheus text format, a route repeating one statement shape
+# more than PROFILE_N_PLUS_ONE_THRESHOLD times is logged as a likely N+1,
+# and a PROFILE_SAMPLE_RATE share of requests is run under cProfile.
+#----------------------------------------------------------------------------#
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_IN_LIST = re.compile(r'IN \((?:[^()]*?)\)', re.IGNORECASE)
+
+
+def statement_shape(statement):
+    # Expanded IN lists and whitespace differences do not make a new shape.
+    return ' '.join(_IN_LIST.sub('IN (?)', statement).split())
+
+
+class RequestProfile(object):
+    __slots__ = ('started', 'statements', 'sql_time', 'template_time', 'templates', 'timings', 'profile')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.templates = []
+        # (seconds, statement) for every statement run by the request.
+        self.timings = []
+        self.profile = None
+
+    def shapes(self):
+        return Counter(statement_shape(statement) for _, statement in self.timings)
+
+
+class RouteStats(object):
+    __slots__ = ('requests', 'buckets', 'duration', 'statements', 'sql_time', 'template_time', 'n_plus_one')
+
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0.0
+        self.statements = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.n_plus_one = 0
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class Profiler(object):
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.routes = {}
+        # statement shape -> (slowest seconds seen, endpoint)
+        self.slowest = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        self.slow_request = app.config.get('PROFILE_SLOW_REQUEST_MS', 500) / 1000.0
+        self.slow_statements = app.config.get('PROFILE_SLOW_STATEMENTS', 5)
+        self.n_plus_one_threshold = app.config.get('PROFILE_N_PLUS_ONE_THRESHOLD', 10)
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.profile_dir = app.config.get('PROFILE_DIR', 'profiles')
+        self.logger = app.logger
+        app.extensions['profiler'] = self
+        if not self.enabled:
+            return
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _start(self):
+        g.request_profile = profile = RequestProfile()
+        if self.sample_rate and random.random() < self.sample_rate:
+            profile.profile = cProfile.Profile()
+            profile.profile.enable()
+
+    def _before_render(self, sender, template, context, **extra):
+        profile = g.get('request_profile')
+        if profile is not None:
+            profile.templates.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        profile = g.get('request_profile')
+        if profile is not None and profile.templates:
+            elapsed = time.perf_counter() - profile.templates.pop()
+            # Only the outermost render is timed.
+            if not profile.templates:
+                profile.template_time += elapsed
+
+    def _finish(self, response):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return response
+        duration = time.perf_counter() - profile.started
+        endpoint = request.endpoint or 'unmatched'
+        if profile.profile is not None:
+            profile.profile.disable()
+            self._dump(profile.profile, endpoint)
+
+        repeated = [
+            (count, shape) for shape, count in profile.shapes().items()
+            if count > self.n_plus_one_threshold
+        ]
+        for count, shape in repeated:
+            self.logger.warning('possible N+1 in %s: %d x %s', endpoint, count, shape[:300])
+        slowest = heapq.nlargest(self.slow_statements, profile.timings)
+        if duration >= self.slow_request:
+            self.logger.warning(
+                'slow request %s %s: %.1fms, %d statements, %.1fms SQL; slowest: %s',
+                request.method, request.path, duration * 1000, profile.statements,
+                profile.sql_time * 1000,
+                '; '.join('%.1fms %s' % (seconds * 1000, statement_shape(statement)[:200])
+                          for seconds, statement in slowest)
+            )
+
+        with self._lock:
+            stats = self.routes.get(endpoint)
+            if stats is None:
+                stats = self.routes[endpoint] = RouteStats()
+            stats.requests += 1
+            stats.duration += duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[index] += 1
+            stats.statements += profile.statements
+            stats.sql_time += profile.sql_time
+            stats.template_time += profile.template_time
+            stats.n_plus_one += len(repeated)
+            for seconds, statement in slowest:
+                shape = statement_shape(statement)
+                if seconds > self.slowest.get(shape, (0.0, None))[0]:
+                    self.slowest[shape] = (seconds, endpoint)
+            if len(self.slowest) > self.slow_statements:
+                keep = heapq.nlargest(self.slow_statements, self.slowest.items(), key=lambda item: item[1][0])
+                self.slowest = dict(keep)
+
+        response.headers['Server-Timing'] = 'app;dur=%.1f, sql;dur=%.1f, tpl;dur=%.1f' % (
+            duration * 1000, profile.sql_time * 1000, profile.template_time * 1000
+        )
+        return response
+
+    def _dump(self, profile, endpoint):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(
+                self.profile_dir, '%s-%d.prof' % (endpoint, time.time() * 1000)
+            ))
+        except OSError as e:
+            self.logger.error('could not write profile for %s: %s', endpoint, e)
+
+    def metrics(self):
+        # Prometheus text exposition format, version 0.0.4.
+        lines = []
+        with self._lock:
+            routes = sorted(self.routes.items())
+            slowest = sorted(self.slowest.items(), key=lambda item: -item[1][0])
+
+            lines.append('# HELP fyyur_request_duration_seconds Request wall time.')
+            lines.append('# TYPE fyyur_request_duration_seconds histogram')
+            for endpoint, stats in routes:
+                label = 'endpoint="%s"' % _label(endpoint)
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    lines.append('fyyur_request_duration_seconds_bucket{%s,le="%s"} %d' % (label, bound, count))
+                lines.append('fyyur_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (label, stats.requests))
+                lines.append('fyyur_request_duration_seconds_sum{%s} %.6f' % (label, stats.duration))
+                lines.append('fyyur_request_duration_seconds_count{%s} %d' % (label, stats.requests))
+
+            for name, help, attribute, format in (
+                ('fyyur_sql_statements_total', 'SQL statements executed.', 'statements', '%d'),
+                ('fyyur_sql_seconds_total', 'Time spent executing SQL.', 'sql_time', '%.6f'),
+                ('fyyur_template_seconds_total', 'Time spent rendering templates.', 'template_time', '%.6f'),
+                ('fyyur_n_plus_one_total', 'Requests repeating a statement shape past the N+1 threshold.', 'n_plus_one', '%d'),
+            ):
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s counter' % name)
+                for endpoint, stats in routes:
+                    lines.append(('%s{endpoint="%s"} ' + format) % (name, _label(endpoint), getattr(stats, attribute)))
+
+            lines.append('# HELP fyyur_slow_statement_seconds Slowest statements seen.')
+            lines.append('# TYPE fyyur_slow_statement_seconds gauge')
+            for shape, (seconds, endpoint) in slowest:
+                lines.append('fyyur_slow_statement_seconds{endpoint="%s",statement="%s"} %.6f' % (
+                    _label(endpoint), _label(shape[:200]), seconds
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'request_profile' in g:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('profile_started')
+    if not started or not has_request_context():
+        return
+    profile = g.get('request_profile')
+    elapsed = time.perf_counter() - started.pop()
+    if profile is not None:
+        profile.statements += 1
+        profile.sql_time += elapsed
+        profile.timings.append((elapsed, statement))
+
+
+profiler = Profiler()
@@ -0,0 +1,447 @@
+import base64
+import json
+from datetime import datetime
+from counters import upcoming_join
+from geo import within, distance_expression
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+
+#----------------------------------------------------------------------------#
+# Read queries used by the listing and detail views.
+#
+# Each read is split into a *_query builder and a *_result shaper around
+# the single .all(), so the async read paths in asgi.py run the very same
+# statements on their own engine.
+#----------------------------------------------------------------------------#
+
+LISTING_PAGE_SIZE = 50
+
+
+def encode_cursor(*values):
+    # Opaque ?after= token holding the sort key of the last row on a page.
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, keys):
+    # Raises ValueError on a malformed token, including one whose values do
+    # not have the types of the keys.
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError('invalid cursor')
+        values = [
+            datetime.fromisoformat(value) if isinstance(key.type, db.DateTime) else value
+            for key, value in zip(keys, values)
+        ]
+    except (TypeError, KeyError) as e:
+        raise ValueError('invalid cursor') from e
+    for key, value in zip(keys, values):
+        if isinstance(value, bool) or not isinstance(value, key.type.python_type):
+            raise ValueError('invalid cursor')
+    return values
+
+
+def keyset_query(query, keys, after=None, limit=LISTING_PAGE_SIZE):
+    # Seek past the row-value cursor instead of OFFSET so every page costs the
+    # same index range scan. One extra row tells whether a next page exists.
+    # The keys must be NOT NULL: a NULL compares neither before nor after
+    # the cursor, so its row would drop out of every page.
+    if after:
+        values = decode_cursor(after, keys)
+        query = query.filter(
+            db.tuple_(*keys) > db.tuple_(*[db.literal(value, key.type) for key, value in zip(keys, values)])
+        )
+    return query.order_by(*keys).limit(limit + 1)
+
+
+def keyset_result(rows, keys, limit=LISTING_PAGE_SIZE):
+    # Returns the page's rows and the next page's cursor.
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*[getattr(rows[-1], key.key) for key in keys])
+
+
+def keyset_page(query, keys, after=None, limit=LISTING_PAGE_SIZE):
+    return keyset_result(keyset_query(query, keys, after, limit).all(), keys, limit)
+
+
+VENUE_AREA_KEYS = (Venue.state, Venue.city, Venue.id)
+ARTIST_KEYS = (Artist.name, Artist.id)
+SHOW_KEYS = (Show.start_time, Show.id)
+
+
+def venue_areas_query(genre=None, state=None, after=None, limit=LISTING_PAGE_SIZE):
+    # One statement for a page of venues, grouped in Python by (city, state).
+    # Upcoming show counts come from the materialized counters (counters.py)
+    # rather than a COUNT over shows. The optional genre and state filters
+    # are served by the venue_genres (genre_id, venue_id) and Venue
+    # (state, city, id) indexes.
+    rows, num_upcoming_shows = upcoming_join(db.session.query(Venue), Venue)
+    rows = rows.with_entities(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        num_upcoming_shows.label('num_upcoming_shows')
+    ).filter(Venue.deleted_at.is_(None))
+    if genre:
+        rows = rows.join(
+            venue_genres, venue_genres.c.venue_id == Venue.id
+        ).join(
+            Genre, Genre.id == venue_genres.c.genre_id
+        ).filter(Genre.name == genre)
+    if state:
+        rows = rows.filter(Venue.state == state)
+    return keyset_query(rows, VENUE_AREA_KEYS, after, limit)
+
+
+def venue_areas_result(rows, limit=LISTING_PAGE_SIZE):
+    rows, next_after = keyset_result(rows, VENUE_AREA_KEYS, limit)
+    areas = {}
+    for row in rows:
+        key = (row.city, row.state)
+        area = areas.get(key)
+        if area is None:
+            area = areas[key] = {'city': row.city, 'state': row.state, 'venues': []}
+        area['venues'].append({
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        })
+    return list(areas.values()), next_after
+
+
+def venue_areas(genre=None, state=None, after=None, limit=LISTING_PAGE_SIZE):
+    return venue_areas_result(venue_areas_query(genre, state, after, limit).all(), limit)
+
+
+def artists_query(after=None, limit=LISTING_PAGE_SIZE):
+    return keyset_query(
+        db.session.query(Artist.id, Artist.name).filter(Artist.deleted_at.is_(None)),
+        ARTIST_KEYS, after, limit
+    )
+
+
+def artists_page(after=None, limit=LISTING_PAGE_SIZE):
+    return keyset_result(artists_query(after, limit).all(), ARTIST_KEYS, limit)
+
+
+def shows_query(after=None, limit=LISTING_PAGE_SIZE):
+    return keyset_query(
+        db.session.query(
+            Show.id,
+            Show.venue_id,
+            Venue.name.label('venue_name'),
+            Show.artist_id,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'),
+            Show.start_time
+        ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).filter(
+            Venue.deleted_at.is_(None), Artist.deleted_at.is_(None)
+        ),
+        SHOW_KEYS, after, limit
+    )
+
+
+def shows_page(after=None, limit=LISTING_PAGE_SIZE):
+    return keyset_result(shows_query(after, limit).all(), SHOW_KEYS, limit)
+
+
+SEARCH_PAGE_SIZE = 20
+
+
+def _search_rank(column, search_term):
+    # pg_trgm similarity on Postgres; elsewhere the shortest name is the
+    # closest substring match.
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.similarity(column, search_term).desc()
+    return db.func.length(column)
+
+
+LIKE_ESCAPE = '\\'
+
+
+def like_pattern(search_term):
+    # A pattern matching search_term anywhere, its own '%' and '_' taken
+    # literally (with escape=LIKE_ESCAPE).
+    for char in (LIKE_ESCAPE, '%', '_'):
+        search_term = search_term.replace(char, LIKE_ESCAPE + char)
+    return '%' + search_term + '%'
+
+
+# model -> its genre link table's owner column
+GENRE_LINKS = {Venue: venue_genres.c.venue_id, Artist: artist_genres.c.artist_id}
+
+
+def search_matches(model, pattern):
+    # Ids of the rows whose name, city or one of whose genres matches. Each
+    # arm of the UNION has its own index (pg_trgm on name and city, the
+    # genre names, then the (genre_id, owner) link index); an OR with an
+    # EXISTS over the links would leave Postgres no BitmapOr and scan the
+    # whole table.
+    owner_column = GENRE_LINKS[model]
+    genre_ids = db.select(Genre.id).where(Genre.name.ilike(pattern, escape=LIKE_ESCAPE))
+    return db.union(
+        db.select(model.id).where(model.name.ilike(pattern, escape=LIKE_ESCAPE)),
+        db.select(model.id).where(model.city.ilike(pattern, escape=LIKE_ESCAPE)),
+        db.select(owner_column).where(owner_column.table.c.genre_id.in_(genre_ids)),
+    )
+
+
+def search_query(model, search_term, page=1, per_page=SEARCH_PAGE_SIZE):
+    # Ranked, paged search over name, city and genres. The total hit count
+    # and each hit's materialized upcoming show count come back in the
+    # same statement.
+    pattern = like_pattern(search_term)
+    query, num_upcoming_shows = upcoming_join(db.session.query(model), model)
+    return query.with_entities(
+        model.id,
+        model.name,
+        num_upcoming_shows.label('num_upcoming_shows'),
+        db.func.count().over().label('total')
+    ).filter(
+        model.deleted_at.is_(None),
+        model.id.in_(search_matches(model, pattern))
+    ).order_by(
+        db.case((model.name.ilike(pattern, escape=LIKE_ESCAPE), 0), else_=1),
+        _search_rank(model.name, search_term),
+        model.id
+    ).limit(per_page).offset((page - 1) * per_page)
+
+
+def search_result(rows, page=1, per_page=SEARCH_PAGE_SIZE):
+    count = rows[0].total if rows else 0
+    return {
+        'count': count,
+        'page': page,
+        'has_next': page * per_page < count,
+        'data': [{
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row in rows]
+    }
+
+
+def search(model, search_term, page=1, per_page=SEARCH_PAGE_SIZE):
+    return search_result(search_query(model, search_term, page, per_page).all(), page, per_page)
+
+
+DETAIL_SHOWS_LIMIT = 20
+
+
+def _show_page_query(owner_column, owner_id, columns, joined, now, upcoming, limit, offset):
+    # One bounded, index-ordered page of a venue's or artist's shows. The
+    # total count rides along as an uncorrelated scalar subquery. Shows with
+    # a soft-deleted counterpart are left out of both.
+    if upcoming:
+        when, order = Show.start_time > now, (Show.start_time.asc(), Show.id.asc())
+    else:
+        when, order = Show.start_time <= now, (Show.start_time.desc(), Show.id.desc())
+    total = db.session.query(
+        db.func.count(Show.id)
+    ).join(
+        joined
+    ).filter(owner_column == owner_id, when, joined.deleted_at.is_(None)).scalar_subquery()
+    return db.session.query(
+        *columns, total.label('total')
+    ).select_from(Show).join(
+        joined
+    ).filter(
+        owner_column == owner_id, when, joined.deleted_at.is_(None)
+    ).order_by(*order).limit(limit).offset(offset)
+
+
+def show_page_result(rows):
+    # The page's rows and the total number of matching shows.
+    return rows, rows[0].total if rows else 0
+
+
+def venue_shows_query(venue_id, now, upcoming, limit=DETAIL_SHOWS_LIMIT, offset=0):
+    return _show_page_query(Show.venue_id, venue_id, (
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time
+    ), Artist, now, upcoming, limit, offset)
+
+
+def artist_shows_query(artist_id, now, upcoming, limit=DETAIL_SHOWS_LIMIT, offset=0):
+    return _show_page_query(Show.artist_id, artist_id, (
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        Show.start_time
+    ), Venue, now, upcoming, limit, offset)
+
+
+def venue_shows(venue_id, now, upcoming, limit=DETAIL_SHOWS_LIMIT, offset=0):
+    return show_page_result(venue_shows_query(venue_id, now, upcoming, limit, offset).all())
+
+
+def artist_shows(artist_id, now, upcoming, limit=DETAIL_SHOWS_LIMIT, offset=0):
+    return show_page_result(artist_shows_query(artist_id, now, upcoming, limit, offset).all())
+
+
+def bookings_query(owner_column, owner_id, start, end):
+    # One venue's or artist's shows overlapping [start, end), by start time.
+    # Postgres answers from the GiST index of the booking constraint. Other
+    # databases range scan (owner, start_time) from the last show starting
+    # before `start`, the only earlier one that can still be running.
+    query = db.session.query(Show.id, Show.artist_id, Show.venue_id, Show.start_time, Show.end_time)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.filter(
+            owner_column == owner_id,
+            db.literal_column('shows.during').op('&&')(db.func.tsrange(start, end))
+        )
+    else:
+        previous = db.session.query(db.func.max(Show.start_time)).filter(
+            owner_column == owner_id, Show.start_time < start
+        ).scalar_subquery()
+        query = query.filter(
+            owner_column == owner_id,
+            Show.start_time >= db.func.coalesce(previous, start),
+            Show.start_time < end,
+            Show.end_time > start,
+            Show.end_time > Show.start_time
+        )
+    return query.order_by(Show.start_time, Show.id)
+
+
+def free_slots(bookings, start, end):
+    # The gaps in [start, end) between bookings ordered by start time.
+    slots = []
+    free_from = start
+    for booking in bookings:
+        if booking.start_time > free_from:
+            slots.append((free_from, booking.start_time))
+        free_from = max(free_from, booking.end_time)
+    if free_from < end:
+        slots.append((free_from, end))
+    return slots
+
+
+NEARBY_LIMIT = 50
+
+
+def nearby_venues_query(latitude, longitude, miles, limit=NEARBY_LIMIT):
+    # The live venues within miles of the point, nearest first.
+    query, upcoming = upcoming_join(db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.latitude, Venue.longitude
+    ), Venue)
+    return query.add_columns(upcoming.label('num_upcoming_shows')).filter(
+        *within(latitude, longitude, miles)
+    ).order_by(distance_expression(latitude, longitude), Venue.id).limit(limit)
+
+
+def nearby_venues(latitude, longitude, miles, limit=NEARBY_LIMIT):
+    # Searches circles growing fourfold to miles, from about a mile and a
+    # half. Once one holds `limit` venues they are the nearest ones, so a
+    # dense city never sorts every venue in the full radius.
+    radii = [miles]
+    while radii[0] > 2:
+        radii.insert(0, radii[0] / 4.0)
+    for radius in radii:
+        rows = nearby_venues_query(latitude, longitude, radius, limit).all()
+        if len(rows) == limit:
+            break
+    return rows
+
+
+def nearby_shows_query(latitude, longitude, miles, start, end, limit=NEARBY_LIMIT):
+    # Shows starting in [start, end) at the live venues within miles of the
+    # point, soonest first.
+    return db.session.query(
+        Show.id, Show.start_time, Show.end_time,
+        Venue.id.label('venue_id'), Venue.name.label('venue_name'), Venue.latitude, Venue.longitude,
+        Artist.id.label('artist_id'), Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id).filter(
+        *within(latitude, longitude, miles)
+    ).filter(
+        Artist.deleted_at.is_(None), Show.start_time >= start, Show.start_time < end
+    ).order_by(Show.start_time, Show.id).limit(limit)
+
+
+#----------------------------------------------------------------------------#
+# Read models.
+#
+# Detail and edit pages render these slotted records, built from a
+# column-only select, instead of ORM instances: nothing is added to the
+# identity map and no view mutates a mapped object.
+#----------------------------------------------------------------------------#
+
+class ReadModel(object):
+    __slots__ = ()
+    # Columns selected from the model; the remaining slots are filled in
+    # by the view.
+    columns = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+
+class VenueDetail(ReadModel):
+    columns = (
+        'id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+        'facebook_link', 'website_link', 'seeking_talent', 'seeking_description'
+    )
+    __slots__ = columns + (
+        'genres', 'upcoming_shows', 'upcoming_shows_count', 'upcoming_shows_next',
+        'past_shows', 'past_shows_count', 'past_shows_next'
+    )
+
+
+class ArtistDetail(ReadModel):
+    columns = (
+        'id', 'name', 'city', 'state', 'phone', 'image_link',
+        'facebook_link', 'website', 'seeking_venue', 'seeking_description'
+    )
+    __slots__ = columns + (
+        'genres', 'upcoming_shows', 'upcoming_shows_count', 'upcoming_shows_next',
+        'past_shows', 'past_shows_count', 'past_shows_next'
+    )
+
+
+# read model -> (model, genre association owner column)
+DETAILS = {
+    VenueDetail: (Venue, venue_genres.c.venue_id),
+    ArtistDetail: (Artist, artist_genres.c.artist_id),
+}
+
+
+def detail_query(read_model, owner_id):
+    model, _ = DETAILS[read_model]
+    return db.session.query(
+        *[getattr(model, name) for name in read_model.columns]
+    ).filter(model.id == owner_id, model.deleted_at.is_(None)).limit(1)
+
+
+def detail_genres_query(read_model, owner_id):
+    _, owner_column = DETAILS[read_model]
+    return db.session.query(Genre.name).join(
+        owner_column.table, owner_column.table.c.genre_id == Genre.id
+    ).filter(owner_column == owner_id).order_by(Genre.name)
+
+
+def detail_result(read_model, rows, genre_rows=None):
+    # None if the row does not exist or was soft deleted.
+    if not rows:
+        return None
+    genres = None if genre_rows is None else [name for (name,) in genre_rows]
+    return read_model(genres=genres, **rows[0]._asdict())
+
+
+def _detail(read_model, owner_id, genres):
+    rows = detail_query(read_model, owner_id).all()
+    genre_rows = detail_genres_query(read_model, owner_id).all() if rows and genres else None
+    return detail_result(read_model, rows, genre_rows)
+
+
+def venue_detail(venue_id, genres=True):
+    return _detail(VenueDetail, venue_id, genres)
+
+
+def artist_detail(artist_id, genres=True):
+    return _detail(ArtistDetail, artist_id, genres)
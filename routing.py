@@ -0,0 +1,128 @@
+import itertools
+import threading
+import time
+from functools import wraps
+
+import flask
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm, text
+
+from config import engine_options
+
+#----------------------------------------------------------------------------#
+# Read-replica routing.
+#
+# Views marked @read_only run their queries on one of the configured
+# replicas (SQLALCHEMY_REPLICA_URIS), chosen round-robin per request and
+# skipping replicas that failed a health check. A commit pins the user to
+# the primary for DB_REPLICA_PIN_SECONDS so they read their own writes.
+# The page cache keeps everyone else from caching a lagging replica's
+# page under a new namespace version; see PageCache.invalidate.
+#----------------------------------------------------------------------------#
+
+PIN_KEY = '_db_primary_until'
+
+
+class ReplicaSet(object):
+
+    def __init__(self, uris, check_interval=5, retry_after=30):
+        self.engines = [create_engine(uri, **engine_options(uri)) for uri in uris]
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._order = itertools.cycle(range(len(self.engines)))
+        self._checked_at = [0.0] * len(self.engines)
+        self._down_until = [0.0] * len(self.engines)
+        self._lock = threading.Lock()
+
+    def choose(self):
+        # Next healthy replica, or None to fall back to the primary.
+        for _ in range(len(self.engines)):
+            with self._lock:
+                index = next(self._order)
+            if self.healthy(index):
+                return self.engines[index]
+        return None
+
+    def healthy(self, index):
+        now = time.monotonic()
+        if self._down_until[index] > now:
+            return False
+        if now - self._checked_at[index] < self.check_interval:
+            return True
+        self._checked_at[index] = now
+        try:
+            with self.engines[index].connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception:
+            self._down_until[index] = now + self.retry_after
+            return False
+        return True
+
+    def status(self):
+        now = time.monotonic()
+        return [
+            {'url': repr(engine.url), 'up': self._down_until[index] <= now}
+            for index, engine in enumerate(self.engines)
+        ]
+
+
+def read_only(view):
+    # Allow the view's queries to be served by a replica.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def read_from_primary():
+    # Keep the rest of the request off the replicas, e.g. to render a page
+    # the cache is about to store.
+    g.db_primary = True
+
+
+def use_replica():
+    if not has_request_context() or not g.get('db_read_only') or g.get('db_primary'):
+        return False
+    return flask.session.get(PIN_KEY, 0) <= time.time()
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replicas = self.app.extensions.get('replicas')
+        if replicas is not None and not self._flushing and use_replica():
+            if 'db_replica' not in g:
+                g.db_replica = replicas.choose()
+            if g.db_replica is not None:
+                return g.db_replica
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def commit(self):
+        SignallingSession.commit(self)
+        if self.app.extensions.get('replicas') is not None and has_request_context():
+            flask.session[PIN_KEY] = time.time() + self.app.config.get('DB_REPLICA_PIN_SECONDS', 10)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        SQLAlchemy.init_app(self, app)
+        self.init_replicas(app)
+
+    def init_replicas(self, app):
+        # Engines for SQLALCHEMY_REPLICA_URIS; without any, every query
+        # goes to the primary.
+        uris = app.config.get('SQLALCHEMY_REPLICA_URIS')
+        if not uris:
+            app.extensions.pop('replicas', None)
+            return
+        app.extensions['replicas'] = ReplicaSet(
+            uris,
+            check_interval=app.config.get('DB_REPLICA_CHECK_SECONDS', 5),
+            retry_after=app.config.get('DB_REPLICA_RETRY_SECONDS', 30)
+        )
@@ -2,3 +2,11 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+$(document).on('click', '.load-more button', function () {
+  var more = $(this).closest('.load-more');
+  $(this).prop('disabled', true);
+  $.get($(this).data('url'), function (html) {
+    more.replaceWith(html);
+  });
+});
@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+#----------------------------------------------------------------------------#
+# Test fixtures.
+#
+# One SQLite catalog from benchmarks/generate.py, seeded once per session.
+# Tests that write use `fresh_catalog`, which seeds it again afterwards so
+# every test sees the same rows. The page cache is off unless a test
+# swaps a backend in, so statement counts are those of the views.
+#----------------------------------------------------------------------------#
+
+# config.py reads the environment at import time.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fyyur-tests-'), 'fyyur.db')
+os.environ['CACHE_TYPE'] = 'null'
+os.environ['JOB_EXECUTOR_THREADS'] = '0'
+os.environ['PROFILING_ENABLED'] = 'false'
+os.environ['SECRET_KEY'] = 'tests'
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+
+SIZES = {'venues': 30, 'artists': 40, 'shows': 400}
+
+# Valid edit and create form submissions.
+VENUE_FORM = {
+    'name': 'Renamed Venue', 'city': 'New York', 'state': 'NY', 'address': '1 Main St',
+    'phone': '555-555-5555', 'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/venue',
+    'image_link': '', 'website_link': '', 'seeking_description': '',
+}
+
+ARTIST_FORM = {
+    'name': 'Renamed Artist', 'city': 'New York', 'state': 'NY', 'phone': '555-555-5555',
+    'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/artist', 'image_link': '',
+    'website_link': '', 'seeking_description': '',
+}
+
+ANCHOR = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+
+
+def seed(app):
+    from benchmarks.generate import seed_database
+    from models import db
+    with app.app_context():
+        seed_database(db, SIZES['venues'], SIZES['artists'], SIZES['shows'], anchor=ANCHOR, reset=True)
+        db.session.remove()
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    seed(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def fresh_catalog(app):
+    # For tests that write: the catalog is seeded again after the test.
+    yield
+    seed(app)
+
+
+@pytest.fixture
+def statements():
+    # The SQL statements run while the test is active, on every engine.
+    executed = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(Engine, 'before_cursor_execute', record)
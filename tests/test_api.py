@@ -0,0 +1,98 @@
+import gzip
+import json
+
+from models import db, Venue
+
+# The JSON API answers with ETags from the row versions, 304s on a matching
+# If-None-Match, ?fields= selections and gzip above COMPRESS_MIN_SIZE.
+
+
+def etag_of(response):
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    return etag
+
+
+def test_etag_is_stable_and_follows_the_rows(app, client, fresh_catalog):
+    first = client.get('/api/v1/venues/1')
+    assert first.status_code == 200
+    etag = etag_of(first)
+    assert etag_of(client.get('/api/v1/venues/1')) == etag
+    assert etag_of(client.get('/api/v1/venues/1?fields=id,name')) != etag
+
+    with app.app_context():
+        venue = db.session.get(Venue, 1)
+        venue.name = 'Renamed Venue'
+        venue.version += 1
+        db.session.commit()
+        db.session.remove()
+    changed = client.get('/api/v1/venues/1')
+    assert etag_of(changed) != etag
+    assert changed.get_json()['data']['name'] == 'Renamed Venue'
+
+
+def test_matching_if_none_match_answers_304(client):
+    etag = etag_of(client.get('/api/v1/venues/1'))
+    for header in ('"%s"' % etag, 'W/"%s"' % etag, '"other", "%s"' % etag):
+        response = client.get('/api/v1/venues/1', headers={'If-None-Match': header})
+        assert response.status_code == 304, header
+        assert response.get_data() == b''
+        assert etag_of(response) == etag
+
+    response = client.get('/api/v1/venues/1', headers={'If-None-Match': '"other"'})
+    assert response.status_code == 200
+
+
+def test_compressed_etag_answers_304(client):
+    # The gzipped listing carries "<etag>-gzip"; caches and proxies send it
+    # back as is or weakened.
+    headers = {'Accept-Encoding': 'gzip'}
+    compressed = client.get('/api/v1/shows', headers=headers)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    etag = etag_of(compressed)
+    assert etag.endswith('-gzip')
+    assert etag_of(client.get('/api/v1/shows')) + '-gzip' == etag
+
+    for header in ('"%s"' % etag, 'W/"%s"' % etag):
+        response = client.get('/api/v1/shows', headers=dict(headers, **{'If-None-Match': header}))
+        assert response.status_code == 304, header
+        assert 'Content-Encoding' not in response.headers
+
+
+def test_fields_selects_the_keys(client):
+    data = client.get('/api/v1/artists?fields=name,id,genres').get_json()['data']
+    assert data
+    assert all(list(item) == ['name', 'id', 'genres'] for item in data)
+    assert all(isinstance(item['genres'], list) for item in data)
+
+    show = client.get('/api/v1/shows/1?fields=venue_name').get_json()['data']
+    assert list(show) == ['venue_name']
+
+
+def test_unknown_field_is_a_400(client):
+    for path in ('/api/v1/venues?fields=id,nope', '/api/v1/artists/1?fields=password'):
+        response = client.get(path)
+        assert response.status_code == 400, path
+        assert response.get_json()['error'].startswith('Unknown fields: ')
+    assert client.get('/api/v1/venues?fields=id,nope').get_json()['error'] == 'Unknown fields: nope'
+
+
+def test_gzip_compression_and_vary(client):
+    plain = client.get('/api/v1/venues')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    compressed = client.get('/api/v1/venues', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    body = gzip.decompress(compressed.get_data())
+    assert len(compressed.get_data()) < len(body)
+    assert json.loads(body) == plain.get_json()
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get('/api/v1/venues/1?fields=id', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.get_json() == {'data': {'id': 1}}
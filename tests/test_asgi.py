@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('asgiref')
+pytest.importorskip('aiosqlite')
+
+# asgi.AsyncApp serves the listing, detail and search pages from coroutines
+# on an aiosqlite engine over the same catalog; the pages must come out
+# the same as the WSGI app's, and every other route falls through to it.
+
+GETS = ['/venues', '/venues?state=NY', '/venues/1', '/venues/7', '/artists', '/artists/1', '/artists/12',
+        '/shows', '/venues/9999', '/api/v1/venues/1', '/venues/1/availability']
+
+SEARCHES = [('/venues/search', 'a'), ('/artists/search', 'band')]
+
+
+def served_async(app, requests):
+    from asgi import AsyncApp
+    application = AsyncApp(app)
+
+    async def run():
+        transport = httpx.ASGITransport(app=application)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+                return [await client.request(method, path, data=data) for method, path, data in requests]
+        finally:
+            await application.engine.dispose()
+    return asyncio.run(run())
+
+
+def test_async_pages_match_the_wsgi_app(app, client, monkeypatch):
+    import asgi
+    fetched = []
+    fetch = asgi.fetch
+
+    async def counting_fetch(connection, query):
+        fetched.append(query)
+        return await fetch(connection, query)
+    monkeypatch.setattr(asgi, 'fetch', counting_fetch)
+
+    requests = [('GET', path, None) for path in GETS]
+    requests += [('POST', path, {'search_term': term}) for path, term in SEARCHES]
+    responses = served_async(app, requests)
+    assert fetched
+    for (method, path, data), response in zip(requests, responses):
+        expected = client.open(path, method=method, data=data)
+        assert response.status_code == expected.status_code, path
+        assert response.headers['Content-Type'] == expected.headers['Content-Type'], path
+        assert response.content == expected.get_data(), path
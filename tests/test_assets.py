@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import pytest
+from flask import render_template, url_for
+
+import assets as pipeline
+from assets import assets, build, clean_command, BUNDLES, DIST_DIR, IMMUTABLE_MAX_AGE
+
+# `flask assets build` into a copy of static/: hashed names, url_for
+# rewritten through the manifest, precompressed immutable responses, and
+# `flask assets clean` removing only what the manifest no longer names.
+
+HASHED = re.compile(r'^dist/(.+)\.([0-9a-f]{%d})((?:\.\w+)?)$' % pipeline.HASH_LENGTH)
+
+
+@pytest.fixture
+def built(app, tmp_path, monkeypatch):
+    # The app serving a built copy of static/; yields a function that
+    # builds it again, as `flask assets build` does.
+    static = str(tmp_path / 'static')
+    shutil.copytree(app.static_folder, static, ignore=shutil.ignore_patterns(DIST_DIR))
+    manifest_path = str(tmp_path / 'assets-manifest.json')
+    monkeypatch.setattr(app, 'static_folder', static)
+    monkeypatch.setattr(assets, 'manifest_path', manifest_path)
+    monkeypatch.setattr(assets, 'files', {})
+    monkeypatch.setattr(assets, 'encodings', {})
+
+    def rebuild():
+        manifest, report = build(static)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        assets.load()
+        return manifest
+    rebuild.static = static
+    return rebuild
+
+
+def read(static, name):
+    with open(os.path.join(static, *name.split('/')), 'rb') as f:
+        return f.read()
+
+
+def test_files_are_hashed_by_content(built):
+    manifest = built()
+    files = manifest['files']
+    assert set(BUNDLES) <= set(files)
+    assert 'css/main.css' in files and 'img/front-splash.jpg' in files
+    for source, name in files.items():
+        found = HASHED.match(name)
+        assert found, name
+        assert found.group(1) + found.group(3) == source
+        assert found.group(2) == hashlib.sha256(read(built.static, name)).hexdigest()[:pipeline.HASH_LENGTH]
+    # Unchanged sources build to the same names.
+    assert built()['files'] == files
+
+
+def test_url_for_goes_through_the_manifest(app, built):
+    with app.test_request_context('/'):
+        assert assets.urls('css/site.css') == [url_for('static', filename=part) for part in BUNDLES['css/site.css']]
+        assert url_for('static', filename='css/main.css') == '/static/css/main.css'
+    files = built()['files']
+    with app.test_request_context('/'):
+        assert url_for('static', filename='css/main.css') == '/static/' + files['css/main.css']
+        assert assets.urls('css/site.css') == ['/static/' + files['css/site.css']]
+        assert url_for('static', filename='no/such.css') == '/static/no/such.css'
+        page = render_template('layouts/form.html')
+    assert 'href="/static/%s"' % files['css/site.css'] in page
+    assert 'href="/static/%s"' % files['css/layout.forms.css'] in page
+    assert 'src="/static/%s"' % files['js/site.js'] in page
+    assert '<link rel="shortcut icon" href="/static/ico/favicon.png">' in page
+
+
+def test_built_files_are_served_precompressed_and_immutable(client, built):
+    manifest = built()
+    name = manifest['files']['css/site.css']
+    assert 'gzip' in manifest['encodings'][name]
+    content = read(built.static, name)
+
+    compressed = client.get('/static/' + name, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.status_code == 200
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.mimetype == 'text/css'
+    assert gzip.decompress(compressed.get_data()) == content
+
+    plain = client.get('/static/' + name)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_data() == content
+
+    for response in (compressed, plain):
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert response.cache_control.public and response.cache_control.immutable
+        assert response.cache_control.max_age == IMMUTABLE_MAX_AGE
+        response.close()
+
+    image = client.get('/static/' + manifest['files']['img/front-splash.jpg'], headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in image.headers and 'Vary' not in image.headers
+    assert image.cache_control.immutable
+    image.close()
+
+    source = client.get('/static/css/main.css')
+    assert not source.cache_control.immutable
+    source.close()
+
+
+def test_clean_keeps_the_live_files(app, built):
+    old = built()['files']['css/main.css']
+    with open(os.path.join(built.static, 'css', 'main.css'), 'a') as f:
+        f.write('\n.cleaned { color: red; }\n')
+    manifest = built()
+    current = manifest['files']
+    assert current['css/main.css'] != old
+    assert os.path.exists(os.path.join(built.static, *old.split('/')))
+
+    result = app.test_cli_runner().invoke(clean_command)
+    assert result.exit_code == 0, result.output
+    assert re.match(r'^[1-9]\d* stale files removed$', result.output.strip())
+    for name in (old, old + '.gz'):
+        assert not os.path.exists(os.path.join(built.static, *name.split('/')))
+    for name in current.values():
+        assert os.path.exists(os.path.join(built.static, *name.split('/')))
+    for name, encodings in manifest['encodings'].items():
+        if 'gzip' in encodings:
+            assert os.path.exists(os.path.join(built.static, *name.split('/')) + '.gz')
+
+    again = app.test_cli_runner().invoke(clean_command)
+    assert again.output.strip() == '0 stale files removed'
@@ -0,0 +1,74 @@
+import pytest
+
+from cache import cache, LRUBackend, RedisBackend
+
+# The page cache against an in-memory Redis. Each test swaps its backend
+# in and restores the null backend the other tests run with.
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def redis_backend():
+    backend = RedisBackend(client=fakeredis.FakeRedis(), default_timeout=60)
+    previous, previous_timeout = cache.backend, cache.timeout
+    cache.backend, cache.timeout = backend, 60
+    yield backend
+    cache.backend, cache.timeout = previous, previous_timeout
+
+
+def test_get_set_and_get_many(redis_backend):
+    assert redis_backend.get('missing') is None
+    redis_backend.set('a', 'α')
+    redis_backend.set_many({'b': '2', 'c': '3'})
+    assert redis_backend.get('a') == 'α'
+    assert redis_backend.get_many(['a', 'missing', 'c']) == ['α', None, '3']
+    assert redis_backend.client.ttl('fyyur:b') == 60
+
+
+def test_incr_counts_from_zero(redis_backend):
+    assert redis_backend.incr('ns:venues') == 1
+    assert redis_backend.incr('ns:venues') == 2
+    assert redis_backend.get('ns:venues') == '2'
+
+
+def test_keys_are_prefixed(redis_backend):
+    redis_backend.set('a', '1')
+    assert redis_backend.client.keys('*') == [b'fyyur:a']
+
+
+def test_a_namespace_bump_retires_its_pages(app, client, redis_backend, fresh_catalog):
+    first = client.get('/venues/1')
+    assert first.status_code == 200
+    assert cache.stats()['misses'] > 0
+    hits = cache.stats()['hits']
+    assert client.get('/venues/1').get_data() == first.get_data()
+    assert cache.stats()['hits'] == hits + 1
+
+    response = client.post('/venues/1/edit', data={
+        'name': 'Renamed Venue', 'city': 'New York', 'state': 'NY', 'address': '1 Main St',
+        'phone': '555-555-5555', 'genres': 'Jazz', 'facebook_link': '', 'image_link': '',
+        'website_link': '', 'seeking_description': '',
+    })
+    assert response.status_code == 302
+    assert b'Renamed Venue' in client.get('/venues/1').get_data()
+    assert b'Renamed Venue' in client.get('/venues').get_data()
+
+
+def test_fragments_follow_their_namespace(app, redis_backend):
+    with app.test_request_context('/'):
+        prefix, values = cache.fragments(['shows'], ['a', 'b'])
+        assert values == [None, None]
+        cache.store_fragments(prefix, {'a': '1'})
+        assert cache.fragments(['shows'], ['a', 'b'])[1] == ['1', None]
+        cache.invalidate('shows')
+        assert cache.fragments(['shows'], ['a', 'b'])[1] == [None, None]
+
+
+def test_lru_counters_survive_eviction():
+    backend = LRUBackend(max_entries=2)
+    backend.incr('ns:venues')
+    for key in 'abc':
+        backend.set(key, key)
+    assert backend.get('a') is None
+    assert backend.get('ns:venues') == 1
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from cache import cache, LRUBackend
+from timeline import shows_calendar
+
+# The show calendar's window arguments and its per-bucket cache.
+
+
+@pytest.fixture
+def lru_backend():
+    backend = LRUBackend(max_entries=1024, default_timeout=60)
+    previous, previous_timeout = cache.backend, cache.timeout
+    cache.backend, cache.timeout = backend, 60
+    yield backend
+    cache.backend, cache.timeout = previous, previous_timeout
+
+
+@pytest.mark.parametrize('path', ['/shows/calendar', '/api/v1/shows/calendar'])
+@pytest.mark.parametrize('query', [
+    'from=2024-01-01T00:00:00%2B00:00&to=2024-02-01',
+    'from=2024-01-01&to=2024-02-01T00:00:00Z',
+    'from=2024-01-01T02:00:00%2B02:00&to=2024-02-01T00:00:00Z',
+])
+def test_zoned_windows_are_read_as_utc(client, path, query):
+    response = client.get(path + '?' + query)
+    assert response.status_code == 200
+    if path.startswith('/api/'):
+        data = response.get_json()['data']
+        assert data['from'].startswith('2024-01-01T00:00:00')
+        assert data['to'].startswith('2024-02-01T00:00:00')
+
+
+def test_filters_do_not_share_cache_keys(app, lru_backend, statements):
+    # Joined as 'city=..:state=..', these two used to make the same key.
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 8)
+    with app.test_request_context('/'):
+        shows_calendar('day', start, end, city='New York:state=NY', state='')
+        del statements[:]
+        shows_calendar('day', start, end, city='New York', state='NY:state=')
+        assert any('GROUP BY' in statement for statement in statements)
@@ -0,0 +1,51 @@
+from conftest import ARTIST_FORM, VENUE_FORM
+from counters import check
+from models import db, Venue
+
+# Soft-deleted venues and artists can be neither edited nor booked, and
+# their shows drop out of the upcoming show counters.
+
+
+def test_soft_deleted_venue_cannot_be_edited(client, fresh_catalog):
+    assert client.delete('/venues/1?soft=1').status_code == 200
+    assert client.get('/venues/1/edit').status_code == 404
+    assert client.post('/venues/1/edit', data=VENUE_FORM).status_code == 404
+    assert client.delete('/venues/1?soft=1').status_code == 404
+
+
+def test_soft_deleted_artist_cannot_be_edited(client, fresh_catalog):
+    assert client.delete('/artists/1?soft=1').status_code == 200
+    assert client.get('/artists/1/edit').status_code == 404
+    assert client.post('/artists/1/edit', data=ARTIST_FORM).status_code == 404
+
+
+def test_soft_deleted_owners_cannot_be_booked(client, fresh_catalog):
+    show = {'start_time': '2040-01-01 20:00:00'}
+    assert client.delete('/venues/1?soft=1').status_code == 200
+    assert client.delete('/artists/2?soft=1').status_code == 200
+    response = client.post('/shows/create', data=dict(show, venue_id='1', artist_id='1'))
+    assert response.status_code == 409
+    assert b'The venue is not listed' in response.data
+    response = client.post('/shows/create', data=dict(show, venue_id='2', artist_id='2'))
+    assert response.status_code == 409
+    assert b'The artist is not listed' in response.data
+    assert client.post('/shows/create', data=dict(show, venue_id='999', artist_id='1')).status_code == 409
+    assert client.post('/shows/create', data=dict(show, venue_id='2', artist_id='1')).status_code == 200
+
+
+def test_soft_delete_bumps_the_version(app, client, fresh_catalog):
+    with app.app_context():
+        before = db.session.get(Venue, 1).version
+        db.session.remove()
+    assert client.delete('/venues/1?soft=1').status_code == 200
+    with app.app_context():
+        assert db.session.get(Venue, 1).version == before + 1
+        db.session.remove()
+
+
+def test_counters_skip_soft_deleted_shows(app, client, fresh_catalog):
+    for path in ('/venues/1?soft=1', '/artists/1?soft=1', '/venues/2'):
+        assert client.delete(path).status_code == 200
+        with app.app_context():
+            assert check(sample=1000) == []
+            db.session.remove()
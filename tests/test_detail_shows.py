@@ -0,0 +1,44 @@
+import re
+
+import pytest
+
+from models import db, now_utc, Show
+from queries import DETAIL_SHOWS_LIMIT
+
+# The venue and artist pages show DETAIL_SHOWS_LIMIT upcoming and past
+# shows each, with a "load more" link to the next page of either.
+
+
+def busiest(app, owner_column, upcoming):
+    now = now_utc()
+    with app.app_context():
+        when = Show.start_time > now if upcoming else Show.start_time <= now
+        owner_id, count = db.session.query(owner_column, db.func.count()).filter(when).group_by(
+            owner_column).order_by(db.func.count().desc(), owner_column).first()
+        db.session.remove()
+    return owner_id, count
+
+
+def load_more_url(html):
+    found = re.findall(r'data-url="([^"]+)"', html)
+    return found[0].replace('&amp;', '&') if found else None
+
+
+@pytest.mark.parametrize('owner, column', [('venue', Show.venue_id), ('artist', Show.artist_id)])
+@pytest.mark.parametrize('when', ['upcoming', 'past'])
+def test_every_show_is_reachable_through_load_more(app, client, owner, column, when):
+    owner_id, count = busiest(app, column, when == 'upcoming')
+    assert count > DETAIL_SHOWS_LIMIT
+    html = client.get('/%ss/%d' % (owner, owner_id)).get_data(as_text=True)
+    section = html.split('Upcoming Show')[1].split('Past Show')[0] if when == 'upcoming' else html.split('Past Show')[1]
+    url = load_more_url(section)
+    assert url == '/%ss/%d/%s_shows?offset=%d' % (owner, owner_id, when, DETAIL_SHOWS_LIMIT)
+    seen = section.count('tile-show')
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        assert 'Load more %s shows' % when in page or load_more_url(page) is None
+        seen += page.count('tile-show')
+        url = load_more_url(page)
+    assert seen == count
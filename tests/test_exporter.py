@@ -0,0 +1,83 @@
+import csv
+import io
+import tracemalloc
+from datetime import datetime, timedelta
+
+from models import db, Show
+from exporter import export_lines, export_query
+
+# Exports stream: memory stays flat however many rows they cover.
+
+EXTRA_SHOWS = 20000
+
+BATCH_SIZE = 250
+
+
+def add_shows(app, count):
+    # One show a day at each seeded venue, each with its own artist, far
+    # enough ahead to book nobody twice.
+    from conftest import SIZES
+    first_day = datetime(2040, 1, 1, 20)
+    with app.app_context():
+        first = db.session.query(db.func.max(Show.id)).scalar() + 1
+        rows = []
+        for index in range(count):
+            day, venue = divmod(index, SIZES['venues'])
+            start = first_day + timedelta(days=day)
+            rows.append({
+                'id': first + index, 'start_time': start, 'end_time': start + timedelta(hours=2),
+                'venue_id': venue + 1, 'artist_id': venue + 1, 'version': 1,
+            })
+        db.session.execute(Show.__table__.insert(), rows)
+        db.session.commit()
+        db.session.remove()
+
+
+def streamed(app, limit, format):
+    # (bytes written, peak bytes allocated while streaming), in batches
+    # small enough that one batch is a fraction of the output.
+    with app.app_context():
+        query = export_query('shows').limit(limit)
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in export_lines(query, format, batch_size=BATCH_SIZE))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        db.session.remove()
+    return size, peak
+
+
+def test_export_memory_does_not_grow_with_rows(app, fresh_catalog):
+    add_shows(app, EXTRA_SHOWS)
+    for format in ('csv', 'ndjson'):
+        small_size, small_peak = streamed(app, EXTRA_SHOWS // 8, format)
+        large_size, large_peak = streamed(app, EXTRA_SHOWS, format)
+        assert large_size > 7 * small_size
+        assert large_peak < 2 * small_peak
+        assert large_peak < large_size / 4
+
+
+def test_genres_are_exported_in_name_order(app, client):
+    rows = list(csv.DictReader(io.StringIO(client.get('/export/venues.csv').get_data(as_text=True))))
+    assert rows
+    genres = [row['genres'].split(',') for row in rows if row['genres']]
+    assert any(len(names) > 1 for names in genres)
+    assert all(names == sorted(names) for names in genres)
+
+
+def test_zoned_bounds_are_read_as_utc(client):
+    from conftest import ANCHOR
+    start, end = ANCHOR + timedelta(days=1), ANCHOR + timedelta(days=31)
+
+    def exported(start, end):
+        response = client.get('/export/shows.csv', query_string={'from': start, 'to': end})
+        assert response.status_code == 200
+        return response.get_data(as_text=True)
+
+    utc = exported(start.isoformat(), end.isoformat())
+    assert utc.count('\n') > 1
+    zoned = exported((start + timedelta(hours=9)).isoformat() + '+09:00',
+                     (end - timedelta(hours=5)).isoformat() + '-05:00')
+    assert zoned == utc
+    assert exported(start.isoformat() + '+09:00', end.isoformat() + '-05:00') != utc
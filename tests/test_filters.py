@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import pytest
+
+from app import DATETIME_FORMATS, format_datetime
+
+# The datetime filter formats like babel.dates.format_datetime, with the
+# app's own 'full' and 'medium' patterns.
+
+NAIVE = datetime(2030, 3, 14, 20, 30)
+EASTERN = timezone(timedelta(hours=-5), 'EST')
+
+
+@pytest.mark.parametrize('value', [NAIVE, NAIVE.replace(tzinfo=timezone.utc), NAIVE.replace(tzinfo=EASTERN)])
+@pytest.mark.parametrize('format', ['full', 'long', 'medium', 'short', 'yyyy-MM-dd HH:mm zzzz'])
+@pytest.mark.parametrize('locale', ['en', 'fr'])
+def test_matches_babel(value, format, locale):
+    expected = babel.dates.format_datetime(value, DATETIME_FORMATS.get(format, format), locale=locale)
+    assert format_datetime(value, format, locale) == expected
+
+
+def test_named_formats_are_not_patterns():
+    assert format_datetime(NAIVE, 'short') == babel.dates.format_datetime(NAIVE, 'short', locale='en')
+    assert 'short' not in format_datetime(NAIVE, 'short')
+
+
+def test_the_same_instant_in_two_zones():
+    utc = NAIVE.replace(tzinfo=timezone.utc)
+    eastern = utc.astimezone(EASTERN)
+    assert utc == eastern
+    assert format_datetime(utc, 'HH:mm') == '20:30'
+    assert format_datetime(eastern, 'HH:mm') == '15:30'
+
+
+def test_strings_are_parsed():
+    assert format_datetime('2030-03-14 20:30:00', 'full') == format_datetime(NAIVE, 'full')
@@ -0,0 +1,80 @@
+import logging.config
+import os
+import re
+
+import flask_migrate
+import sqlalchemy as sa
+from flask import Flask
+
+from models import db
+
+# Genres: the /venues filters and the migration that moved them from
+# comma-joined strings into link tables.
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def listed_venues(client, query):
+    body = client.get('/venues?' + query).get_data(as_text=True)
+    return set(int(id) for id in re.findall(r'href="/venues/(\d+)"', body))
+
+
+def test_venues_filter_by_genre_and_state(app, client):
+    with app.app_context():
+        rows = db.session.execute(sa.text(
+            'SELECT v.id, v.state, g.name FROM "Venue" v '
+            'JOIN venue_genres l ON l.venue_id = v.id JOIN "Genre" g ON g.id = l.genre_id'
+        )).fetchall()
+        db.session.remove()
+    genre, state = rows[0].name, rows[0].state
+    assert listed_venues(client, 'genre=' + genre) == set(id for id, _, name in rows if name == genre)
+    assert listed_venues(client, 'genre=%s&state=%s' % (genre, state)) == set(
+        id for id, venue_state, name in rows if name == genre and venue_state == state
+    )
+    assert listed_venues(client, 'genre=No+Such+Genre') == set()
+
+
+def test_genre_strings_move_into_link_tables_and_back(tmp_path, monkeypatch):
+    # Runs the migrations on an empty SQLite file of its own. env.py's
+    # logging setup would silence the app's loggers for later tests.
+    monkeypatch.setattr(logging.config, 'fileConfig', lambda *args, **kwargs: None)
+    migrating = Flask(__name__)
+    migrating.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + str(tmp_path / 'migrations.db'),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+    )
+    db.init_app(migrating)
+    flask_migrate.Migrate(migrating, db, directory=MIGRATIONS)
+    with migrating.app_context():
+        flask_migrate.upgrade(revision='a3c1f09b2d41')
+        engine = db.get_engine()
+        with engine.begin() as connection:
+            connection.execute(sa.text(
+                'INSERT INTO "Venue" (id, name, city, state, seeking_talent, genres) VALUES '
+                "(1, 'A', 'X', 'NY', 0, 'Jazz, Blues'), (2, 'B', 'X', 'NY', 0, 'Polka'), (3, 'C', 'X', 'NY', 0, NULL)"
+            ))
+            connection.execute(sa.text(
+                'INSERT INTO "Artist" (id, name, city, state, seeking_venue, genres) VALUES '
+                "(1, 'D', 'X', 'NY', 0, 'Jazz,Jazz')"
+            ))
+
+        flask_migrate.upgrade(revision='c52e8d7a9f10')
+        with engine.connect() as connection:
+            links = connection.execute(sa.text(
+                'SELECT l.venue_id, g.name FROM venue_genres l JOIN "Genre" g ON g.id = l.genre_id'
+            )).fetchall()
+            assert sorted(links) == [(1, 'Blues'), (1, 'Jazz'), (2, 'Polka')]
+            assert connection.execute(sa.text(
+                'SELECT g.name FROM artist_genres l JOIN "Genre" g ON g.id = l.genre_id'
+            )).fetchall() == [('Jazz',)]
+            # The old choice list is seeded whether or not anything used it.
+            assert connection.execute(sa.text('SELECT count(*) FROM "Genre" WHERE name = \'Reggae\'')).scalar() == 1
+
+        flask_migrate.downgrade(revision='a3c1f09b2d41')
+        with engine.connect() as connection:
+            assert connection.execute(sa.text('SELECT id, genres FROM "Venue" ORDER BY id')).fetchall() == [
+                (1, 'Blues,Jazz'), (2, 'Polka'), (3, None)
+            ]
+        # And on through every later migration.
+        flask_migrate.upgrade()
+        engine.dispose()
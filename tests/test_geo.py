@@ -0,0 +1,182 @@
+import math
+import random
+from datetime import timedelta
+
+import pytest
+
+import geo
+from conftest import ANCHOR
+from models import db, Venue, Show, Artist
+
+# The nearby searches against a brute-force great-circle filter over the
+# seeded catalog. within() measures on a flat projection, under 1% off at
+# these radii, so venues that close to the edge may go either way.
+
+EARTH_MILES = 3958.8
+
+TOLERANCE = 0.01
+
+NEW_YORK = (40.7128, -74.0060)
+
+
+def haversine(latitude, longitude, to_latitude, to_longitude):
+    dlat = math.radians(to_latitude - latitude)
+    dlng = math.radians(to_longitude - longitude)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(latitude)) * math.cos(math.radians(to_latitude)) * math.sin(dlng / 2) ** 2)
+    return 2 * EARTH_MILES * math.asin(math.sqrt(a))
+
+
+def venue_points(app):
+    with app.app_context():
+        rows = db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(
+            Venue.deleted_at.is_(None), Venue.latitude.isnot(None)
+        ).all()
+        db.session.remove()
+    return rows
+
+
+def brute_force(app, latitude, longitude, miles):
+    # (ids surely within miles, ids within miles give or take TOLERANCE)
+    distances = {id: haversine(latitude, longitude, lat, lng) for id, lat, lng in venue_points(app)}
+    surely = {id for id, distance in distances.items() if distance <= miles * (1 - TOLERANCE)}
+    maybe = {id for id, distance in distances.items() if distance <= miles * (1 + TOLERANCE)}
+    return surely, maybe
+
+
+def corner(latitude, longitude, precision):
+    # The south west corner of the geohash cell holding the point, where
+    # four cells meet.
+    height, width = geo.cell_size(precision)
+    return (math.floor((latitude + 90) / height) * height - 90,
+            math.floor((longitude + 180) / width) * width - 180)
+
+
+def nearby(client, latitude, longitude, miles):
+    response = client.get('/venues/nearby?lat=%r&lng=%r&radius=%r' % (latitude, longitude, miles))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def assert_matches_brute_force(app, client, latitude, longitude, miles):
+    surely, maybe = brute_force(app, latitude, longitude, miles)
+    venues = nearby(client, latitude, longitude, miles)['venues']
+    found = [venue['id'] for venue in venues]
+    assert len(found) == len(set(found))
+    assert surely <= set(found) <= maybe
+    distances = [venue['distance'] for venue in venues]
+    assert distances == sorted(distances)
+    return found
+
+
+def test_distance_is_within_a_percent_of_great_circle():
+    rng = random.Random(0)
+    assert geo.distance_miles(*NEW_YORK, *NEW_YORK) == 0
+    for _ in range(200):
+        latitude, longitude = rng.uniform(25, 49), rng.uniform(-125, -67)
+        to_latitude = latitude + rng.uniform(-1.5, 1.5)
+        to_longitude = longitude + rng.uniform(-1.5, 1.5)
+        exact = haversine(latitude, longitude, to_latitude, to_longitude)
+        assert geo.distance_miles(latitude, longitude, to_latitude, to_longitude) == pytest.approx(exact, rel=TOLERANCE)
+
+
+@pytest.mark.parametrize('box', [
+    (40.5, -74.3, 40.9, -73.7),
+    (-0.2, -0.2, 0.2, 0.2),
+    (89.0, 170.0, 90.0, 180.0),
+    (-90.0, -180.0, -89.5, -179.0),
+    (10.0, -100.0, 40.0, -60.0),
+])
+def test_cover_holds_every_point_in_the_box(box):
+    south, west, north, east = box
+    ranges = geo.cover(south, west, north, east)
+    assert 0 < len(ranges) <= geo.MAX_COVER_CELLS
+    assert ranges == sorted(ranges, key=lambda bounds: bounds[0])
+    rng = random.Random(1)
+    points = [(south, west), (south, east), (north, west), (north, east)]
+    points += [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(500)]
+    for latitude, longitude in points:
+        geohash = geo.encode(latitude, longitude)
+        assert any(low <= geohash and (high is None or geohash < high) for low, high in ranges), (latitude, longitude)
+
+
+def test_within_matches_brute_force(app):
+    latitude, longitude = NEW_YORK
+    surely, maybe = brute_force(app, latitude, longitude, 10)
+    assert surely
+    with app.app_context():
+        found = {id for id, in db.session.query(Venue.id).filter(*geo.within(latitude, longitude, 10))}
+        db.session.remove()
+    assert surely <= found <= maybe
+
+
+@pytest.mark.parametrize('miles', [1, 5, 15, 40, 100])
+def test_nearby_venues_matches_brute_force(app, client, miles):
+    assert_matches_brute_force(app, client, NEW_YORK[0], NEW_YORK[1], miles)
+
+
+def test_nearby_venues_on_a_cell_boundary(app, client, fresh_catalog):
+    # Venues a hair either side of the corner of four cells, in each of
+    # the four, and one on it: the cover must take in all of them.
+    latitude, longitude = corner(NEW_YORK[0], NEW_YORK[1], 5)
+    offset = 1e-7
+    points = [(latitude, longitude)] + [
+        (latitude + north * offset, longitude + east * offset) for north in (-1, 1) for east in (-1, 1)
+    ]
+    assert len({geo.encode(*point, precision=5) for point in points}) == 4
+    with app.app_context():
+        first = db.session.query(db.func.max(Venue.id)).scalar() + 1
+        db.session.execute(Venue.__table__.insert(), [{
+            'id': id, 'name': 'Corner %d' % id, 'city': 'New York', 'state': 'NY',
+            'latitude': lat, 'longitude': lng, 'geohash': geo.encode(lat, lng),
+            'seeking_talent': False, 'version': 1,
+        } for id, (lat, lng) in enumerate(points, first)])
+        db.session.commit()
+        db.session.remove()
+    corners = set(range(first, first + len(points)))
+
+    for miles in (0.01, 2, 25):
+        found = assert_matches_brute_force(app, client, latitude, longitude, miles)
+        assert corners <= set(found)
+
+
+def test_nearby_shows_matches_brute_force(app, client):
+    latitude, longitude = NEW_YORK
+    start, end = ANCHOR, ANCHOR + timedelta(days=60)
+    surely, maybe = brute_force(app, latitude, longitude, 40)
+    with app.app_context():
+        shows = db.session.query(Show.id, Show.venue_id).join(Artist).filter(
+            Artist.deleted_at.is_(None), Show.start_time >= start, Show.start_time < end
+        ).all()
+        db.session.remove()
+    response = client.get('/shows/nearby?lat=%r&lng=%r&radius=40&from=%s&to=%s' % (
+        latitude, longitude, start.isoformat(), end.isoformat()
+    ))
+    assert response.status_code == 200
+    found = response.get_json()['shows']
+    assert len(found) < 50
+    assert {show['show_id'] for show in found} >= {id for id, venue_id in shows if venue_id in surely}
+    assert {show['show_id'] for show in found} <= {id for id, venue_id in shows if venue_id in maybe}
+    assert [show['start_time'] for show in found] == sorted(show['start_time'] for show in found)
+
+
+def test_radius_is_clamped(app, client):
+    largest = float(app.config['NEARBY_MAX_MILES'])
+    clamped = nearby(client, NEW_YORK[0], NEW_YORK[1], largest * 10)
+    assert clamped['radius'] == largest
+    assert clamped['venues'] == nearby(client, NEW_YORK[0], NEW_YORK[1], largest)['venues']
+
+    response = client.get('/shows/nearby?lat=40.7&lng=-74&radius=%r' % (largest * 10))
+    assert response.status_code == 200
+    assert response.get_json()['radius'] == largest
+
+
+@pytest.mark.parametrize('query', [
+    '', 'lat=40.7', 'lng=-74', 'lat=north&lng=-74', 'lat=40.7&lng=west',
+    'lat=91&lng=-74', 'lat=-90.5&lng=-74', 'lat=40.7&lng=181', 'lat=40.7&lng=-180.5',
+    'lat=nan&lng=-74', 'lat=40.7&lng=-74&radius=0', 'lat=40.7&lng=-74&radius=-5',
+    'lat=40.7&lng=-74&radius=nan', 'lat=40.7&lng=-74&radius=far',
+])
+@pytest.mark.parametrize('path', ['/venues/nearby', '/shows/nearby'])
+def test_bad_point_is_a_400(client, path, query):
+    assert client.get('%s?%s' % (path, query)).status_code == 400
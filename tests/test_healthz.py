@@ -0,0 +1,43 @@
+import logging
+
+import config
+from models import db
+
+# /healthz/db: a SELECT 1 on the primary plus its pool usage, 503 when the
+# database cannot be reached.
+
+
+def test_healthy_database(client):
+    response = client.get('/healthz/db')
+    assert response.status_code == 200
+    status = response.get_json()
+    assert status['status'] == 'ok'
+    with client.application.app_context():
+        pool = db.engine.pool
+    assert status['pool'] == type(pool).__name__
+    for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+        assert (stat in status) == hasattr(pool, stat)
+    assert 'replicas' not in status
+
+
+def test_unreachable_database_is_a_503(app, client, monkeypatch, caplog):
+    def refuse(*args, **kwargs):
+        raise OSError('connection refused')
+    with app.app_context():
+        monkeypatch.setattr(db.engine, 'connect', refuse)
+    with caplog.at_level(logging.ERROR):
+        response = client.get('/healthz/db')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'error'
+    assert 'database health check failed: connection refused' in caplog.text
+
+
+def test_engine_options_share_the_pool_settings():
+    uri = 'postgresql://localhost/fyyur'
+    sync, asynchronous = config.engine_options(uri), config.async_engine_options(config.async_database_uri(uri))
+    assert sync.pop('connect_args') == {'options': '-c statement_timeout=%d' % config.DB_STATEMENT_TIMEOUT}
+    assert asynchronous.pop('connect_args') == {
+        'server_settings': {'statement_timeout': str(config.DB_STATEMENT_TIMEOUT)}
+    }
+    assert sync == asynchronous == config.pool_options(uri)
+    assert config.engine_options('sqlite:///fyyur.db') == config.async_engine_options('sqlite+aiosqlite:///fyyur.db') == {}
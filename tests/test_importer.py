@@ -0,0 +1,110 @@
+import io
+import json
+
+import pytest
+
+from models import db, Venue
+
+# Bulk imports report bad rows, unparsable ones included, and carry on.
+
+VENUE = {
+    'name': 'Imported Venue', 'city': 'Chicago', 'state': 'IL', 'address': '1 Import St',
+    'phone': '555-555-5555', 'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/imported',
+    'seeking_description': '',
+}
+
+
+def upload(client, body, filename, **form):
+    form['file'] = (io.BytesIO(body.encode('utf-8')), filename)
+    return client.post('/import/venues', data=form, content_type='multipart/form-data')
+
+
+def imported(app):
+    with app.app_context():
+        count = db.session.query(Venue).filter(Venue.name.like('Imported Venue%')).count()
+        db.session.remove()
+    return count
+
+
+def test_a_malformed_ndjson_line_fails_only_that_row(app, client, fresh_catalog):
+    lines = [json.dumps(dict(VENUE, name='Imported Venue %d' % number)) for number in range(1, 6)]
+    lines[1] = '{"name": "Imported Venue 2",'
+    lines[3] = '["not", "an", "object"]'
+    response = upload(client, '\n'.join(lines) + '\n', 'venues.ndjson', chunk_size='2')
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert (summary['imported'], summary['failed'], summary['committed']) == (3, 2, 5)
+    assert [error['row'] for error in summary['errors']] == [2, 4]
+    assert summary['errors'][1]['errors'] == {'row': ['Expected a JSON object.']}
+    assert imported(app) == 3
+
+
+def test_a_csv_row_with_extra_cells_fails_only_that_row(app, client, fresh_catalog):
+    columns = list(VENUE)
+    lines = [','.join(columns)]
+    for number in range(1, 4):
+        lines.append(','.join('"%s"' % dict(VENUE, name='Imported Venue %d' % number)[column] for column in columns))
+    lines[2] += ',surplus'
+    response = upload(client, '\n'.join(lines) + '\n', 'venues.csv')
+    summary = response.get_json()
+    assert (summary['imported'], summary['failed']) == (2, 1)
+    assert summary['errors'] == [{'row': 2, 'errors': {'row': ['More cells than header columns.']}}]
+    assert imported(app) == 2
+
+
+@pytest.mark.parametrize('chunk_size', ['0', '-5'])
+def test_chunk_size_must_be_positive(app, client, chunk_size):
+    response = upload(client, json.dumps(VENUE) + '\n', 'venues.ndjson', chunk_size=chunk_size)
+    assert response.status_code == 400
+    assert imported(app) == 0
+
+
+def csv_body(count):
+    columns = list(VENUE)
+    lines = [','.join(columns)]
+    for number in range(1, count + 1):
+        lines.append(','.join('"%s"' % dict(VENUE, name='Imported Venue %d' % number)[column] for column in columns))
+    return '\n'.join(lines) + '\n'
+
+
+def upload_bytes(client, body, filename, **form):
+    form['file'] = (io.BytesIO(body), filename)
+    return client.post('/import/venues', data=form, content_type='multipart/form-data')
+
+
+def test_a_non_utf8_upload_is_a_file_error(app, client, fresh_catalog):
+    body = csv_body(3).replace('Imported Venue 2', 'Imported Café 2').encode('latin-1')
+    response = upload_bytes(client, body, 'venues.csv')
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert (summary['imported'], summary['failed'], summary['committed']) == (0, 0, 0)
+    assert summary['errors'] == [{'errors': {'file': [
+        'The rest of the file is not valid UTF-8 text: invalid continuation byte.'
+    ]}}]
+    assert imported(app) == 0
+
+
+@pytest.mark.parametrize('format', ['csv', 'ndjson'])
+def test_rows_before_a_bad_byte_are_imported(app, client, fresh_catalog, format):
+    # Well past the decoder's read-ahead, so the first rows decode.
+    count = 200
+    if format == 'csv':
+        body = csv_body(count)
+    else:
+        body = ''.join(json.dumps(dict(VENUE, name='Imported Venue %d' % number)) + '\n' for number in range(1, count + 1))
+    body = body.encode('utf-8').replace(b'Imported Venue %d' % (count - 1), b'Imported Venue \xff')
+    response = upload_bytes(client, body, 'venues.' + format, chunk_size='50')
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert 0 < summary['imported'] < count - 1
+    assert summary['failed'] == 0
+    assert summary['committed'] == summary['imported']
+    assert summary['errors'] == [{'errors': {'file': [
+        'The rest of the file is not valid UTF-8 text: invalid start byte.'
+    ]}}]
+    assert imported(app) == summary['imported']
+
+    # Resuming past the bad byte still reports it.
+    resumed = upload_bytes(client, body, 'venues.' + format, skip=str(count)).get_json()
+    assert (resumed['imported'], resumed['committed']) == (0, count)
+    assert resumed['errors'] == summary['errors']
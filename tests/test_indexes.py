@@ -0,0 +1,99 @@
+import re
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+# The views that read shows must reach them through an index. The plans
+# are taken with the statistics of a 1M-show catalog, so SQLite picks
+# what it would pick on a large table rather than on the seeded few
+# hundred rows.
+
+PRODUCTION_SHOWS = 1000000
+
+# A full pass over the table; "SCAN shows USING INDEX" walks an index in
+# order and stops at the LIMIT.
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?shows\b(?! USING)')
+
+
+@pytest.fixture
+def production_stats(app):
+    # sqlite_stat1 scaled up to PRODUCTION_SHOWS rows. Every connection
+    # reads it when it opens; emptied afterwards.
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            connection.execute('ANALYZE')
+            for index, stat in connection.execute("SELECT idx, stat FROM sqlite_stat1 WHERE tbl = 'shows'").fetchall():
+                rows, *averages = [int(value) for value in stat.split()]
+                factor = PRODUCTION_SHOWS / float(rows)
+                scaled = [PRODUCTION_SHOWS] + [value if value == 1 else round(value * factor) for value in averages]
+                connection.execute(
+                    "UPDATE sqlite_stat1 SET stat = ? WHERE tbl = 'shows' AND idx IS ?",
+                    (' '.join(str(value) for value in scaled), index)
+                )
+            connection.commit()
+        finally:
+            connection.close()
+    yield
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            connection.execute('DELETE FROM sqlite_stat1')
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def show_plans(app, client, method, path, data=None):
+    # The query plan of every statement the view runs against shows.
+    executed = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = client.open(path, method=method, data=data)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    plans = []
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            for statement, parameters in executed:
+                if re.search(r'\bshows\b', statement):
+                    plans.append([row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)])
+        finally:
+            connection.close()
+    return plans
+
+
+@pytest.mark.parametrize('method, path, data, index', [
+    ('GET', '/venues/1', None, 'ix_shows_venue_id_start_time'),
+    ('GET', '/venues/1/past_shows?offset=20', None, 'ix_shows_venue_id_start_time'),
+    ('GET', '/artists/1', None, 'ix_shows_artist_id_start_time'),
+    ('GET', '/artists/1/past_shows?offset=20', None, 'ix_shows_artist_id_start_time'),
+    ('GET', '/shows', None, 'ix_shows_start_time_id'),
+    ('GET', '/venues/1/availability', None, 'ix_shows_venue_id_start_time'),
+])
+def test_show_queries_use_their_index(app, client, production_stats, method, path, data, index):
+    plans = show_plans(app, client, method, path, data)
+    assert plans
+    for plan in plans:
+        assert not any(FULL_SCAN.search(line) for line in plan), plan
+        assert any(index in line for line in plan), plan
+
+
+@pytest.mark.parametrize('method, path, data', [
+    ('GET', '/venues', None),
+    ('POST', '/venues/search', {'search_term': 'a'}),
+    ('POST', '/artists/search', {'search_term': 'a'}),
+])
+def test_upcoming_counts_do_not_scan_shows(app, client, production_stats, method, path, data):
+    # These read the materialized counters, not shows.
+    for plan in show_plans(app, client, method, path, data):
+        assert not any(FULL_SCAN.search(line) for line in plan), plan
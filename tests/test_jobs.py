@@ -0,0 +1,93 @@
+import socket
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from jobs import jobs, link_status
+from models import db, now_utc, Job
+
+# The job queue's claim and the link checker's outbound requests.
+
+
+def add_job(status, attempts, started_at=None):
+    now = now_utc()
+    job = Job(name='check_links', payload='{}', status=status, attempts=attempts, max_attempts=3,
+              run_at=now, created_at=now, started_at=started_at)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_claim_fails_stale_jobs_on_their_last_attempt(app):
+    with app.app_context():
+        stale = now_utc() - timedelta(seconds=jobs.timeout + 60)
+        exhausted = add_job('running', 3, stale)
+        retried = add_job('running', 2, stale)
+        try:
+            assert jobs.claim(10) == [retried]
+            rows = dict(db.session.query(Job.id, Job.status).filter(Job.id.in_([exhausted, retried])))
+            assert rows == {exhausted: 'failed', retried: 'running'}
+            assert db.session.get(Job, exhausted).finished_at is not None
+        finally:
+            Job.query.delete()
+            db.session.commit()
+            db.session.remove()
+
+
+class Recorder(BaseHTTPRequestHandler):
+    hosts = []
+
+    def do_HEAD(self):
+        self.hosts.append(self.headers['Host'])
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(('127.0.0.1', 0), Recorder)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_link_status_connects_to_the_checked_address(monkeypatch, server):
+    # The host resolves to a public address once; the request goes to that
+    # address even though resolving again would answer something else.
+    lookups = []
+    connected = []
+    create_connection, resolve = socket.create_connection, socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host == '127.0.0.1':
+            return resolve(host, port, *args, **kwargs)
+        lookups.append(host)
+        if len(lookups) > 1:
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', server))]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', server))]
+
+    def connect(address, *args, **kwargs):
+        connected.append(address)
+        return create_connection(('127.0.0.1', address[1]), *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(socket, 'create_connection', connect)
+    del Recorder.hosts[:]
+    assert link_status('http://example.com:%d/page?x=1' % server, 5) == 204
+    assert lookups == ['example.com']
+    assert connected == [('93.184.216.34', server)]
+    assert Recorder.hosts == ['example.com:%d' % server]
+
+
+def test_link_status_skips_internal_addresses(monkeypatch):
+    monkeypatch.setattr(socket, 'getaddrinfo', lambda *args, **kwargs: [
+        (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 80)),
+    ])
+    assert link_status('http://example.com/', 5) is None
@@ -0,0 +1,60 @@
+import base64
+import json
+import re
+
+import pytest
+
+from models import db, Artist
+from queries import ARTIST_KEYS, SHOW_KEYS, LISTING_PAGE_SIZE, decode_cursor, encode_cursor
+
+# The listings page by ?after= cursors over their sort keys.
+
+
+def cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def add_artists(app, names):
+    with app.app_context():
+        first = db.session.query(db.func.max(Artist.id)).scalar() + 1
+        db.session.execute(Artist.__table__.insert(), [{
+            'id': id, 'name': name, 'seeking_venue': False, 'version': 1,
+        } for id, name in enumerate(names, first)])
+        db.session.commit()
+        db.session.remove()
+
+
+def test_every_artist_is_on_exactly_one_page(app, client, fresh_catalog):
+    # Ties on name, empty names included, are broken by id.
+    add_artists(app, ['', 'Same Name'] * LISTING_PAGE_SIZE)
+    seen = []
+    path = '/artists'
+    while path:
+        html = client.get(path).get_data(as_text=True)
+        seen.extend(int(id) for id in re.findall(r'href="/artists/(\d+)"', html))
+        found = re.search(r'href="(/artists\?after=[^"]+)"', html)
+        path = found.group(1).replace('&amp;', '&') if found else None
+    with app.app_context():
+        assert sorted(seen) == sorted(id for id, in db.session.query(Artist.id))
+        db.session.remove()
+
+
+def test_cursor_round_trip():
+    from datetime import datetime
+    start = datetime(2030, 1, 1, 20, 30)
+    assert decode_cursor(encode_cursor(start, 7), SHOW_KEYS) == [start, 7]
+
+
+@pytest.mark.parametrize('after', [
+    'not base64!', cursor({'name': 'a'}), cursor(['a']), cursor([1, 2]), cursor(['a', 'b']),
+    cursor([None, 1]), cursor([['a'], 1]), cursor(['a', True]),
+])
+def test_bad_artist_cursors(after):
+    with pytest.raises(ValueError):
+        decode_cursor(after, ARTIST_KEYS)
+
+
+@pytest.mark.parametrize('path', ['/artists', '/shows', '/venues', '/api/v1/artists', '/api/v1/shows'])
+@pytest.mark.parametrize('after', [cursor([1, 2, 3][:1]), cursor([1, 'x', None]), cursor([[], {}])])
+def test_bad_cursors_are_a_bad_request(client, path, after):
+    assert client.get(path, query_string={'after': after}).status_code == 400
@@ -0,0 +1,94 @@
+import logging
+import re
+
+import pytest
+from flask import Flask, render_template_string
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import profiling
+from models import db, Venue
+from profiling import Profiler
+
+# With PROFILING_ENABLED a request gets a Server-Timing header, its route
+# is counted in /metrics, and one statement run more than
+# PROFILE_N_PLUS_ONE_THRESHOLD times is logged as a likely N+1. The test
+# app's profiling is off, so these run on a second app over its catalog.
+
+THRESHOLD = 3
+
+SERVER_TIMING = re.compile(r'^app;dur=\d+\.\d, sql;dur=\d+\.\d, tpl;dur=\d+\.\d$')
+
+
+@pytest.fixture
+def profiled(app):
+    profiled = Flask(__name__)
+    profiled.config.update(
+        SQLALCHEMY_DATABASE_URI=app.config['SQLALCHEMY_DATABASE_URI'], SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        PROFILING_ENABLED=True, PROFILE_N_PLUS_ONE_THRESHOLD=THRESHOLD, PROFILE_SLOW_REQUEST_MS=60000,
+    )
+    db.init_app(profiled)
+    profiler = Profiler(profiled)
+
+    @profiled.route('/names')
+    def names():
+        # One lookup per venue.
+        names = [db.session.query(Venue.name).filter(Venue.id == id).scalar() for id in range(1, THRESHOLD + 3)]
+        return render_template_string('{{ names|join(", ") }}', names=names)
+
+    @profiled.route('/names/at-once')
+    def names_at_once():
+        names = [name for name, in db.session.query(Venue.name).filter(Venue.id.in_(range(1, THRESHOLD + 3)))]
+        return render_template_string('{{ names|join(", ") }}', names=names)
+
+    yield profiled.test_client(), profiler
+    event.remove(Engine, 'before_cursor_execute', profiling._before_cursor_execute)
+    event.remove(Engine, 'after_cursor_execute', profiling._after_cursor_execute)
+
+
+def test_repeated_statements_are_logged_as_n_plus_one(profiled, caplog):
+    client, profiler = profiled
+    with caplog.at_level(logging.WARNING):
+        assert client.get('/names').status_code == 200
+    warnings = [record.getMessage() for record in caplog.records if 'N+1' in record.getMessage()]
+    assert len(warnings) == 1
+    assert warnings[0].startswith('possible N+1 in names: %d x SELECT "Venue".name' % (THRESHOLD + 2))
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        assert client.get('/names/at-once').status_code == 200
+    assert 'N+1' not in caplog.text
+
+
+def test_server_timing_header(profiled):
+    client, profiler = profiled
+    response = client.get('/names')
+    assert SERVER_TIMING.match(response.headers['Server-Timing'])
+    app_ms, sql_ms, template_ms = (float(part.split('=')[1]) for part in response.headers['Server-Timing'].split(', '))
+    assert app_ms >= sql_ms and app_ms >= template_ms
+
+
+def test_metrics_lines(app, client, profiled, monkeypatch):
+    profiled_client, profiler = profiled
+    for _ in range(2):
+        profiled_client.get('/names')
+    profiled_client.get('/names/at-once')
+    # The app's /metrics prepends the enabled profiler's lines to the job
+    # queue's.
+    monkeypatch.setattr('app.profiler', profiler)
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    for line in (
+        '# TYPE fyyur_request_duration_seconds histogram',
+        'fyyur_request_duration_seconds_bucket{endpoint="names",le="+Inf"} 2',
+        'fyyur_request_duration_seconds_count{endpoint="names"} 2',
+        'fyyur_request_duration_seconds_count{endpoint="names_at_once"} 1',
+        'fyyur_sql_statements_total{endpoint="names"} %d' % (2 * (THRESHOLD + 2)),
+        'fyyur_sql_statements_total{endpoint="names_at_once"} 1',
+        'fyyur_n_plus_one_total{endpoint="names"} 2',
+        'fyyur_n_plus_one_total{endpoint="names_at_once"} 0',
+    ):
+        assert line in lines
+    assert any(line.startswith('fyyur_slow_statement_seconds{endpoint="names') for line in lines)
+    assert any(line.startswith('fyyur_jobs') for line in lines)
@@ -0,0 +1,72 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Venue, Show
+
+# The listing pages, and deleting a venue, run a fixed number of
+# statements however many rows the catalog holds.
+
+
+def add_venues(app, count):
+    with app.app_context():
+        first = db.session.query(db.func.max(Venue.id)).scalar() + 1
+        db.session.execute(Venue.__table__.insert(), [{
+            'id': id, 'name': 'Extra Venue %d' % id, 'city': 'New York', 'state': 'NY',
+            'seeking_talent': False, 'version': 1,
+        } for id in range(first, first + count)])
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.mark.parametrize('path', ['/venues', '/venues?state=NY', '/venues?genre=Rock+n+Roll'])
+def test_venues_listing_is_one_statement(client, statements, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+def test_venues_listing_count_does_not_grow_with_venues(app, client, statements, fresh_catalog):
+    client.get('/venues')
+    before = len(statements)
+    add_venues(app, 500)
+    del statements[:]
+    response = client.get('/venues')
+    assert response.status_code == 200
+    assert b'Extra Venue' in response.data
+    assert len(statements) == before == 1
+
+
+def add_shows(app, venue_id, count, first_day):
+    # Upcoming shows a day apart, each artist in turn.
+    with app.app_context():
+        first = db.session.query(db.func.max(Show.id)).scalar() + 1
+        db.session.execute(Show.__table__.insert(), [{
+            'id': first + index, 'venue_id': venue_id, 'artist_id': index % 40 + 1,
+            'start_time': first_day + timedelta(days=index),
+            'end_time': first_day + timedelta(days=index, hours=2), 'version': 1,
+        } for index in range(count)])
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.mark.parametrize('soft', ['0', '1'])
+def test_venue_delete_count_does_not_grow_with_shows(app, client, statements, fresh_catalog, soft):
+    add_shows(app, 1, 1, datetime(2040, 1, 1, 20))
+    add_shows(app, 2, 500, datetime(2041, 1, 1, 20))
+    counts = []
+    for venue_id in (1, 2):
+        del statements[:]
+        response = client.delete('/venues/%d?soft=%s' % (venue_id, soft))
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+    # shows is only read by the per-artist count drop_owner() uncounts,
+    # and emptied by one set-based DELETE; no statement loads its rows.
+    touching = [statement for statement in statements if re.search(r'\bFROM shows\b', statement)]
+    assert touching
+    for statement in touching:
+        assert statement.startswith('DELETE FROM shows WHERE') or re.match(
+            r'SELECT shows\.artist_id, count\(shows\.id\) AS \w+ \nFROM shows .* GROUP BY shows\.artist_id$', statement, re.S
+        ), statement
@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import time
+
+from flask import g
+import pytest
+
+import routing
+from cache import cache, LRUBackend
+from conftest import VENUE_FORM
+from models import db, Venue
+from routing import read_from_primary, use_replica
+
+# Read-only views go to two SQLite copies of the test catalog, each with
+# its own name for venue 1, so a page shows which database answered.
+#
+# A write bumps page cache namespaces before the replicas have it. Until
+# they catch up, pages depending on a bumped namespace render from the
+# primary, so the cache never stores a stale page under the new version.
+
+REPLICA_NAMES = ('Replica Venue A', 'Replica Venue B')
+
+
+def copy_catalog(app, path, name):
+    source = sqlite3.connect(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):])
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+        target.execute('UPDATE "Venue" SET name = ? WHERE id = 1', (name,))
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+
+
+class Clock(object):
+    # routing's time module, moved on by hand.
+    def __init__(self):
+        self.offset = 0
+
+    def time(self):
+        return time.time() + self.offset
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(routing, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def replicas(app, tmp_path, clock):
+    # Two replica files; the second is only created by calling the
+    # fixture's value, so it starts out failing its health check.
+    paths = [str(tmp_path / 'a.db'), str(tmp_path / 'missing' / 'b.db')]
+    copy_catalog(app, paths[0], REPLICA_NAMES[0])
+
+    def start_second():
+        os.makedirs(os.path.dirname(paths[1]), exist_ok=True)
+        copy_catalog(app, paths[1], REPLICA_NAMES[1])
+    previous = app.config.get('SQLALCHEMY_REPLICA_URIS')
+    app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + path for path in paths]
+    db.init_replicas(app)
+    yield start_second
+    for engine in app.extensions['replicas'].engines:
+        engine.dispose()
+    app.config['SQLALCHEMY_REPLICA_URIS'] = previous
+    db.init_replicas(app)
+
+
+def answered_by(client):
+    body = client.get('/venues/1').get_data(as_text=True)
+    for name in REPLICA_NAMES:
+        if name in body:
+            return name
+    return 'primary'
+
+
+def test_read_only_views_alternate_between_replicas(app, client, replicas):
+    replicas()
+    assert [answered_by(client) for _ in range(4)] == list(REPLICA_NAMES) * 2
+
+
+def test_a_failed_replica_is_skipped_until_retried(app, client, replicas, clock):
+    assert [answered_by(client) for _ in range(3)] == [REPLICA_NAMES[0]] * 3
+    # Back up, but not retried within DB_REPLICA_RETRY_SECONDS.
+    replicas()
+    assert [answered_by(client) for _ in range(2)] == [REPLICA_NAMES[0]] * 2
+    clock.offset += app.config['DB_REPLICA_RETRY_SECONDS'] + 1
+    assert sorted(answered_by(client) for _ in range(2)) == list(REPLICA_NAMES)
+
+
+def test_a_commit_pins_its_user_to_the_primary(app, client, replicas, clock, fresh_catalog):
+    replicas()
+    assert client.post('/venues/1/edit', data=VENUE_FORM).status_code == 302
+    assert answered_by(client) == 'primary'
+    assert answered_by(client) == 'primary'
+    assert answered_by(app.test_client()) in REPLICA_NAMES
+    clock.offset += app.config['DB_REPLICA_PIN_SECONDS'] + 1
+    assert answered_by(client) in REPLICA_NAMES
+
+
+def test_read_from_primary_overrides_routing(app, replicas):
+    replicas()
+
+    def venue_name(primary):
+        with app.test_request_context('/venues/1'):
+            g.db_read_only = True
+            if primary:
+                read_from_primary()
+            try:
+                return db.session.query(Venue.name).filter(Venue.id == 1).scalar()
+            finally:
+                db.session.remove()
+    assert venue_name(primary=False) in REPLICA_NAMES
+    assert venue_name(primary=True) not in REPLICA_NAMES
+
+
+@pytest.fixture
+def lagging_replicas():
+    previous = cache.backend, cache.replica_lag
+    cache.backend, cache.replica_lag = LRUBackend(), 10
+    yield
+    cache.backend, cache.replica_lag = previous
+
+
+def reads_replica(app, lookup):
+    with app.test_request_context('/venues'):
+        g.db_read_only = True
+        lookup()
+        return use_replica()
+
+
+def test_pages_of_a_recent_bump_render_from_the_primary(app, lagging_replicas):
+    def lookup():
+        cache.lookup(['venues'])
+    assert reads_replica(app, lookup)
+    cache.invalidate('venues')
+    assert not reads_replica(app, lookup)
+    # The marker has expired: the replicas have caught up.
+    cache.backend._entries.clear()
+    assert reads_replica(app, lookup)
+
+
+def test_fragments_of_a_recent_bump_render_from_the_primary(app, lagging_replicas):
+    def lookup():
+        cache.fragments(['shows'], ['a'])
+    cache.invalidate('venues')
+    assert reads_replica(app, lookup)
+    cache.invalidate('shows')
+    assert not reads_replica(app, lookup)
+
+
+def test_no_replicas_no_markers(app):
+    previous = cache.backend
+    cache.backend = LRUBackend()
+    try:
+        cache.invalidate('venues')
+        assert list(cache.backend._entries) == []
+    finally:
+        cache.backend = previous
+
+
+def test_healthz_reports_the_replicas(app, client, replicas, clock):
+    # Two reads check both replicas.
+    answered_by(client)
+    answered_by(client)
+    replicas_status = client.get('/healthz/db').get_json()['replicas']
+    assert [replica['up'] for replica in replicas_status] == [True, False]
+    assert replicas_status[1]['url'].endswith('/missing/b.db')
+    replicas()
+    clock.offset += app.config['DB_REPLICA_RETRY_SECONDS'] + 1
+    assert [replica['up'] for replica in client.get('/healthz/db').get_json()['replicas']] == [True, True]
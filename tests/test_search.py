@@ -0,0 +1,40 @@
+import pytest
+
+from models import db, Venue, Artist
+from queries import search, like_pattern
+
+
+def test_like_pattern_escapes_wildcards():
+    assert like_pattern('50%_off\\') == '%50\\%\\_off\\\\%'
+
+
+def test_wildcards_in_the_term_match_literally(app):
+    with app.app_context():
+        assert search(Venue, '_')['count'] == 0
+        assert search(Venue, '%')['count'] == 0
+
+
+def test_term_with_wildcards_finds_its_row(app, fresh_catalog):
+    with app.app_context():
+        venue = db.session.get(Venue, 1)
+        venue.name = '100% Jazz_Club'
+        db.session.commit()
+        result = search(Venue, '100% jazz_')
+        assert [row['id'] for row in result['data']] == [1]
+        db.session.remove()
+
+
+@pytest.mark.parametrize('model', [Venue, Artist])
+@pytest.mark.parametrize('term', ['jazz', 'new', 'ro', 'zzzz'])
+def test_search_matches_name_city_or_genre(app, model, term):
+    # The UNION of the three arms finds what a scan over every row would.
+    with app.app_context():
+        expected = set()
+        for owner in model.query.options(db.selectinload(model.genres)).filter(model.deleted_at.is_(None)):
+            values = [owner.name, owner.city] + [genre.name for genre in owner.genres]
+            if any(term in (value or '').lower() for value in values):
+                expected.add(owner.id)
+        result = search(model, term, per_page=1000)
+        assert result['count'] == len(expected)
+        assert set(row['id'] for row in result['data']) == expected
+        db.session.remove()
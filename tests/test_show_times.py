@@ -0,0 +1,85 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, now_utc, Venue, Artist, Show
+
+# Show times a user types in: a bad one is the user's to fix, and one
+# naming a zone is read as that instant in UTC.
+
+
+@pytest.mark.parametrize('start_time, end_time, message', [
+    ('2040-01-01 20:00:00', '2040-01-01 19:00:00', b'a show must end after it starts'),
+    ('2040-01-01 20:00:00', 'not a time', b'Show could not be listed'),
+    ('not a time', '', b'Show could not be listed'),
+])
+def test_bad_show_times_are_a_400(client, start_time, end_time, message):
+    response = client.post('/shows/create', data={
+        'venue_id': '1', 'artist_id': '1', 'start_time': start_time, 'end_time': end_time,
+    })
+    assert response.status_code == 400
+    assert message in response.data
+
+
+def test_show_times_with_a_zone_are_stored_as_utc(client, fresh_catalog):
+    response = client.post('/shows/create', data={
+        'venue_id': '1', 'artist_id': '1', 'start_time': '2040-01-01T20:00:00+02:00', 'end_time': '2040-01-01T20:00:00Z',
+    })
+    assert response.status_code == 200
+    availability = client.get('/venues/1/availability?from=2040-01-01T17:00:00Z&to=2040-01-02T00:00:00Z').get_json()
+    assert availability['booked'][0]['start_time'] == '2040-01-01T18:00:00'
+    assert availability['booked'][0]['end_time'] == '2040-01-01T20:00:00'
+    assert availability['from'] == '2040-01-01T17:00:00'
+
+
+@pytest.mark.parametrize('query', [
+    'from=2040-01-01T00:00:00Z&to=2040-01-02',
+    'from=2040-01-01&to=2040-01-02T00:00:00%2B00:00',
+])
+def test_availability_accepts_zoned_windows(client, query):
+    assert client.get('/venues/1/availability?' + query).status_code == 200
+
+
+def test_availability_rejects_malformed_windows(client):
+    assert client.get('/venues/1/availability?from=yesterday').status_code == 400
+
+
+@pytest.fixture
+def far_zone(monkeypatch):
+    # Ten hours behind UTC, so local and UTC "now" disagree.
+    monkeypatch.setenv('TZ', 'Etc/GMT+10')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_now_is_utc_whatever_the_local_zone(app, client, fresh_catalog, far_zone):
+    assert abs(now_utc() - (datetime.now() + timedelta(hours=10))) < timedelta(minutes=1)
+    started = now_utc().replace(microsecond=0) - timedelta(hours=1)
+    with app.app_context():
+        venue_id = db.session.query(db.func.max(Venue.id)).scalar() + 1
+        artist_id = db.session.query(db.func.max(Artist.id)).scalar() + 1
+        db.session.execute(Venue.__table__.insert(), [{
+            'id': venue_id, 'name': 'Zone Venue', 'city': 'Honolulu', 'state': 'HI',
+            'address': '1 Zone St', 'seeking_talent': False, 'version': 1,
+        }])
+        db.session.execute(Artist.__table__.insert(), [{
+            'id': artist_id, 'name': 'Zone Artist', 'seeking_venue': False, 'version': 1,
+        }])
+        db.session.execute(Show.__table__.insert(), [{
+            'start_time': started, 'end_time': started + timedelta(hours=2),
+            'venue_id': venue_id, 'artist_id': artist_id, 'version': 1,
+        }])
+        db.session.commit()
+        db.session.remove()
+
+    # Started an hour ago in UTC, nine hours ahead in local time: past.
+    for path in ('/venues/%d' % venue_id, '/artists/%d' % artist_id):
+        upcoming, past = client.get(path).get_data(as_text=True).split('Upcoming Show')[1].split('Past Show')
+        assert 'tile-show' not in upcoming
+        assert 'tile-show' in past
+
+    availability = client.get('/venues/%d/availability' % venue_id).get_json()
+    assert abs(datetime.fromisoformat(availability['from']) - now_utc()) < timedelta(minutes=1)
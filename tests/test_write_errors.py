@@ -0,0 +1,34 @@
+import logging
+
+import pytest
+
+from conftest import ARTIST_FORM, VENUE_FORM
+from jobs import jobs
+
+# A write failing for a reason that is not the user's answers 500 and
+# logs the error with its traceback.
+
+SHOW_FORM = {'venue_id': '1', 'artist_id': '1', 'start_time': '2041-01-01 20:00:00'}
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError('write failed')
+
+
+@pytest.mark.parametrize('method, path, form, target, message', [
+    ('POST', '/venues/create', VENUE_FORM, (jobs, 'enqueue'), "could not create venue 'Renamed Venue'"),
+    ('POST', '/artists/create', ARTIST_FORM, (jobs, 'enqueue'), "could not create artist 'Renamed Artist'"),
+    ('POST', '/venues/1/edit', VENUE_FORM, (jobs, 'enqueue'), 'could not edit venue 1'),
+    ('POST', '/artists/1/edit', ARTIST_FORM, (jobs, 'enqueue'), 'could not edit artist 1'),
+    ('POST', '/shows/create', SHOW_FORM, ('app.record_shows',), 'could not create show'),
+    ('DELETE', '/venues/1', None, ('app.delete_listing',), 'could not delete venue 1'),
+    ('DELETE', '/artists/1', None, ('app.delete_listing',), 'could not delete artist 1'),
+])
+def test_failed_writes_are_logged(client, fresh_catalog, monkeypatch, caplog, method, path, form, target, message):
+    monkeypatch.setattr(*(target + (fail,)))
+    with caplog.at_level(logging.ERROR):
+        response = client.open(path, method=method, data=form)
+    assert response.status_code == 500
+    records = [record for record in caplog.records if record.getMessage() == message]
+    assert len(records) == 1
+    assert records[0].exc_info[0] is RuntimeError
@@ -0,0 +1,150 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from cache import cache
+from models import db, Venue, Artist, Show, Genre, naive_utc, now_utc
+
+#----------------------------------------------------------------------------#
+# Show calendar.
+#
+# Counts live shows per day, week (from Monday) or month over a window,
+# grouped in SQL: date_trunc on Postgres, date() modifiers on SQLite. The
+# window is widened to whole buckets, so every bucket's count can be
+# cached on its own under the 'shows' namespace version. An overlapping
+# or adjacent window then only queries the span of buckets it has not
+# seen, in one statement.
+#----------------------------------------------------------------------------#
+
+BUCKETS = ('day', 'week', 'month')
+
+# Window when ?to= is not given.
+DEFAULT_SPANS = {'day': timedelta(days=31), 'week': timedelta(weeks=13), 'month': timedelta(days=365)}
+
+# The shortest length of each bucket.
+MIN_LENGTHS = {'day': timedelta(days=1), 'week': timedelta(weeks=1), 'month': timedelta(days=28)}
+
+
+def floor(value, bucket):
+    # The start of the bucket holding value.
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'week':
+        return value - timedelta(days=value.weekday())
+    if bucket == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def following(start, bucket):
+    # The start of the bucket after the one starting at start.
+    if bucket == 'week':
+        return start + timedelta(weeks=1)
+    if bucket == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=1)
+
+
+def bucket_starts(start, end, bucket):
+    # Every bucket overlapping [start, end).
+    starts = []
+    current = floor(start, bucket)
+    while current < end:
+        starts.append(current)
+        current = following(current, bucket)
+    return starts
+
+
+def _literal(text):
+    # Inlined rather than bound, so the GROUP BY repeats the select
+    # expression exactly.
+    return db.literal_column("'%s'" % text)
+
+
+def bucket_column(bucket):
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.date_trunc(_literal(bucket), Show.start_time)
+    if bucket == 'week':
+        # The next Sunday (or the day itself), back to its Monday.
+        return db.func.date(Show.start_time, _literal('weekday 0'), _literal('-6 days'))
+    if bucket == 'month':
+        return db.func.date(Show.start_time, _literal('start of month'))
+    return db.func.date(Show.start_time)
+
+
+def counts_query(bucket, start, end, city=None, state=None, genre=None, venue_id=None):
+    # (bucket start, count) for the live shows starting in [start, end),
+    # empty buckets left out.
+    column = bucket_column(bucket)
+    query = db.session.query(column, db.func.count(Show.id)).select_from(Show).join(
+        Venue, Venue.id == Show.venue_id
+    ).join(
+        Artist, Artist.id == Show.artist_id
+    ).filter(
+        Venue.deleted_at.is_(None), Artist.deleted_at.is_(None),
+        Show.start_time >= start, Show.start_time < end
+    )
+    if city:
+        query = query.filter(Venue.city == city)
+    if state:
+        query = query.filter(Venue.state == state)
+    if venue_id:
+        query = query.filter(Show.venue_id == venue_id)
+    if genre:
+        query = query.filter(db.or_(Venue.genres.any(Genre.name == genre), Artist.genres.any(Genre.name == genre)))
+    return query.group_by(column)
+
+
+def _bucket_value(value):
+    # SQLite hands back 'YYYY-MM-DD' text, Postgres a timestamp.
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def shows_calendar(bucket, start, end, city=None, state=None, genre=None, venue_id=None):
+    # [(bucket start, bucket end, count)] for the buckets overlapping
+    # [start, end), read from the cache where possible.
+    starts = bucket_starts(start, end, bucket)
+    # Hashed, so a ':' or '=' in a value cannot make two filters share a key.
+    filters = hashlib.sha1(repr((city, state, genre, venue_id)).encode('utf-8')).hexdigest()
+    keys = ['calendar:%s:%s:%s' % (bucket, bucket_start.isoformat(), filters) for bucket_start in starts]
+    prefix, cached = cache.fragments(['shows'], keys)
+    counts = dict((bucket_start, int(value)) for bucket_start, value in zip(starts, cached) if value is not None)
+    missing = [bucket_start for bucket_start in starts if bucket_start not in counts]
+    if missing:
+        rows = counts_query(
+            bucket, missing[0], following(missing[-1], bucket), city, state, genre, venue_id
+        ).all()
+        found = dict((_bucket_value(value), count) for value, count in rows)
+        fresh = {}
+        for key, bucket_start in zip(keys, starts):
+            if bucket_start not in counts:
+                counts[bucket_start] = found.get(bucket_start, 0)
+                fresh[key] = str(counts[bucket_start])
+        cache.store_fragments(prefix, fresh)
+    return [(bucket_start, following(bucket_start, bucket), counts[bucket_start]) for bucket_start in starts]
+
+
+def calendar_args(args, max_buckets):
+    # Parses ?bucket=, ?from=, ?to=, ?city=, ?state=, ?genre= and ?venue=
+    # into shows_calendar() arguments, times as naive UTC. Raises
+    # ValueError with the reason.
+    bucket = args.get('bucket') or 'day'
+    if bucket not in BUCKETS:
+        raise ValueError('bucket must be one of %s' % ', '.join(BUCKETS))
+    try:
+        start = floor(naive_utc(datetime.fromisoformat(args['from'])) if args.get('from') else now_utc(), bucket)
+        end = naive_utc(datetime.fromisoformat(args['to'])) if args.get('to') else start + DEFAULT_SPANS[bucket]
+    except ValueError:
+        raise ValueError('from and to must be ISO dates')
+    if end <= start:
+        raise ValueError('to must be after from')
+    # The cheap bound first, so a far ?to= is refused without counting.
+    if end - start > MIN_LENGTHS[bucket] * (max_buckets + 1) or len(bucket_starts(start, end, bucket)) > max_buckets:
+        raise ValueError('at most %d buckets per request' % max_buckets)
+    venue_id = args.get('venue')
+    if venue_id:
+        if not venue_id.isdigit():
+            raise ValueError('venue must be a venue id')
+        venue_id = int(venue_id)
+    return {
+        'bucket': bucket, 'start': start, 'end': end, 'venue_id': venue_id or None,
+        'city': args.get('city') or None, 'state': args.get('state') or None, 'genre': args.get('genre') or None,
+    }